@@ -1,9 +1,17 @@
 import logging
+import os
 import shutil
 from abc import ABCMeta, abstractmethod
+from functools import lru_cache
+from importlib import import_module
 from pathlib import Path
-from tempfile import mkdtemp
 
+from anypath import instrumentation
+from anypath import integrity
+from anypath import persistence
+from anypath import scratch as scratch_spaces
+from anypath.fetched import FetchedPath
+from anypath.dependencies import NotInstalledError
 from anypath.dependencies import check_executable
 from anypath.dependencies import do_import
 
@@ -18,21 +26,53 @@ class BasePath(metaclass=ABCMeta):
     :param path: The remote path to be fetched
     :param persist_dir: If specified, the directory to which the remote resource(s) should be copied to. It is used for
     further Path manipulations instead of the default temp directory.
+    :param cache: The FetchCache from which the resource is served if a fresh copy is cached, path_provider.cache is
+    used if it is None. False disables caching for this fetch.
+    :param checksum: The expected checksum of the fetched file as 'algorithm:hexdigest' or a manifest of checksums per
+    relative path for fetched directories, the fetch fails with a ChecksumMismatch if it does not match
+    :param scratch: The ScratchSpace in which the temporary directory is created, path_provider.scratch is used if it is
+    None and the system temp dir if that is None as well
     :param options: Additional options for the PathProviders if they require/allow them
     """
     # List of required modules to be importer per Pathrovider
     dependencies = []
     # List of executables that must be accessible for calling per PathProvider
     executables = []
+    # Whether fetch() does I/O that can run on a worker thread of a batch fetch
+    concurrent = True
 
-    def __init__(self, protocol: str, path: str, persist_dir: str = None, **options: dict):
+    def __init__(self, protocol: str, path: str, persist_dir: str = None, cache=None, checksum=None, scratch=None,
+                 **options: dict):
+        if options:
+            raise TypeError(f'Unexpected options for {self.__class__.__name__}: {", ".join(options)}')
         self.persist_dir = persist_dir
         self.protocol = protocol
         self.path = path
         # Temporary directory path
         self.td = None
+        self.scratch = scratch
+        # The ScratchSpace which created td, it deletes td on close
+        self.scratch_space = None
         # Path that will be used after the resources are fetched
         self.out_path = None
+        self.cache = cache
+        # Absolute paths of the required executables, resolved when the dependencies are checked
+        self.executable_paths = {}
+        # The uri and options the PathProvider was created with, they identify the resource in the cache
+        self.uri = protocol + str(path)
+        self.options = {}
+        # Validators (e.g. an ETag) of the cached copy before the fetch, of the fetched resource after it
+        self.validators = {}
+        # Set by PathProviders that revalidated a stale cached copy which did not change remotely
+        self.not_modified = False
+        self.cache_entry = None
+        self.verifier = integrity.Verifier(checksum) if checksum else None
+        # Set if the copy in persist_dir already matches the checksum, nothing is fetched then
+        self.verified = False
+        # Executor on which files are hashed on disk in parallel, e.g. the process pool of a FetchScheduler
+        self.executor = None
+        # The FetchRecord of the running fetch, None unless instrumentation hooks are registered
+        self.record = None
 
     @staticmethod
     def wrapped(func, *args, **kwargs):
@@ -42,28 +82,190 @@ class BasePath(metaclass=ABCMeta):
         - The temporary directory is created
         After the decorated method is called the following things happen:
         - The files are persisted if the persist_dir parameter is set
-        - The out_path is returned, which is either the temp dir or persist_dir
+        - The out_path is returned as a FetchedPath, which is either the temp dir or persist_dir
+        If instrumentation hooks are registered every step is measured, see anypath.instrumentation
         """
 
         def decorator(self):
+            record = self.record = instrumentation.start(self)
+            try:
+                modules = self._before_fetch()
+                if not self._restore():
+                    # TODO: Check ordering of dependencies vs. args
+                    with instrumentation.phase(record, 'fetch'):
+                        func(self, *modules)
+                    instrumentation.fetched(record, self)
+                    self._account()
+                    self._verify()
+                    self._store_cached()
+                out_path = self._after_fetch()
+            except BaseException as e:
+                instrumentation.error(record, e)
+                raise
+            instrumentation.end(record)
+            return out_path
+
+        return decorator
+
+    @staticmethod
+    def awrapped(func):
+        """The counterpart of wrapped for PathProviders which implement afetch natively as a coroutine.
+        The same steps are run before and after the decorated coroutine, as they block they are run in the default
+        executor of the event loop.
+        """
+
+        async def decorator(self):
+            import asyncio
+            loop = asyncio.get_running_loop()
+            record = self.record = instrumentation.start(self)
+            try:
+                modules = await loop.run_in_executor(None, self._before_fetch)
+                if not await loop.run_in_executor(None, self._restore):
+                    with instrumentation.phase(record, 'fetch'):
+                        await func(self, *modules)
+                    instrumentation.fetched(record, self)
+                    await loop.run_in_executor(None, self._account)
+                    await loop.run_in_executor(None, self._verify)
+                    await loop.run_in_executor(None, self._store_cached)
+                out_path = await loop.run_in_executor(None, self._after_fetch)
+            except BaseException as e:
+                instrumentation.error(record, e)
+                raise
+            instrumentation.end(record)
+            return out_path
+
+        return decorator
+
+    def _before_fetch(self):
+        with instrumentation.phase(self.record, 'dependencies'):
             modules = self._check_dependencies()
+        with instrumentation.phase(self.record, 'temp'):
             self._make_temp()
-            # TODO: Check ordering of dependencies vs. args
-            func(self, *modules)
+        return modules
+
+    def _after_fetch(self):
+        with instrumentation.phase(self.record, 'persist'):
             self._persist()
-            return self.out_path
+        return self._fetched()
 
-        return decorator
+    def _fetched(self):
+        """Returns the result of fetch, the out_path as a FetchedPath if it is local (a lazy RemotePath is not)"""
+        return FetchedPath(self.out_path) if isinstance(self.out_path, Path) else self.out_path
+
+    def _restore(self):
+        """Returns True if the resource does not need to be fetched, as it is persisted or cached already"""
+        return self._restore_verified() or self._restore_cached()
+
+    def _restore_verified(self):
+        """Skips the fetch if the copy in persist_dir already matches the checksum
+        :return: True if the resource does not need to be fetched
+        """
+        if self.verifier is None or not self.persist_dir or not Path(self.persist_dir).exists():
+            return False
+        with instrumentation.phase(self.record, 'verify'):
+            self.verified = self.verifier.matches(Path(self.persist_dir))
+        if self.verified:
+            LOG.debug('%s already matches the checksum', self.persist_dir)
+        return self.verified
+
+    def _verify(self):
+        if self.verifier is None or self.not_modified:
+            return
+        with instrumentation.phase(self.record, 'verify'):
+            self.verifier.verify(self.out_path, executor=self.executor)
+
+    def _hasher(self, name: str = ''):
+        """Returns a hash object for a file which is about to be written, None if its checksum is not verified.
+        PathProviders update it with every written chunk and pass it to _hashed, so the file is not read again.
+        :param name: The path of the file relative to out_path, '' if out_path is the file
+        """
+        return None if self.verifier is None else self.verifier.hasher(name)
+
+    def _hashed(self, name: str, hasher):
+        if hasher is not None:
+            self.verifier.hashed(name, hasher)
+
+    @property
+    def digests(self):
+        """The digests of all verified files after the fetch as 'algorithm:hexdigest' by relative path"""
+        return {} if self.verifier is None else dict(self.verifier.digests)
+
+    def _get_cache(self):
+        """Returns the FetchCache to be used, only resources fetched to a temporary directory are cached"""
+        cache = path_provider.cache if self.cache is None else self.cache
+        if cache is False or self.td is None:
+            return None
+        return cache
+
+    def _restore_cached(self):
+        """Restores out_path from the cache if it holds a fresh copy of the resource.
+        If the cached copy is stale its validators are set, so that the PathProvider can revalidate it.
+        :return: True if out_path was restored and the resource does not need to be fetched
+        """
+        cache = self._get_cache()
+        if cache is None:
+            return False
+        with instrumentation.phase(self.record, 'cache'):
+            self.cache_entry = cache.get(self.uri, self.options, self.__class__)
+            if self.cache_entry is None:
+                return False
+            if self.cache_entry.fresh:
+                restored = cache.restore(self.cache_entry, self.out_path) and self._verify_restored()
+                if restored and self.record is not None:
+                    self.record.cached = True
+                return restored
+            self.validators = dict(self.cache_entry.validators)
+            return False
+
+    def _verify_restored(self):
+        """Checks a copy restored from the cache against the checksum, a copy which does not match is discarded and
+        fetched again. Extracted archives are skipped, their checksum is the one of the archive which is not cached.
+        :return: True if the restored copy can be used
+        """
+        if self.verifier is None or getattr(self, 'extract', False):
+            return True
+        with instrumentation.phase(self.record, 'verify'):
+            if self.verifier.matches(self.out_path):
+                return True
+        LOG.warning('Cached copy of %s does not match the checksum, fetching it again', self.uri)
+        if self.out_path.is_dir():
+            shutil.rmtree(self.out_path)
+        else:
+            self.out_path.unlink()
+        return False
+
+    def _store_cached(self):
+        cache = self._get_cache()
+        if cache is None:
+            return
+        with instrumentation.phase(self.record, 'cache'):
+            self._store(cache)
+
+    def _store(self, cache):
+        if self.not_modified and self.cache_entry is not None:
+            if not cache.restore(self.cache_entry, self.out_path, revalidated=True):
+                raise FileNotFoundError(f'Cache entry for {self.uri} was evicted during revalidation')
+        else:
+            cache.store(self.uri, self.options, self.__class__, self.out_path, self.validators)
+
+    def _count(self, transferred: int, written: int = None):
+        """Reports bytes received from the remote and written to disk to the instrumentation of the running fetch"""
+        if self.record is not None:
+            self.record.count(transferred, written)
 
     def _check_dependencies(self):
         LOG.debug('Checking for dependencies of PathProvider %s', self.__class__)
         # Import all declared dependencies
         modules = [do_import(dependency) for dependency in self.dependencies]
-        # Check required executables
+        # Check required executables and remember where they were found
         for executable in self.executables:
-            check_executable(executable)
+            self.executable_paths[executable] = check_executable(executable)
         return modules
 
+    def _executable(self, executable):
+        """Returns the absolute path of a required executable once the dependencies were checked"""
+        return self.executable_paths.get(executable, executable)
+
     @abstractmethod
     def fetch(self, *dependencies):
         """Must be implemented by all PathProviders, this method is called on __enter__
@@ -71,30 +273,74 @@ class BasePath(metaclass=ABCMeta):
         """
         pass
 
+    async def afetch(self):
+        """The asynchronous variant of fetch, it is called on __aenter__.
+        PathProviders can implement it natively using the method decorator @BasePath.awrapped, otherwise fetch is run
+        in the default executor of the event loop.
+        """
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, self.fetch)
+
     def _make_temp(self):
         LOG.debug('Creating temporary directory')
-        self.td = mkdtemp()
+        self.scratch_space = self.scratch or path_provider.scratch or scratch_spaces.default()
+        self.td = self.scratch_space.create(self._temp_root())
         self.out_path = Path(self.td).joinpath('out')
         LOG.debug('Out path is set to %s', self.out_path)
 
+    def _temp_root(self):
+        """Returns the directory for the temporary directory, None for the default location.
+        If persist_dir is set the temporary directory is created next to it, so that the fetched files are on the same
+        filesystem and can be moved to persist_dir instead of being copied.
+        """
+        if not self.persist_dir:
+            return None
+        parent = Path(self.persist_dir).resolve().parent
+        try:
+            parent.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            return None
+        return str(parent) if os.access(parent, os.W_OK) else None
+
+    def _account(self):
+        """Accounts the fetched files to the quota of the ScratchSpace, before they are persisted"""
+        if self.td is not None and self.scratch_space is not None and self.scratch_space.quota is not None:
+            self.scratch_space.measure(self.td)
+
+    @property
+    def disk_usage(self):
+        """The bytes in the temporary directory of the fetch, 0 if there is none (anymore)"""
+        if self.td is None or not os.path.isdir(self.td):
+            return 0
+        return instrumentation.disk_usage(self.td)
+
     def _persist(self):
-        """If persist_dir is set all files from the temporary directory are copied to it.
-        The out_path will be set to persist_dir if it is set.
+        """If persist_dir is set all files from the temporary directory are moved or copied to it.
+        Files in the temporary directory are moved (or hardlinked), files which are not owned by the PathProvider,
+        e.g. of a LocalPath, are copied. The out_path will be set to persist_dir if it is set.
         """
         if not self.persist_dir:
             return self
+        if self.verified:
+            self.out_path = Path(self.persist_dir).resolve()
+            return
         LOG.debug('Persisting files to %s', self.persist_dir)
-        try:
-            shutil.copytree(str(self.out_path.resolve()), self.persist_dir)
-        except NotADirectoryError:
-            shutil.copy(str(self.out_path.resolve()), self.persist_dir)
+        strategies = persistence.STRATEGIES if self.td is not None else persistence.COPY_STRATEGIES
+        persistence.persist(self.out_path.resolve(), Path(self.persist_dir), strategies)
         self.out_path = Path(self.persist_dir).resolve()
 
+    @classmethod
+    def shutdown(cls):
+        """Releases resources which are shared between all instances of the PathProvider, e.g. connection pools.
+        Called via path_provider.shutdown(), PathProviders without shared resources do not need to override it.
+        """
+        pass
+
     def close(self):
-        try:
-            shutil.rmtree(self.td)
-        except PermissionError as e:
-            LOG.debug('Could not delete temporary files %s', e.strerror)
+        if self.td is None or self.scratch_space is None:
+            return
+        self.scratch_space.release(self.td)
+        self.scratch_space = None
 
     def __enter__(self):
         return self.fetch()
@@ -106,6 +352,13 @@ class BasePath(metaclass=ABCMeta):
         else:
             return True
 
+    async def __aenter__(self):
+        return await self.afetch()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        import asyncio
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
 
 # noinspection PyMissingConstructor
 class AnyPath(BasePath):
@@ -119,19 +372,16 @@ class AnyPath(BasePath):
     """
 
     def __new__(cls, path: str, persist_dir: str = None, **options: dict):
-        for protocol, provider in path_provider.registry.items():
-            if path.startswith(protocol):
-                LOG.debug('Protocol is %s', protocol)
-                path = path.replace(protocol, '', 1)
-                # Get the appropriate PathProvider from the provider-registry and instantiate it
-                fetcher = path_provider.registry[protocol]
-                LOG.debug('Using PathProvider %s', fetcher)
-                fetcher = fetcher(protocol, path, persist_dir, **options)
-                fetcher.dependencies = provider.dependencies
-                fetcher.executables = provider.executables
-                return fetcher
-        else:
-            raise UnknownProtocol(f'Unknown protocol in {path} - Registered providers: {path_provider.registry}')
+        protocol, provider = path_provider.resolve(path)
+        LOG.debug('Protocol is %s', protocol)
+        path = path.replace(protocol, '', 1)
+        # Instantiate the appropriate PathProvider from the provider-registry
+        LOG.debug('Using PathProvider %s', provider)
+        fetcher = provider(protocol, path, persist_dir, **options)
+        fetcher.options = options
+        fetcher.dependencies = provider.dependencies
+        fetcher.executables = provider.executables
+        return fetcher
 
     # Init is not used, the signature is provided to help with autocomplete etc. in IDEs
     def __init__(self, path, persist_dir=None, **options):
@@ -140,6 +390,18 @@ class AnyPath(BasePath):
     def fetch(self):
         pass
 
+    @classmethod
+    def fetch_many(cls, uris, max_workers: int = 8, provider_limits: dict = None, host_limit: int = None):
+        """Fetches several remote resources concurrently, see anypath.batch.FetchBatch
+        Usage example: with AnyPath.fetch_many(['http://example.org', ('git://host/repo', {'branch': 'dev'})]) as paths
+        :param uris: The paths to be fetched, either as strings or as (path, options) tuples
+        :param max_workers: The maximum number of fetches that run at the same time
+        :param provider_limits: Maximum number of concurrent fetches per PathProvider, e.g. {GitPath: 2}
+        :param host_limit: Maximum number of concurrent fetches per host
+        """
+        from anypath.batch import FetchBatch
+        return FetchBatch(uris, max_workers, provider_limits, host_limit)
+
 
 def pattern(*patterns):
     """Decorator that registers a protocol on a PathProvider
@@ -154,20 +416,115 @@ def pattern(*patterns):
     return cls_decorator
 
 
+class _PrefixTrie:
+    """A trie of protocol-patterns which finds the longest pattern a path starts with, independent of the order in which
+    the patterns were inserted.
+    """
+
+    def __init__(self):
+        self.root = {}
+        # Length of the longest pattern, no characters of a path beyond it can influence a match
+        self.max_length = 0
+
+    def insert(self, prefix: str, value):
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        # The None key marks the end of a pattern, its value is the pattern and the value inserted for it
+        node[None] = (prefix, value)
+        self.max_length = max(self.max_length, len(prefix))
+
+    def longest_match(self, path: str):
+        """Returns (pattern, value) for the longest pattern path starts with or None if there is no such pattern"""
+        node = self.root
+        match = node.get(None)
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            match = node.get(None, match)
+        return match
+
+
 class _Provider:
     """Holds references to all registered providers and links there protocol-patterns to them.
     Additionally handles the dependencies of all registered providers
     """
 
+    # Entry point group in which packages declare their PathProviders, the name of an entry point is the pattern
+    ENTRY_POINTS = 'anypath.providers'
+
     def __init__(self):
         self.providers = set()
         self.registry = {}
+        self.trie = _PrefixTrie()
+        # Resolutions are cached by the part of the path that the trie can match
+        self._lookup = lru_cache(maxsize=1024)(self.trie.longest_match)
+        # The FetchCache used by all PathProviders which are not given a cache explicitly
+        self.cache = None
+        # The ScratchSpace used by all PathProviders which are not given one explicitly, None for the system temp dir
+        self.scratch = None
+        # Patterns whose PathProvider is registered by reference and not imported yet, e.g. 'http://': 'module:Class'
+        self.lazy = {}
+        self.discovered = False
 
     def add(self, *providers):
         for provider in providers:
             self.providers.add(provider)
             for patt in provider.patterns:
                 self.registry[patt] = provider
+                self.lazy.pop(patt, None)
+                self.trie.insert(patt, provider)
+        self._lookup.cache_clear()
+
+    def add_lazy(self, patt: str, reference: str):
+        """Registers a PathProvider for a pattern without importing it, it is imported the first time a path with the
+        pattern is resolved. Patterns of PathProviders which were added directly are not replaced.
+        :param patt: The protocol-pattern, e.g. 'http://'
+        :param reference: The PathProvider as 'module:Class', e.g. 'anypath.pathprovider.http:HttpPath'
+        """
+        if patt in self.registry:
+            return
+        self.lazy[patt] = reference
+        self.trie.insert(patt, reference)
+        self._lookup.cache_clear()
+
+    def discover(self):
+        """Lazily registers all PathProviders that installed packages declare in the entry point group
+        anypath.providers, e.g. 'http:// = anypath.pathprovider.http:HttpPath'
+        """
+        from importlib.metadata import entry_points
+        found = entry_points()
+        # entry_points() returns a dict of groups before Python 3.10
+        found = found.select(group=self.ENTRY_POINTS) if hasattr(found, 'select') else found.get(self.ENTRY_POINTS, [])
+        for entry_point in found:
+            LOG.debug('Discovered PathProvider %s for %s', entry_point.value, entry_point.name)
+            self.add_lazy(entry_point.name, entry_point.value)
+        self.discovered = True
+
+    def resolve(self, path):
+        """Returns the longest registered protocol-pattern which path starts with and the PathProvider registered for it
+        Installed PathProviders are discovered the first time a path does not match any registered pattern, lazily
+        registered PathProviders are imported the first time they are resolved.
+        :param path: The path to be resolved, e.g. 'http://example.org'
+        """
+        match = self._lookup(path[:self.trie.max_length])
+        if match is None and not self.discovered:
+            self.discover()
+            match = self._lookup(path[:self.trie.max_length])
+        if match is None:
+            raise UnknownProtocol(f'Unknown protocol in {path} - Registered providers: {self.registry}')
+        protocol, provider = match
+        if isinstance(provider, str):
+            provider = self._load(provider)
+        return protocol, provider
+
+    def _load(self, reference: str):
+        LOG.debug('Importing PathProvider %s', reference)
+        module, _, name = reference.partition(':')
+        provider = getattr(import_module(module), name)
+        self.add(provider)
+        return provider
 
     def check_requirements(self):
         LOG.debug('Checking requirements for registered PathProviders %s', self.providers)
@@ -175,6 +532,30 @@ class _Provider:
             [do_import(dependency) for dependency in provider.dependencies]
             [check_executable(executable) for executable in provider.executables]
 
+    def warm_up(self, max_workers: int = None):
+        """Checks the requirements of all registered PathProviders in parallel, e.g. once at startup.
+        The results are memoized, so later fetches do not have to check them again.
+        :param max_workers: The maximum number of threads for checking
+        :return: A dict of PathProvider to the NotInstalledError for its requirements, or None if all are met
+        """
+        def check(provider):
+            try:
+                [do_import(dependency) for dependency in provider.dependencies]
+                [check_executable(executable) for executable in provider.executables]
+            except NotInstalledError as e:
+                return e
+            return None
+
+        from concurrent.futures import ThreadPoolExecutor
+        providers = list(self.providers)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(providers, executor.map(check, providers)))
+
+    def shutdown(self):
+        LOG.debug('Shutting down registered PathProviders %s', self.providers)
+        for provider in self.providers:
+            provider.shutdown()
+
     def get_requirements(self):
         requirements = {'modules': [], 'executables': []}
         for provider in self.providers:
@@ -0,0 +1,153 @@
+import io
+import logging
+import os
+import shutil
+import tarfile
+import zipfile
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+
+from anypath.dependencies import do_import
+
+LOG = logging.getLogger('anypath.archive')
+
+ZIP_MAGIC = b'PK\x03\x04'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# Zip archives can only be read with their central directory at the end, smaller ones are spooled in memory
+ZIP_SPOOL_SIZE = 64 * 1024 * 1024
+
+
+class UnsafeArchiveError(Exception):
+    """Raised for archive members which would be extracted outside of the destination directory"""
+    pass
+
+
+class IteratorReader(io.RawIOBase):
+    """A read-only file object over an iterator of bytes chunks, e.g. the body of a streamed response
+    :param chunks: The iterator of chunks
+    :param on_read: Called with every chunk that is read, if it is set
+    """
+
+    def __init__(self, chunks, on_read=None):
+        super().__init__()
+        self.chunks = iter(chunks)
+        self.on_read = on_read
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.buffer:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.buffer = chunk
+            if self.on_read is not None:
+                self.on_read(chunk)
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+def extract(fileobj, dst: Path, buffer_size: int = 1024 * 1024):
+    """Extracts an archive from a file object which is read sequentially, so that the archive itself is never written
+    to disk. The format is detected by its first bytes: tar (optionally compressed with gzip, bzip2, xz or zstd) is
+    extracted while it is read, zip needs random access and is spooled first.
+    :param fileobj: The readable file object, it does not have to be seekable
+    :param dst: The directory to extract to, it is created if it does not exist
+    :param buffer_size: The number of bytes read from fileobj at once
+    :return: dst
+    """
+    dst = Path(dst)
+    dst.mkdir(parents=True, exist_ok=True)
+    stream = io.BufferedReader(fileobj, buffer_size=buffer_size) if isinstance(fileobj, io.RawIOBase) else fileobj
+    magic = stream.peek(4)[:4] if hasattr(stream, 'peek') else b''
+    if magic == ZIP_MAGIC:
+        _extract_zip(stream, dst)
+    elif magic == ZSTD_MAGIC:
+        zstandard = do_import('zstandard')
+        _extract_tar(zstandard.ZstdDecompressor().stream_reader(stream), dst)
+    else:
+        _extract_tar(stream, dst)
+    return dst
+
+
+def _extract_tar(stream, dst: Path):
+    root = os.path.realpath(dst)
+    resolved = {}
+    # The 'r|*' mode reads the archive as a stream, compressed with gzip, bzip2 or xz or not compressed at all
+    with tarfile.open(fileobj=stream, mode='r|*') as tar:
+        for member in tar:
+            if not (member.isfile() or member.isdir() or member.issym() or member.islnk()):
+                LOG.debug('Skipping special file %s', member.name)
+                continue
+            target = _safe_path(root, member.name, resolved)
+            if member.issym():
+                _safe_path(root, os.path.join(os.path.dirname(member.name), member.linkname), resolved)
+            elif member.islnk():
+                _safe_path(root, member.linkname, resolved)
+            if hasattr(tarfile, 'data_filter'):
+                # Also drops setuid bits, group and other write bits and the ownership in the archive
+                try:
+                    tar.extract(member, root, filter='data')
+                except tarfile.FilterError as e:
+                    raise UnsafeArchiveError(str(e)) from e
+            else:
+                _strip_attributes(member)
+                tar.extract(member, root)
+            if member.issym():
+                # Directories may resolve differently through the new symlink
+                resolved.clear()
+            LOG.debug('Extracted %s', target)
+
+
+def _strip_attributes(member: tarfile.TarInfo):
+    """Removes the attributes of a member which the 'data' filter of newer Python versions removes.
+    Special mode bits and group and other write bits are cleared, the owner always gets read and write access to files
+    and the ownership in the archive is ignored (tarfile only applies it when extracting as root on POSIX).
+    """
+    member.mode &= 0o755
+    if member.isfile() or member.islnk():
+        member.mode |= 0o600
+    if hasattr(os, 'geteuid'):
+        member.uid, member.gid, member.uname, member.gname = os.geteuid(), os.getegid(), '', ''
+
+
+def _extract_zip(stream, dst: Path):
+    root = os.path.realpath(dst)
+    resolved = {}
+    with SpooledTemporaryFile(max_size=ZIP_SPOOL_SIZE, dir=os.path.dirname(root)) as spool:
+        shutil.copyfileobj(stream, spool)
+        with zipfile.ZipFile(spool) as archive:
+            for info in archive.infolist():
+                target = _safe_path(root, info.filename, resolved)
+                if info.is_dir():
+                    os.makedirs(target, exist_ok=True)
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with archive.open(info) as src, open(target, 'wb') as f:
+                    shutil.copyfileobj(src, f)
+                LOG.debug('Extracted %s', target)
+
+
+def _safe_path(root: str, name: str, resolved: dict):
+    """Returns the path of an archive member inside root.
+    Symlinks which were extracted before are resolved, so that members can not escape through them either.
+    :param root: The real path of the directory the archive is extracted to
+    :param name: The name of the member
+    :param resolved: Real paths of the directories of previous members, it is filled by this function
+    :raises UnsafeArchiveError: If the member is absolute or would end up outside of root, e.g. via '..'
+    """
+    if os.path.isabs(name):
+        raise UnsafeArchiveError(f'Archive member {name} has an absolute path')
+    parent, base = os.path.split(os.path.join(root, name))
+    if parent not in resolved:
+        resolved[parent] = os.path.realpath(parent)
+    target = os.path.normpath(os.path.join(resolved[parent], base))
+    if os.path.islink(target):
+        target = os.path.realpath(target)
+    if target != root and not target.startswith(root + os.sep):
+        raise UnsafeArchiveError(f'Archive member {name} would be extracted outside of {root}')
+    return target
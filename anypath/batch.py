@@ -0,0 +1,102 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+
+from anypath.anypath import AnyPath
+from anypath.dependencies import NotInstalledError
+
+LOG = logging.getLogger('anypath.batch')
+
+
+class FetchBatch:
+    """Fetches several remote resources at once and cleans up all of them when it is closed.
+    PathProviders which do I/O (see BasePath.concurrent) are fetched in parallel on a bounded thread pool, all others
+    are fetched on the calling thread. It can be used as a context manager, just like a single AnyPath.
+    :param uris: The paths to be fetched, either as strings or as (path, options) tuples where options is a dict of
+    keyword arguments for AnyPath, e.g. ('sftp://jane@host:/home/jane', {'port': 2222, 'persist_dir': '/tmp/jane'})
+    :param max_workers: The maximum number of fetches that run at the same time
+    :param provider_limits: Maximum number of concurrent fetches per PathProvider, e.g. {GitPath: 2}
+    :param host_limit: Maximum number of concurrent fetches per host
+    """
+
+    def __init__(self, uris, max_workers: int = 8, provider_limits: dict = None, host_limit: int = None):
+        self.items = [(uri, {}) if isinstance(uri, str) else uri for uri in uris]
+        self.max_workers = max_workers
+        self.provider_limits = provider_limits or {}
+        self.host_limit = host_limit
+        self.lock = threading.Lock()
+        self.semaphores = {}
+        self.fetchers = []
+        # The fetched paths in the order of uris, None for every uri that could not be fetched
+        self.paths = []
+        # The exceptions for all uris that could not be fetched, by their index in uris
+        self.errors = {}
+
+    def fetch(self):
+        """Fetches all uris and returns the fetched paths in the order of uris.
+        Failing fetches do not stop the others, their exceptions are collected in errors.
+        """
+        self.fetchers = [self._create(index, uri, options) for index, (uri, options) in enumerate(self.items)]
+        self.paths = [None] * len(self.items)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {index: executor.submit(self._fetch, index, fetcher)
+                           for index, fetcher in enumerate(self.fetchers)
+                           if fetcher is not None and fetcher.concurrent}
+                for index, fetcher in enumerate(self.fetchers):
+                    if fetcher is not None and not fetcher.concurrent:
+                        self._fetch(index, fetcher)
+                for future in futures.values():
+                    future.result()
+        except BaseException:
+            # E.g. KeyboardInterrupt, __exit__ is not called if __enter__ raises
+            self.close()
+            raise
+        return self.paths
+
+    def _create(self, index, uri, options):
+        try:
+            return AnyPath(uri, **options)
+        except (Exception, NotInstalledError) as e:
+            LOG.debug('Could not create PathProvider for %s: %s', uri, e)
+            self.errors[index] = e
+            return None
+
+    def _fetch(self, index, fetcher):
+        uri = self.items[index][0]
+        try:
+            with ExitStack() as stack:
+                for semaphore in self._semaphores(type(fetcher), urlsplit(uri).hostname):
+                    stack.enter_context(semaphore)
+                self.paths[index] = fetcher.fetch()
+        except (Exception, NotInstalledError) as e:
+            LOG.debug('Could not fetch %s: %s', uri, e)
+            self.errors[index] = e
+
+    def _semaphores(self, provider, host):
+        """Returns the semaphores limiting concurrent fetches for the provider and host.
+        They are always acquired in the same order (provider before host), so waiting on them cannot deadlock.
+        """
+        keys = []
+        if provider in self.provider_limits:
+            keys.append((provider, self.provider_limits[provider]))
+        if host and self.host_limit:
+            keys.append((host, self.host_limit))
+        with self.lock:
+            for key, limit in keys:
+                if key not in self.semaphores:
+                    self.semaphores[key] = threading.BoundedSemaphore(limit)
+            return [self.semaphores[key] for key, _ in keys]
+
+    def close(self):
+        for fetcher in self.fetchers:
+            if fetcher is not None:
+                fetcher.close()
+
+    def __enter__(self):
+        return self.fetch()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
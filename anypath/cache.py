@@ -0,0 +1,216 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from tempfile import mkdtemp
+from time import time
+from urllib.parse import urlsplit, urlunsplit
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOG = logging.getLogger('anypath.cache')
+
+
+def normalize(uri: str):
+    """Normalizes an uri for use as a cache key, the scheme and host are case insensitive.
+    :param uri: The uri as given to AnyPath, e.g. 'HTTP://Example.org/a'
+    """
+    parts = urlsplit(uri)
+    if not parts.scheme:
+        return uri
+    return urlunsplit(parts._replace(scheme=parts.scheme.lower(), netloc=parts.netloc.lower()))
+
+
+class CacheEntry:
+    """A cached copy of a fetched resource
+    :param key: The key of the entry in the cache
+    :param path: The directory of the entry, it holds the fetched resource as 'data' and its metadata as 'meta.json'
+    :param meta: The metadata of the entry
+    :param ttl: Seconds after which the entry is stale, None if it never gets stale
+    """
+
+    def __init__(self, key: str, path: Path, meta: dict, ttl: float = None):
+        self.key = key
+        self.path = path
+        self.meta = meta
+        self.fresh = ttl is None or time() - meta['stored'] < ttl
+
+    @property
+    def data(self):
+        return self.path.joinpath('data')
+
+    @property
+    def validators(self):
+        return self.meta.get('validators', {})
+
+
+class FetchCache:
+    """An on-disk cache for fetched resources which can be shared by several processes.
+    Entries are keyed by the normalized uri, the PathProvider and its options. They are served as long as they are
+    fresh, stale entries can be revalidated by PathProviders which support it (e.g. via ETag for HttpPath).
+    Resources fetched with a checksum are keyed by it instead of the uri, they are served for every uri of the same
+    PathProvider with the same checksum and never get stale.
+    If the cache grows beyond max_size the least recently used entries are evicted.
+    Usage example: AnyPath('http://example.org', cache=FetchCache('/var/cache/anypath', ttl=600))
+    :param root: The directory in which the cached resources are stored
+    :param ttl: Seconds after which an entry is stale, None if entries never get stale
+    :param ttls: TTLs per PathProvider, overriding ttl, e.g. {HttpPath: 60}
+    :param max_size: The maximum size of all entries in bytes, None for no limit
+    """
+
+    def __init__(self, root: str, ttl: float = 300, ttls: dict = None, max_size: int = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self.max_size = max_size
+        # Counters of this process, shared caches of other processes are not included
+        self.stats = {'hits': 0, 'misses': 0, 'revalidations': 0, 'evictions': 0}
+
+    def key(self, uri: str, options: dict, provider: type):
+        """Returns the cache key for a resource, options which are not JSON serializable (e.g. callbacks) are ignored
+        :param uri: The uri of the resource
+        :param options: The options for the PathProvider
+        :param provider: The PathProvider class
+        """
+        if isinstance(options.get('checksum'), str):
+            # A single checksum pins the whole content, which is the same whichever uri it was fetched from, e.g. a
+            # mirror. Only the PathProvider and extracting change the layout in which it is fetched. A manifest may pin
+            # only some of the files of a directory, so its entries stay keyed by the uri.
+            data = json.dumps([provider.__name__, options['checksum'], bool(options.get('extract'))], sort_keys=True)
+            return hashlib.sha256(data.encode()).hexdigest()
+        data = json.dumps([provider.__name__, normalize(uri), options], sort_keys=True, default=lambda o: None)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, uri: str, options: dict, provider: type):
+        """Returns the entry for a resource or None if it is not cached"""
+        key = self.key(uri, options, provider)
+        path = self.root.joinpath(key)
+        with self._locked(shared=True):
+            try:
+                meta = json.loads(path.joinpath('meta.json').read_text())
+            except FileNotFoundError:
+                self.stats['misses'] += 1
+                return None
+        ttl = None if options.get('checksum') else self.ttls.get(provider, self.ttl)
+        entry = CacheEntry(key, path, meta, ttl)
+        if not entry.fresh:
+            self.stats['misses'] += 1
+        return entry
+
+    def restore(self, entry: CacheEntry, out_path: Path, revalidated: bool = False):
+        """Copies a cached resource to out_path and marks the entry as used.
+        Returns False if the entry does not exist anymore.
+        :param entry: The entry to be restored
+        :param out_path: The out_path of the PathProvider
+        :param revalidated: True if the remote confirmed that a stale entry is unchanged, it is then fresh again
+        """
+        LOG.debug('Restoring %s from cache entry %s', out_path, entry.key)
+        with self._locked(shared=True):
+            if not entry.data.exists():
+                # The entry was evicted by another process in the meantime
+                return False
+            _copy(entry.data, out_path)
+            entry.meta['accessed'] = time()
+            if revalidated:
+                entry.meta['stored'] = entry.meta['accessed']
+            self._write_meta(entry.path, entry.meta)
+        if revalidated:
+            self.stats['revalidations'] += 1
+        else:
+            self.stats['hits'] += 1
+        return True
+
+    def store(self, uri: str, options: dict, provider: type, out_path: Path, validators: dict = None):
+        """Stores a fetched resource in the cache, replacing an existing entry for it
+        :param uri: The uri of the resource
+        :param options: The options for the PathProvider
+        :param provider: The PathProvider class
+        :param out_path: The out_path to which the resource was fetched
+        :param validators: Values for revalidating the entry once it is stale, e.g. {'etag': '"abc"'}
+        """
+        if not out_path.exists():
+            return
+        key = self.key(uri, options, provider)
+        # Copy outside of the lock, the finished entry is moved into place atomically
+        staging = Path(mkdtemp(prefix='.staging-', dir=self.root))
+        _copy(out_path, staging.joinpath('data'))
+        now = time()
+        meta = {'uri': normalize(uri), 'stored': now, 'accessed': now, 'size': _size(staging.joinpath('data')),
+                'validators': validators or {}}
+        self._write_meta(staging, meta)
+        with self._locked():
+            path = self.root.joinpath(key)
+            if path.exists():
+                shutil.rmtree(path)
+            os.rename(staging, path)
+            self._evict()
+        LOG.debug('Stored %s in cache entry %s', uri, key)
+
+    def clear(self):
+        with self._locked():
+            for path in self._entries():
+                shutil.rmtree(path)
+
+    def _evict(self):
+        """Removes the least recently used entries until the cache fits into max_size, the lock must be held"""
+        if self.max_size is None:
+            return
+        entries = []
+        for path in self._entries():
+            try:
+                entries.append((json.loads(path.joinpath('meta.json').read_text()), path))
+            except FileNotFoundError:
+                continue
+        total = sum(meta['size'] for meta, _ in entries)
+        for meta, path in sorted(entries, key=lambda entry: entry[0]['accessed']):
+            if total <= self.max_size:
+                break
+            LOG.debug('Evicting cache entry %s', path.name)
+            shutil.rmtree(path)
+            total -= meta['size']
+            self.stats['evictions'] += 1
+
+    def _entries(self):
+        return [path for path in self.root.iterdir() if path.is_dir() and not path.name.startswith('.')]
+
+    @staticmethod
+    def _write_meta(path: Path, meta: dict):
+        tmp = path.joinpath(f'meta.json.{os.getpid()}.{threading.get_ident()}')
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, path.joinpath('meta.json'))
+
+    @contextmanager
+    def _locked(self, shared: bool = False):
+        """Holds a lock on the cache which is shared between processes.
+        Reading and restoring entries takes a shared lock, modifying and evicting them takes an exclusive lock.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(self.root.joinpath('.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _copy(src: Path, dst: Path):
+    if src.is_dir():
+        shutil.copytree(str(src), str(dst))
+    else:
+        shutil.copy2(str(src), str(dst))
+
+
+def _size(path: Path):
+    if path.is_file():
+        return path.stat().st_size
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
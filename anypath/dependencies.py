@@ -1,5 +1,14 @@
 import importlib
+import os
 import shutil
+import threading
+from concurrent.futures import Future
+
+# Results of do_import and check_executable as futures, including negative ones, so that every check runs only once.
+# The lock is only held to look them up and insert them, the checks themselves run in parallel
+_lock = threading.Lock()
+_modules = {}
+_executables = {}
 
 
 class NotInstalledError(BaseException):
@@ -13,11 +22,38 @@ def dependencies(*modules):
     return cls_decorator
 
 
-def do_import(module):
+def _memoized(results: dict, key, check):
+    """Returns the memoized result of check for key, or runs it outside of the lock.
+    Callers which ask for the same key while it is checked wait for that check. Exceptions are not memoized.
+    """
+    with _lock:
+        future = results.get(key)
+        owner = future is None
+        if owner:
+            future = results[key] = Future()
+    if owner:
+        try:
+            future.set_result(check())
+        except BaseException as e:
+            with _lock:
+                if results.get(key) is future:
+                    del results[key]
+            future.set_exception(e)
+    return future.result()
+
+
+def _import(module):
     try:
         return importlib.import_module(module)
     except ModuleNotFoundError:
+        return None
+
+
+def do_import(module):
+    imported = _memoized(_modules, module, lambda: _import(module))
+    if imported is None:
         raise NotInstalledError(f'Python module {module} is not installed.')
+    return imported
 
 
 def required_executables(*executables):
@@ -28,6 +64,19 @@ def required_executables(*executables):
 
 
 def check_executable(executable):
-    if shutil.which(executable) is None:
+    """Checks that executable is on the PATH and returns its absolute path.
+    Results are memoized per value of PATH, so changing PATH invalidates them.
+    """
+    key = (executable, os.environ.get('PATH'))
+    resolved = _memoized(_executables, key, lambda: shutil.which(executable))
+    if resolved is None:
         raise NotInstalledError(f'{executable} is not installed or not on the path.')
-    return executable
+    return resolved
+
+
+def invalidate():
+    """Forgets all memoized results, e.g. after modules or executables were installed at runtime"""
+    with _lock:
+        _modules.clear()
+        _executables.clear()
+    importlib.invalidate_caches()
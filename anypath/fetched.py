@@ -0,0 +1,69 @@
+import io
+import logging
+import os
+from pathlib import Path
+
+LOG = logging.getLogger('anypath.fetched')
+
+# Bytes read at once by iter_bytes
+CHUNK_SIZE = 1024 * 1024
+
+
+class FetchedPath(type(Path())):
+    """The path returned by fetch, a pathlib.Path with methods to read large fetched files with constant memory"""
+
+    def mmap(self):
+        """Maps the file into memory read-only, so that it can be sliced and searched like bytes without reading it.
+        The map can be used as a context manager which closes it. Empty files can not be mapped, an empty memoryview is
+        returned for them.
+        """
+        import mmap
+        with open(self, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b'')
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def iter_bytes(self, chunk_size: int = CHUNK_SIZE):
+        """Yields the content of the file in chunks of chunk_size bytes"""
+        with open(self, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                yield chunk
+
+
+class FetchedStream:
+    """A fetched resource which is read from the remote while it is consumed and never written to disk, returned by
+    PathProviders which are told not to spool, e.g. HttpPath(spool=False). It can only be read once.
+    :param chunks: The iterator of the chunks of the resource
+    :param close: Called when the stream is closed, e.g. to release the connection
+    """
+
+    def __init__(self, chunks, close=None):
+        self.chunks = chunks
+        self._close = close
+        self.consumed = False
+
+    def iter_bytes(self):
+        """Yields the chunks of the resource as they are received"""
+        if self.consumed:
+            raise IOError('The stream has been read already')
+        self.consumed = True
+        yield from self.chunks
+
+    def open(self):
+        """Returns a buffered, read-only file object of the resource, e.g. for io.TextIOWrapper or csv"""
+        from anypath.archive import IteratorReader
+        return io.BufferedReader(IteratorReader(self.iter_bytes()))
+
+    def read_bytes(self):
+        """Reads the whole resource into memory, only for resources which are known to be small"""
+        return b''.join(self.iter_bytes())
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
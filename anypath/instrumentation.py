@@ -0,0 +1,170 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from time import perf_counter, time
+
+LOG = logging.getLogger('anypath.instrumentation')
+
+# The registered hooks, fetches are only measured while at least one hook is registered
+hooks = []
+# Returned by phase() for fetches that are not measured
+NOT_MEASURED = nullcontext()
+
+
+class Hook:
+    """Base class for hooks which receive a FetchRecord for every fetch, e.g. to export them to a metrics system.
+    Hooks are called on the thread that runs the fetch, exceptions raised by hooks are logged and do not fail the fetch.
+    """
+
+    def start(self, record):
+        """Called before the fetch starts, only the tags and started of the record are set"""
+        pass
+
+    def end(self, record):
+        """Called after a successful fetch"""
+        pass
+
+    def error(self, record, exception):
+        """Called if the fetch failed with exception"""
+        pass
+
+
+class Recorder(Hook):
+    """A hook which keeps the records of all finished fetches, failed ones included
+    :param limit: The number of most recent records to keep, all records are kept if it is None
+    """
+
+    def __init__(self, limit: int = None):
+        self.limit = limit
+        self.records = []
+        self.lock = threading.Lock()
+
+    def end(self, record):
+        with self.lock:
+            self.records.append(record)
+            if self.limit is not None:
+                del self.records[:-self.limit]
+
+    def error(self, record, exception):
+        self.end(record)
+
+
+class FetchRecord:
+    """The measurements of a single fetch
+    :param provider: The name of the PathProvider class
+    :param scheme: The protocol-pattern the uri was resolved with, e.g. 'https://'
+    :param uri: The fetched uri
+    """
+
+    def __init__(self, provider: str, scheme: str, uri: str):
+        self.tags = {'provider': provider, 'scheme': scheme}
+        self.uri = uri
+        # Wall clock time when the fetch started
+        self.started = time()
+        # Seconds per phase: dependencies, temp, cache, fetch and persist
+        self.phases = {}
+        # Seconds of the whole fetch
+        self.duration = None
+        # Bytes received from the remote and written to disk, None if the PathProvider did not report them
+        self.transferred = None
+        self.written = None
+        # Whether the resource was restored from the cache instead of being fetched
+        self.cached = False
+        self.exception = None
+        self._start = perf_counter()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}({self.uri!r}, tags={self.tags}, phases={self.phases}, '
+                f'transferred={self.transferred}, written={self.written})')
+
+    @contextmanager
+    def phase(self, name: str):
+        """Measures the wall time of a phase, the times of phases which run several times are added up"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def count(self, transferred: int = 0, written: int = None):
+        """Adds bytes transferred and written, PathProviders may call it from several threads.
+        If written is None the bytes written are measured on disk after the fetch.
+        """
+        with self._lock:
+            self.transferred = (self.transferred or 0) + transferred
+            if written is not None:
+                self.written = (self.written or 0) + written
+
+    def finish(self):
+        self.duration = perf_counter() - self._start
+
+
+def add_hook(hook: Hook):
+    hooks.append(hook)
+
+
+def remove_hook(hook: Hook):
+    hooks.remove(hook)
+
+
+def start(fetcher):
+    """Returns the FetchRecord for a fetch and calls the start hooks, None if no hooks are registered.
+    Without hooks nothing is measured, so all other functions return immediately for a record of None.
+    """
+    if not hooks:
+        return None
+    record = FetchRecord(fetcher.__class__.__name__, fetcher.protocol, fetcher.uri)
+    _call('start', record)
+    return record
+
+
+def phase(record, name: str):
+    return NOT_MEASURED if record is None else record.phase(name)
+
+
+def fetched(record, fetcher):
+    """Measures the bytes written to the temporary directory for PathProviders which do not count them, e.g. git.
+    Paths which are not on the local disk (e.g. the RemotePath of a lazy SftpPath) are not measured.
+    """
+    if record is None or record.written is not None or fetcher.td is None or not isinstance(fetcher.out_path, Path):
+        return
+    record.written = disk_usage(fetcher.out_path)
+
+
+def end(record):
+    if record is None:
+        return
+    record.finish()
+    _call('end', record)
+
+
+def error(record, exception):
+    if record is None:
+        return
+    record.finish()
+    record.exception = exception
+    _call('error', record, exception)
+
+
+def _call(name, *args):
+    for hook in list(hooks):
+        try:
+            getattr(hook, name)(*args)
+        except Exception:
+            LOG.exception('Hook %s failed on %s', hook, name)
+
+
+def disk_usage(path):
+    """Returns the bytes in the files below path (or of the file), symlinks are not followed"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path) if os.path.exists(path) else 0
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files
+                     if not os.path.islink(os.path.join(root, name)))
+    return total
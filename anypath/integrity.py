@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import os
+import threading
+from pathlib import Path
+
+LOG = logging.getLogger('anypath.integrity')
+
+# Bytes read at once when a file has to be hashed on disk
+CHUNK_SIZE = 1024 * 1024
+
+
+class ChecksumMismatch(Exception):
+    """Raised if fetched files do not match their expected checksums"""
+    pass
+
+
+def parse(checksum: str):
+    """Splits a checksum into its algorithm and hex digest
+    :param checksum: The checksum as 'algorithm:hexdigest', e.g. 'sha256:9f86d08...'
+    """
+    algorithm, separator, digest = checksum.partition(':')
+    if not separator or algorithm not in hashlib.algorithms_available:
+        raise ValueError(f'Invalid checksum {checksum!r}, expected "algorithm:hexdigest" e.g. "sha256:..."')
+    return algorithm, digest.lower()
+
+
+def file_digest(path, algorithm: str):
+    """Hashes a file on disk, for files whose bytes could not be hashed while they were written"""
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Verifier:
+    """Verifies fetched files against expected checksums.
+    Files are hashed while the PathProvider writes them where possible, only the other ones are read again from disk.
+    :param checksum: Either the checksum of a single fetched file as 'algorithm:hexdigest' or a manifest which maps the
+    paths of files, relative to the fetched directory, to their checksums
+    """
+
+    def __init__(self, checksum):
+        if isinstance(checksum, str):
+            # The empty name stands for the only fetched file, whatever its name is
+            self.expected = {'': parse(checksum)}
+        else:
+            self.expected = {Path(name).as_posix(): parse(value) for name, value in checksum.items()}
+        self.single = isinstance(checksum, str)
+        self.lock = threading.Lock()
+        # Digests of the files that were hashed while they were written, by name, '' for a single checksum
+        self.streamed = {}
+        self.files = 0
+        # Digests of all verified files as 'algorithm:hexdigest', by name
+        self.digests = {}
+
+    def hasher(self, name: str = ''):
+        """Returns a hash object for a file which is about to be written, None if the file is not verified
+        :param name: The path of the file relative to the fetched directory, '' if the fetched path is the file
+        """
+        expected = self.expected.get('' if self.single else name)
+        return None if expected is None else hashlib.new(expected[0])
+
+    def hashed(self, name: str, hasher):
+        """Records the digest of a file that was hashed while it was written"""
+        if hasher is not None:
+            with self.lock:
+                self.streamed['' if self.single else name] = hasher.hexdigest()
+                self.files += 1
+
+    def matches(self, path: Path):
+        """Returns True if path holds files which match all checksums, e.g. to skip fetching a persisted copy"""
+        try:
+            self.verify(path, streamed=False)
+        except (ChecksumMismatch, OSError):
+            return False
+        return True
+
+    def verify_stream(self):
+        """Checks the single checksum against the digest of a stream which was never written to disk"""
+        algorithm, expected = self.expected['']
+        actual = self.streamed.get('')
+        self.digests[''] = f'{algorithm}:{actual}'
+        if actual != expected:
+            raise ChecksumMismatch(f'Checksum verification failed: the stream has {algorithm}:{actual} instead of '
+                                   f'{algorithm}:{expected}')
+
+    def verify(self, path: Path, streamed: bool = True, executor=None):
+        """Checks the fetched files in path against their checksums
+        :param path: The fetched file or directory
+        :param streamed: Whether the digests of files hashed while they were written are used
+        :param executor: An Executor on which the files that were not streamed are hashed, e.g. a process pool
+        :raises ChecksumMismatch: If a file is missing or its digest differs
+        """
+        path = Path(path)
+        known = self.streamed if streamed else {}
+        if self.single and '' in known and self.files == 1:
+            # The only hashed file, e.g. an archive which was extracted while it was fetched
+            targets = {'': (path, self.expected[''])}
+        elif self.single:
+            known = {}
+            files = [path] if path.is_file() else [f for f in path.rglob('*') if f.is_file()]
+            if len(files) != 1:
+                raise ChecksumMismatch(f'A single checksum requires a single file, but {len(files)} were fetched')
+            name = '' if files[0] == path else files[0].relative_to(path).as_posix()
+            targets = {name: (files[0], self.expected[''])}
+        else:
+            targets = {name: (path.joinpath(name), expected) for name, expected in self.expected.items()}
+        actual = dict(known)
+        on_disk = [(name, target, algorithm) for name, (target, (algorithm, _)) in targets.items()
+                   if name not in known and target.is_file()]
+        LOG.debug('Hashing %s files on disk', len(on_disk))
+        actual.update(zip([name for name, _, _ in on_disk], _file_digests(on_disk, executor)))
+        failed = []
+        for name, (target, (algorithm, expected)) in targets.items():
+            if name not in actual:
+                failed.append(f'{name or target.name} is missing')
+                continue
+            self.digests[name] = f'{algorithm}:{actual[name]}'
+            if actual[name] != expected:
+                failed.append(f'{name or target.name} has {algorithm}:{actual[name]} instead of {algorithm}:{expected}')
+        if failed:
+            raise ChecksumMismatch('Checksum verification failed: ' + ', '.join(failed))
+        LOG.debug('Verified %s files in %s', len(targets), path)
+
+
+def _file_digests(files: list, executor=None):
+    """Hashes (name, path, algorithm) files on disk, on the executor if there is more than one"""
+    if executor is None or len(files) < 2:
+        return [file_digest(target, algorithm) for _, target, algorithm in files]
+    # Batches keep the overhead of sending many small files to a process pool low
+    return list(executor.map(file_digest, [target for _, target, _ in files], [algorithm for _, _, algorithm in files],
+                             chunksize=16))
+
+
+def manifest(path: Path, algorithm: str = 'sha256'):
+    """Creates a manifest of the checksums of all files in a directory, e.g. from a trusted fetch
+    :param path: The directory
+    :param algorithm: The hash algorithm
+    :return: The manifest which can be passed as checksum to AnyPath
+    """
+    path = Path(path)
+    return {Path(root, name).relative_to(path).as_posix(): f'{algorithm}:{file_digest(Path(root, name), algorithm)}'
+            for root, _, files in os.walk(path) for name in files}
@@ -1,18 +1,120 @@
-import subprocess
+import hashlib
+import json
+import logging
+from contextlib import contextmanager
+from pathlib import Path
 
+from anypath import runner
 from anypath.anypath import BasePath, pattern
 from anypath.dependencies import required_executables
+from anypath.sync import alocked, build_atomically, locked
 
+LOG = logging.getLogger('anypath.pathprovider.git')
 
-@pattern('git+http://', 'git+https://', 'git://')
+
+@pattern('git+http://', 'git+https://', 'git+file://', 'git://')
 @required_executables('git')
 class GitPath(BasePath):
-    def __init__(self, protocol, path, persist_dir, branch='master'):
-        super().__init__(protocol, path, persist_dir)
+    def __init__(self, protocol, path, persist_dir, branch='master', mirror_dir=None, depth=None, single_branch=False,
+                 sparse=None, filter=None, timeout=None, on_output=None, **options):
+        super().__init__(protocol, path, persist_dir, **options)
         self.protocol = protocol.replace('git+', '', 1)
         self.branch = branch
+        self.mirror_dir = mirror_dir
+        self.depth = depth
+        self.single_branch = single_branch
+        self.sparse = sparse
+        self.filter = filter
+        self.timeout = timeout
+        self.on_output = on_output
 
     @BasePath.wrapped
     def fetch(self):
-        git_process = subprocess.Popen(['git', 'clone', '-b', self.branch, self.protocol + str(self.path), str(self.out_path)])
-        git_process.wait()
+        if self.mirror_dir is not None:
+            with locked(self.mirror_lock), self._mirror_commands() as commands:
+                for args in commands:
+                    runner.run(args, self.timeout, self.record, self.on_output)
+        for args in self._commands():
+            runner.run(args, self.timeout, self.record, self.on_output)
+
+    @BasePath.awrapped
+    async def afetch(self):
+        if self.mirror_dir is not None:
+            async with alocked(self.mirror_lock):
+                with self._mirror_commands() as commands:
+                    for args in commands:
+                        await runner.arun(args, self.timeout, self.record, self.on_output)
+        for args in self._commands():
+            await runner.arun(args, self.timeout, self.record, self.on_output)
+
+    @property
+    def url(self):
+        return self.protocol + str(self.path)
+
+    @property
+    def mirror(self):
+        """The bare mirror of the remote repository inside mirror_dir, shallow and partial mirrors are kept apart as git
+        fetch does not fetch the history or objects they lack
+        """
+        key = self.url if self.depth is None and self.filter is None else json.dumps([self.url, self.depth, self.filter])
+        return Path(self.mirror_dir).joinpath(hashlib.sha1(key.encode()).hexdigest() + '.git')
+
+    @property
+    def mirror_lock(self):
+        """The lock file which is held while the mirror is created or updated, fetches of the same remote in other
+        threads or processes wait for it
+        """
+        return self.mirror.with_name(self.mirror.name + '.lock')
+
+    @contextmanager
+    def _mirror_commands(self):
+        """Yields the git commands which create or update the mirror, the mirror lock must be held.
+        A new mirror is cloned to a temporary directory which is only renamed to the mirror once the clone succeeded,
+        so a clone that fails or is killed does not leave a broken mirror behind.
+        """
+        git = self._executable('git')
+        if self.mirror.exists():
+            LOG.debug('Updating mirror %s of %s', self.mirror, self.url)
+            yield [[git, '--git-dir', str(self.mirror), 'fetch', '--prune'] + self._remote_args() + ['origin']]
+            return
+        LOG.debug('Creating mirror %s of %s', self.mirror, self.url)
+        with build_atomically(self.mirror) as partial:
+            yield [[git, 'clone', '--mirror'] + self._remote_args() + [self.url, str(partial)]]
+
+    def _commands(self):
+        """Returns the git commands which fetch the working tree to out_path.
+        Without a mirror_dir the remote is cloned directly. Otherwise a persistent bare mirror of the remote is cloned
+        once and only updated with git fetch on later fetches (see _mirror_commands), the working tree is then cloned
+        from the mirror sharing its objects. A working tree which is persisted does not share them, as it would break
+        once the mirror is deleted or pruned, it is a local clone with hardlinked objects instead.
+        """
+        git = self._executable('git')
+        if self.mirror_dir is None:
+            commands = [self._clone_args(self.url)]
+        elif self.persist_dir:
+            commands = [self._clone_args(str(self.mirror))]
+        else:
+            commands = [self._clone_args(str(self.mirror), '--shared')]
+        if self.sparse:
+            commands += [[git, '-C', str(self.out_path), 'sparse-checkout', 'set'] + list(self.sparse),
+                         [git, '-C', str(self.out_path), 'checkout', self.branch]]
+        return commands
+
+    def _clone_args(self, source, *flags):
+        args = [self._executable('git'), 'clone', '-b', self.branch, *flags]
+        if source == self.url:
+            args += self._remote_args()
+        if self.single_branch:
+            args.append('--single-branch')
+        if self.sparse:
+            args.append('--no-checkout')
+        return args + [source, str(self.out_path)]
+
+    def _remote_args(self):
+        """Returns the arguments that limit what is transferred from the remote repository"""
+        args = []
+        if self.depth is not None:
+            args += ['--depth', str(self.depth)]
+        if self.filter is not None:
+            args.append(f'--filter={self.filter}')
+        return args
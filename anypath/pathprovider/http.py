@@ -1,25 +1,497 @@
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from anypath import archive
 from anypath.anypath import BasePath, pattern
 from anypath.dependencies import dependencies
+from anypath.fetched import FetchedStream
+from anypath.sync import atomic_write
+
+LOG = logging.getLogger('anypath.pathprovider.http')
+
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+# The Content-Range of a 416 response, with the size of the resource
+UNSATISFIED_RANGE = re.compile(r'bytes \*/(\d+)')
+
+
+class _SessionPool:
+    """Process-wide pool of requests sessions shared by all HttpPath instances.
+    One session is kept per scheme and host, so that TCP/TLS connections are reused across fetches.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.configure()
+
+    def configure(self, pool_size=10, keep_alive=True, retries=0, backoff_factor=0.0, retry_statuses=None):
+        """Sets the options for new sessions, existing sessions are closed so that the options apply to all hosts
+        :param pool_size: The maximum number of connections that are kept open per host
+        :param keep_alive: If False connections are closed after every request
+        :param retries: The number of retries for failed connections and for responses with a retry_status
+        :param backoff_factor: The backoff factor between retries, see urllib3.util.Retry
+        :param retry_statuses: HTTP status codes on which a request is retried
+        """
+        self.shutdown()
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.retry_statuses = retry_statuses or []
+
+    def get(self, requests, url):
+        """Returns the session for the scheme and host of url, it is created if it does not exist yet
+        :param requests: The requests module
+        :param url: The url that will be requested with the session
+        """
+        scheme, netloc = urlsplit(url)[:2]
+        with self.lock:
+            session = self.sessions.get((scheme, netloc))
+            if session is None:
+                LOG.debug('Creating pooled session for %s://%s', scheme, netloc)
+                session = self.sessions[(scheme, netloc)] = self.create(requests)
+        return session
+
+    def create(self, requests):
+        session = requests.Session()
+        retry = requests.adapters.Retry(total=self.retries,
+                                        backoff_factor=self.backoff_factor,
+                                        status_forcelist=self.retry_statuses)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def shutdown(self):
+        """Closes all pooled sessions and their connections"""
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
 
 
 @pattern('http://', 'https://')
 @dependencies('requests')
 class HttpPath(BasePath):
-    def __init__(self, protocol, path, persist_dir, method='GET', data=None, headers=None, params=None):
-        super().__init__(protocol, path, persist_dir)
+    # Connection pool shared by all instances, configured via HttpPath.pool.configure()
+    pool = _SessionPool()
+    # Files smaller than segments * min_segment_size are not split into parallel range requests
+    min_segment_size = 1024 * 1024
+
+    def __init__(self, protocol, path, persist_dir, method='GET', data=None, headers=None, params=None, stream=True,
+                 chunk_size=64 * 1024, progress=None, pooled=True, byte_range=None, resume=False, conditional=False,
+                 segments=1, extract=False, spool=True, **options):
+        super().__init__(protocol, path, persist_dir, **options)
+        if (resume or conditional) and not persist_dir:
+            raise ValueError('resume and conditional require a persist_dir')
+        if byte_range is not None and resume:
+            raise ValueError('byte_range can not be combined with resume')
+        if extract and (byte_range is not None or resume or segments > 1):
+            raise ValueError('extract can not be combined with byte_range, resume or segments')
+        if not spool and (persist_dir or resume or conditional or segments > 1 or extract):
+            raise ValueError('spool=False can not be combined with persist_dir, resume, conditional, segments or '
+                             'extract')
+        if not spool and self.verifier is not None and not self.verifier.single:
+            raise ValueError('spool=False can only be verified with a single checksum')
         self.method = method
         self.headers = headers
         self.params = params
         self.data = data
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.pooled = pooled
+        self.byte_range = byte_range
+        self.resume = resume
+        self.conditional = conditional
+        self.segments = segments
+        self.extract = extract
+        self.spool = spool
+        # The response which is streamed to the FetchedStream if spool is False, and its session
+        self.response = None
+        self.session = None
+        # Validators of the copy in persist_dir if conditional is set
+        self.persisted = {}
+        # Set if the copy in persist_dir did not change remotely, nothing was fetched then
+        self.up_to_date = False
+        # Bytes written by all parallel range requests
+        self.lock = threading.Lock()
+        self.written = 0
+
+    @property
+    def url(self):
+        return self.protocol + self.path
 
     @BasePath.wrapped
     def fetch(self, requests):
+        if self.conditional and Path(self.persist_dir).exists():
+            self.persisted = self._load_validators(self._sidecar('.json'))
+        if self.pooled:
+            session = self.pool.get(requests, self.url)
+        else:
+            session = self.pool.create(requests)
+        try:
+            if self.segments > 1 and self.method == 'GET' and self.byte_range is None and not self.resume:
+                if self._fetch_segments(requests, session):
+                    return
+            offset = self._partial_size()
+            request, response = self._send(requests, session, offset)
+            if offset and response.status_code == 416:
+                response.close()
+                if self._partial_complete(response, offset):
+                    return
+                offset = 0
+                request, response = self._send(requests, session, offset)
+            if not self.spool:
+                try:
+                    response.raise_for_status()
+                except Exception:
+                    response.close()
+                    raise
+                # The response is read by the FetchedStream and closed with it
+                self.validators = self._response_validators(response)
+                self.response, self.session = response, session
+                return
+            try:
+                if response.status_code == 304 and self._not_modified(request.url):
+                    return
+                # An error page must neither be written, nor cached or persisted
+                response.raise_for_status()
+                self.validators = self._response_validators(response)
+                if self.extract:
+                    self._extract(response)
+                elif self.resume:
+                    self._write_partial(response, offset)
+                else:
+                    self._write(response, **self._range_of(response))
+            finally:
+                response.close()
+        finally:
+            if not self.pooled and self.response is None:
+                session.close()
+
+    def _send(self, requests, session, offset):
+        """Sends the request for the resource
+        :param offset: The size of a partially downloaded file that is resumed
+        :return: The prepared request and the response
+        """
         request = requests.Request(method=self.method,
-                                   url=self.protocol + self.path,
-                                   headers=self.headers,
+                                   url=self.url,
+                                   headers=self._headers(offset),
                                    params=self.params,
                                    data=self.data).prepare()
-        response = requests.Session().send(request)
+        return request, session.send(request, stream=self.stream)
+
+    def _headers(self, offset=0):
+        """Returns the request headers, with conditional headers if a stale cached copy or the copy in persist_dir is
+        revalidated and with a Range header if only a part of the resource is requested
+        :param offset: The size of a partially downloaded file that is resumed
+        """
+        headers = dict(self.headers or {})
+        validators = self.validators or self.persisted
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+        if self.byte_range is not None:
+            start, end = self.byte_range
+            headers['Range'] = f'bytes={start}-{"" if end is None else end - 1}'
+        elif offset:
+            headers['Range'] = f'bytes={offset}-'
+            partial = self._load_validators(self._sidecar('.part.json'))
+            if partial:
+                headers['If-Range'] = partial.get('etag', partial.get('last_modified'))
+        return headers
+
+    def _not_modified(self, url):
+        """Handles a 304 response, returns False if the request was not conditional"""
+        if self.validators:
+            LOG.debug('Cached copy of %s was not modified', url)
+            self.not_modified = True
+            return True
+        if self.persisted:
+            LOG.debug('Persisted copy of %s is up to date', url)
+            self.up_to_date = True
+            self.out_path = Path(self.persist_dir).resolve()
+            return True
+        return False
+
+    @staticmethod
+    def _response_validators(response):
+        return {name: response.headers[header]
+                for name, header in [('etag', 'ETag'), ('last_modified', 'Last-Modified')]
+                if header in response.headers}
+
+    def _range_of(self, response):
+        """Returns the part of the response body that has to be written for byte_range.
+        Servers which do not support ranges answer with the whole body, the requested range is cut out of it then.
+        """
+        if self.byte_range is None:
+            return {}
+        start, end = self.byte_range
+        if response.status_code == 206:
+            if self._range_start(response) != start:
+                raise IOError(f'Server answered the range request for {self.url} with another range')
+            return {}
+        if response.status_code != 200:
+            # E.g. 416 for a range past the end, its body is no part of the resource
+            raise IOError(f'Server answered the range request for {self.url} with {response.status_code}')
+        return {'skip': start, 'limit': None if end is None else end - start}
+
+    def _range_start(self, response):
+        """Returns the first byte of a 206 response according to its Content-Range header"""
+        match = CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+        if match is None:
+            raise IOError(f'Server answered the range request for {self.url} without a valid Content-Range')
+        return int(match.group(1))
+
+    def _sidecar(self, suffix):
+        """Returns the path of a hidden file next to persist_dir, e.g. for a partial download or validators"""
+        target = Path(self.persist_dir)
+        return target.parent.joinpath(f'.{target.name}{suffix}')
+
+    @staticmethod
+    def _load_validators(path):
+        try:
+            return json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def _save_validators(path, validators):
+        with atomic_write(path, 'w') as f:
+            json.dump(validators, f)
+
+    def _partial_size(self):
+        if not self.resume:
+            return 0
+        try:
+            return self._sidecar('.part').stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _write_partial(self, response, offset):
+        """Appends the response to the partial download next to persist_dir and moves it to out_path once it is
+        complete. If the fetch fails the partial download is kept, so that the next fetch can resume it.
+        """
+        partial = self._sidecar('.part')
+        response.raise_for_status()
+        if response.status_code == 206:
+            start = self._range_start(response)
+            if start != offset:
+                raise IOError(f'Server resumed {self.url} at byte {start} instead of {offset}')
+            LOG.debug('Resuming %s at byte %s', self.url, offset)
+            mode = 'ab'
+        else:
+            # The server sent the whole resource, e.g. because it changed since the partial download started
+            mode = 'wb'
+            self._save_validators(self._sidecar('.part.json'), self.validators)
+        self._write(response, path=partial, mode=mode)
+        os.replace(partial, self.out_path)
+        self._sidecar('.part.json').unlink(missing_ok=True)
+
+    def _partial_complete(self, response, offset):
+        """Handles a 416 response to resuming a partial download, e.g. one that was complete when the process crashed
+        before moving it. It is moved to out_path if its size is the one of the resource, otherwise it is deleted so
+        that the resource is fetched again.
+        :return: True if the partial download was complete
+        """
+        match = UNSATISFIED_RANGE.match(response.headers.get('Content-Range', ''))
+        if match is not None and int(match.group(1)) == offset:
+            LOG.debug('Partial download of %s is already complete', self.url)
+            self.validators = self._load_validators(self._sidecar('.part.json'))
+            os.replace(self._sidecar('.part'), self.out_path)
+            self._sidecar('.part.json').unlink(missing_ok=True)
+            return True
+        LOG.debug('Partial download of %s does not match the resource, fetching it again', self.url)
+        self._sidecar('.part').unlink(missing_ok=True)
+        self._sidecar('.part.json').unlink(missing_ok=True)
+        return False
+
+    def _fetch_segments(self, requests, session):
+        """Downloads the resource with self.segments parallel range requests.
+        :return: False if the server does not support ranges or the resource is too small, it is fetched with a
+        single request then
+        """
+        response = session.head(self.url, headers=self._headers(), params=self.params, allow_redirects=True)
+        if response.status_code == 304 and self._not_modified(self.url):
+            return True
+        size = int(response.headers.get('Content-Length', 0) or 0)
+        if (response.status_code != 200 or response.headers.get('Accept-Ranges') != 'bytes'
+                or size < self.segments * self.min_segment_size):
+            return False
+        self.validators = self._response_validators(response)
+        if_range = self.validators.get('etag', self.validators.get('last_modified'))
+        length = -(-size // self.segments)
+        LOG.debug('Fetching %s bytes of %s in %s segments', size, self.url, self.segments)
+        start = perf_counter()
+        with open(self.out_path, 'wb') as f:
+            f.truncate(size)
+            with ThreadPoolExecutor(max_workers=self.segments) as executor:
+                futures = [executor.submit(self._fetch_segment, requests, session, f.fileno(), offset,
+                                           min(offset + length, size), if_range, size, start)
+                           for offset in range(0, size, length)]
+                for future in futures:
+                    future.result()
+        self._count(size, size)
+        return True
+
+    def _fetch_segment(self, requests, session, fd, offset, end, if_range, total, start):
+        headers = dict(self.headers or {}, Range=f'bytes={offset}-{end - 1}')
+        if if_range:
+            headers['If-Range'] = if_range
+        request = requests.Request(method='GET', url=self.url, headers=headers, params=self.params).prepare()
+        response = session.send(request, stream=True)
+        try:
+            if response.status_code != 206:
+                raise IOError(f'Server answered the range request for {self.url} with {response.status_code}')
+            if self._range_start(response) != offset:
+                raise IOError(f'Server answered the range request for {self.url} with another range')
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                chunk = chunk[:end - offset]
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+                with self.lock:
+                    self.written += len(chunk)
+                    written = self.written
+                self._report(written, total, perf_counter() - start)
+        finally:
+            response.close()
+        if offset != end:
+            raise IOError(f'Range request for {self.url} ended at byte {offset} instead of {end}')
+
+    @classmethod
+    def shutdown(cls):
+        cls.pool.shutdown()
+
+    def _make_temp(self):
+        # A streamed response is not written to disk
+        if self.spool:
+            super()._make_temp()
+
+    def _verify(self):
+        # A streamed response is verified once it was read, see _stream
+        if self.spool:
+            super()._verify()
+
+    def _fetched(self):
+        if self.spool:
+            return super()._fetched()
+        return FetchedStream(self._stream(self.response, **self._range_of(self.response)), self.close)
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+            if not self.pooled:
+                self.session.close()
+            self.response = None
+        super().close()
+
+    def _persist(self):
+        """A persisted copy which did not change remotely is kept as it is, otherwise the validators of the fetched
+        copy are saved next to it for the next conditional fetch
+        """
+        if self.up_to_date:
+            return
+        super()._persist()
+        if self.conditional and self.validators:
+            self._save_validators(self._sidecar('.json'), self.validators)
+
+    def _extract(self, response):
+        """Extracts the archive in the response body to out_path while it is downloaded, the archive itself is not
+        written to disk. out_path becomes the directory of the extracted files.
+        :param response: The response with the archive
+        """
+        total = int(response.headers.get('Content-Length', 0) or 0)
+        start = perf_counter()
+        # A single checksum is the one of the archive
+        hasher = self._hasher()
+
+        def on_read(chunk):
+            if hasher is not None:
+                hasher.update(chunk)
+            self.written += len(chunk)
+            self._report(self.written, total, perf_counter() - start)
+
+        archive.extract(archive.IteratorReader(response.iter_content(chunk_size=self.chunk_size), on_read),
+                        self.out_path)
+        self._hashed('', hasher)
+        self._count(self.written)
+        LOG.debug('Extracted %s bytes in %.3fs', self.written, perf_counter() - start)
+
+    def _write(self, response, path=None, mode='wb', skip=0, limit=None):
+        """Writes the raw bytes of the response body to out_path chunk by chunk.
+        If the response is streamed only one chunk is held in memory at a time.
+        :param response: The response to be written
+        :param path: The file to write to, out_path if it is None
+        :param mode: 'ab' to append to the file
+        :param skip: The number of bytes at the start of the body which are not written
+        :param limit: The maximum number of bytes that are written
+        """
+        total = limit or int(response.headers.get('Content-Length', 0) or 0)
+        written = 0
+        start = perf_counter()
+        # Appended bytes can not be hashed on their own, the file is hashed on disk then
+        hasher = self._hasher() if mode == 'wb' else None
+        with open(path or self.out_path, mode) as f:
+            for chunk in self._chunks(response, skip, limit):
+                f.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                written += len(chunk)
+                self._report(written, total, perf_counter() - start)
+        self._hashed('', hasher)
+        self._count(written, written)
+        LOG.debug('Fetched %s bytes in %.3fs', written, perf_counter() - start)
+
+    def _chunks(self, response, skip=0, limit=None):
+        """Yields the chunks of the response body, without its first skip bytes and with at most limit bytes"""
+        read = 0
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+            if skip:
+                skipped = min(skip, len(chunk))
+                chunk, skip = chunk[skipped:], skip - skipped
+            if limit is not None:
+                chunk = chunk[:limit - read]
+            if chunk:
+                read += len(chunk)
+                yield chunk
+            if limit is not None and read >= limit:
+                break
+
+    def _stream(self, response, skip=0, limit=None):
+        """Yields the response body to the FetchedStream, a checksum is verified once the body was read completely"""
+        total = limit or int(response.headers.get('Content-Length', 0) or 0)
+        read = 0
+        start = perf_counter()
+        hasher = self._hasher()
+        for chunk in self._chunks(response, skip, limit):
+            if hasher is not None:
+                hasher.update(chunk)
+            read += len(chunk)
+            self._report(read, total, perf_counter() - start)
+            yield chunk
+        LOG.debug('Streamed %s bytes in %.3fs', read, perf_counter() - start)
+        if hasher is not None:
+            self._hashed('', hasher)
+            self.verifier.verify_stream()
 
-        with open(self.out_path, 'w+') as f:
-            f.write(response.text)
+    def _report(self, written, total, elapsed):
+        """Reports the download progress to the progress callback if one is set
+        :param written: Bytes written so far
+        :param total: Expected size of the body in bytes, 0 if the server did not send a Content-Length
+        :param elapsed: Seconds since the download started
+        """
+        if self.progress is None:
+            return
+        rate = written / elapsed if elapsed > 0 else 0.0
+        self.progress(written, total, rate)
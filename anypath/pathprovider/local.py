@@ -1,12 +1,25 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from stat import S_ISLNK
+from time import perf_counter
 
 from anypath.anypath import BasePath, pattern
+from anypath.sync import Manifest
+
+LOG = logging.getLogger('anypath.pathprovider.local')
 
 
 @pattern('file://', '/', './')
 class LocalPath(BasePath):
-    def __init__(self, protocol, path, persist_dir):
-        super().__init__(protocol, path, persist_dir)
+    concurrent = False
+
+    def __init__(self, protocol, path, persist_dir, sync=False, delete=False, ctime=False, workers=8, **options):
+        super().__init__(protocol, path, persist_dir, **options)
+        if sync and not persist_dir:
+            raise ValueError('sync requires a persist_dir to sync to')
         # In case we use 'file://' as protocol do not use it to construct the path
         if self.protocol == 'file://':
             protocol = ''
@@ -14,13 +27,148 @@ class LocalPath(BasePath):
             protocol = self.protocol
         self.path = Path(f'{protocol}{path}')
         self.out_path = self.path
+        self.sync = sync
+        self.delete = delete
+        self.ctime = ctime
+        self.workers = workers
+        self.manifest = None
+        self.lock = threading.Lock()
+        self.stats = {'files': 0, 'bytes': 0, 'seconds': 0.0}
 
     @BasePath.wrapped
     def fetch(self):
-        pass
+        if not self.sync:
+            return
+        start = perf_counter()
+        self.manifest = Manifest(self.out_path)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                try:
+                    futures = [executor.submit(self._copy, *task) for task in self._changed()]
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    executor.shutdown(cancel_futures=True)
+                    raise
+            if self.delete:
+                self.manifest.delete_unseen()
+        finally:
+            self.manifest.save()
+        self.stats['seconds'] = perf_counter() - start
+        self._count(self.stats['bytes'], self.stats['bytes'])
+        LOG.debug('Synced %s files with %s bytes in %.3fs', self.stats['files'], self.stats['bytes'],
+                  self.stats['seconds'])
+
+    def _walk(self):
+        """Walks through the source with os.scandir, whose entries come with the file type so that only files need to be
+        stat'ed. The directories are created in out_path on the way.
+        :return: Tuples of the source path, the path relative to the source and the stat result of every file or symlink
+        """
+        if not self.path.is_dir():
+            yield str(self.path), self.path.name, os.lstat(self.path)
+            return
+        directories = ['']
+        while directories:
+            relative = directories.pop()
+            self.out_path.joinpath(relative).mkdir(exist_ok=True)
+            with os.scandir(self.path.joinpath(relative)) as entries:
+                for entry in entries:
+                    name = f'{relative}/{entry.name}' if relative else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(name)
+                    else:
+                        yield entry.path, name, entry.stat(follow_symlinks=False)
+
+    def _changed(self):
+        """Compares the files in the source with the manifest of the last sync
+        :return: Tasks for copying the files which are new or changed since
+        """
+        for source, name, stat in self._walk():
+            # The inode change time also catches files which were replaced with their modification time preserved
+            changed_at = stat.st_ctime_ns if self.ctime else stat.st_mtime_ns
+            if self.manifest.changed(name, stat.st_size, changed_at):
+                yield source, name, stat, changed_at
+
+    def _copy(self, source, name, stat, changed_at):
+        """Copies a file that was synced before to a temporary file which replaces it, new files are copied in place as
+        they are not in the manifest until they are complete
+        """
+        target = os.path.join(self.out_path, name)
+        if name in self.manifest.entries or os.path.lexists(target):
+            tmp = os.path.join(os.path.dirname(target), f'.{os.path.basename(target)}.{threading.get_ident()}.part')
+        else:
+            tmp = target
+        try:
+            if S_ISLNK(stat.st_mode):
+                os.symlink(os.readlink(source), tmp)
+            else:
+                _copy_file(source, tmp, stat)
+            if tmp != target:
+                os.replace(tmp, target)
+        except BaseException:
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+            raise
+        self.manifest.update(name, stat.st_size, changed_at)
+        with self.lock:
+            self.stats['files'] += 1
+            self.stats['bytes'] += stat.st_size
 
     def _make_temp(self):
-        pass
+        """In sync mode the files are copied straight into persist_dir"""
+        if self.sync:
+            self.out_path = Path(self.persist_dir).resolve()
+            self.out_path.mkdir(parents=True, exist_ok=True)
+
+    def _persist(self):
+        if not self.sync:
+            return super()._persist()
 
     def close(self):
         pass
+
+
+def _copy_file(source: str, target: str, stat):
+    """Copies a file in the kernel with copy_file_range, which reflinks on filesystems that support it, or with sendfile
+    if that fails (e.g. across filesystems on older kernels). The copy is created with the mode of the source and gets
+    its modification time from the stat result of the walk, so the source is only opened once.
+    """
+    src = os.open(source, os.O_RDONLY)
+    try:
+        dst = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, stat.st_mode & 0o7777)
+        try:
+            copied = 0
+            if hasattr(os, 'copy_file_range'):
+                try:
+                    copied = _copy_range(os.copy_file_range, src, dst, stat.st_size)
+                except OSError as e:
+                    LOG.debug('copy_file_range failed for %s: %s', source, e.strerror)
+            if copied < stat.st_size:
+                copied += _copy_range(_sendfile if hasattr(os, 'sendfile') else _read_write, src, dst,
+                                      stat.st_size - copied)
+        finally:
+            os.close(dst)
+    finally:
+        os.close(src)
+    os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def _copy_range(copy, src: int, dst: int, size: int):
+    """Calls copy(src, dst, count) until size bytes or the whole rest of the file are copied
+    :return: The number of copied bytes
+    """
+    copied = 0
+    while copied < size:
+        n = copy(src, dst, size - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _sendfile(src: int, dst: int, count: int):
+    return os.sendfile(dst, src, None, count)
+
+
+def _read_write(src: int, dst: int, count: int):
+    return os.write(dst, os.read(src, min(count, 1024 * 1024)))
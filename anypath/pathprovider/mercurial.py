@@ -1,17 +1,122 @@
-import subprocess
+import hashlib
+import json
+import logging
+from contextlib import contextmanager
+from pathlib import Path
 
+from anypath import runner
 from anypath.anypath import BasePath, pattern
 from anypath.dependencies import required_executables
+from anypath.sync import alocked, build_atomically, locked
 
+LOG = logging.getLogger('anypath.pathprovider.mercurial')
 
-@pattern('hg+http://', 'hg+https://')
+
+@pattern('hg+http://', 'hg+https://', 'hg+file://')
 @required_executables('hg')
 class HgPath(BasePath):
-    def __init__(self, protocol, path, persist_dir):
-        super().__init__(protocol, path, persist_dir)
+    def __init__(self, protocol, path, persist_dir, rev=None, branch=None, store_dir=None, narrow=None, timeout=None,
+                 on_output=None, **options):
+        super().__init__(protocol, path, persist_dir, **options)
         self.protocol = protocol.replace('hg+', '', 1)
+        self.rev = rev
+        self.branch = branch
+        self.store_dir = store_dir
+        self.narrow = narrow
+        self.timeout = timeout
+        self.on_output = on_output
 
     @BasePath.wrapped
     def fetch(self):
-        git_process = subprocess.Popen(['hg', 'clone', self.protocol + str(self.path), str(self.out_path)])
-        git_process.wait()
+        if self.store_dir is not None:
+            with locked(self.store_lock), self._store_commands() as commands:
+                for args in commands:
+                    runner.run(args, self.timeout, self.record, self.on_output)
+        for args in self._commands():
+            runner.run(args, self.timeout, self.record, self.on_output)
+
+    @BasePath.awrapped
+    async def afetch(self):
+        if self.store_dir is not None:
+            async with alocked(self.store_lock):
+                with self._store_commands() as commands:
+                    for args in commands:
+                        await runner.arun(args, self.timeout, self.record, self.on_output)
+        for args in self._commands():
+            await runner.arun(args, self.timeout, self.record, self.on_output)
+
+    @property
+    def url(self):
+        return self.protocol + str(self.path)
+
+    @property
+    def store(self):
+        """The repository of the remote inside store_dir, narrow repositories are kept apart as their files differ"""
+        key = self.url if not self.narrow else json.dumps([self.url, sorted(self.narrow)])
+        return Path(self.store_dir).joinpath(hashlib.sha1(key.encode()).hexdigest() + '.hg')
+
+    @property
+    def store_lock(self):
+        """The lock file which is held while the store is created or updated, fetches of the same remote in other
+        threads or processes wait for it
+        """
+        return self.store.with_name(self.store.name + '.lock')
+
+    @contextmanager
+    def _store_commands(self):
+        """Yields the hg commands which create or update the store, the store lock must be held.
+        A new store is cloned to a temporary directory which is only renamed to the store once the clone succeeded.
+        """
+        hg = self._hg()
+        if self.store.exists():
+            LOG.debug('Updating store %s of %s', self.store, self.url)
+            yield [hg + ['-R', str(self.store), 'pull'] + self._remote_args() + [self.url]]
+            return
+        LOG.debug('Creating store %s of %s', self.store, self.url)
+        with build_atomically(self.store) as partial:
+            yield [hg + ['clone', '-U'] + self._remote_args() + self._narrow_args() + [self.url, str(partial)]]
+
+    def _commands(self):
+        """Returns the hg commands which fetch the working copy to out_path.
+        Without a store_dir the remote is cloned directly. Otherwise a persistent repository of the remote is cloned
+        once and only updated with hg pull on later fetches (see _store_commands), the working copy is then created
+        with hg share so that it uses the history of the store instead of copying it. A working copy which is persisted
+        is not shared, as it would break once the store is deleted or stripped, it is a local clone of the store with
+        hardlinked history instead.
+        """
+        hg = self._hg()
+        # The revision to be checked out, by default the one hg chooses (the head of the default branch)
+        target = self.rev or self.branch
+        update = ['-u', target] if target else []
+        if self.store_dir is None:
+            clone = hg + ['clone'] + self._remote_args() + self._narrow_args() + update
+            return [clone + [self.url, str(self.out_path)]]
+        if self.persist_dir:
+            # A local clone does not keep the narrow spec of the store
+            return [hg + ['clone'] + self._narrow_args() + update + [str(self.store), str(self.out_path)]]
+        share = hg + ['--config', 'extensions.share=', 'share']
+        if not target:
+            return [share + [str(self.store), str(self.out_path)]]
+        return [share + ['-U', str(self.store), str(self.out_path)],
+                hg + ['-R', str(self.out_path), 'update', '-r', target]]
+
+    def _hg(self):
+        if self.narrow:
+            # Narrow repositories can only be used with the extension enabled
+            return [self._executable('hg'), '--config', 'extensions.narrow=']
+        return [self._executable('hg')]
+
+    def _remote_args(self):
+        """Returns the arguments that limit the changesets which are pulled from the remote repository"""
+        args = []
+        if self.rev is not None:
+            args += ['-r', self.rev]
+        if self.branch is not None:
+            args += ['-b', self.branch]
+        return args
+
+    def _narrow_args(self):
+        """Returns the arguments of a narrow clone, which only contains the files in the directories of narrow"""
+        if not self.narrow:
+            return []
+        return ['--narrow'] + [arg for include in self.narrow for arg in ['--include', include]]
@@ -1,31 +1,121 @@
+import logging
 import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
 from pathlib import Path
 from stat import S_ISDIR
+from time import perf_counter
 
+from anypath import archive
 from anypath.anypath import BasePath, pattern
 from anypath.dependencies import dependencies
+from anypath.remote import RemoteFileSystem, RemotePath
+from anypath.sync import Manifest, atomic_write
+
+LOG = logging.getLogger('anypath.pathprovider.sftp')
+
+
+class _SftpFileSystem(RemoteFileSystem):
+    """Lazy access to the files on the remote host via an SFTP client"""
+
+    def __init__(self, sftp, cache_dir, block_size):
+        super().__init__(cache_dir, block_size)
+        self.sftp = sftp
+        self.files = {}
+        self.file_lock = threading.Lock()
+
+    def _stat(self, path):
+        return self.sftp.stat(path)
+
+    def _listdir(self, path):
+        return [(entry.filename, entry) for entry in self.sftp.listdir_attr(path)]
+
+    def _read(self, path, offset, size):
+        with self.file_lock:
+            if path not in self.files:
+                self.files[path] = self.sftp.open(path, 'rb')
+            remote_file = self.files[path]
+            remote_file.seek(offset)
+            return remote_file.read(size)
+
+    def close(self):
+        for remote_file in self.files.values():
+            remote_file.close()
+        self.files = {}
+        self.sftp.close()
 
 
 @pattern('sftp://', 'ssh://')
 @dependencies('paramiko')
 class SftpPath(BasePath):
-    def __init__(self, protocol, path, persist_dir, password=None, private_key=None, port=22):
-        super().__init__(protocol, path, persist_dir)
+    def __init__(self, protocol, path, persist_dir, password=None, private_key=None, port=22, channels=4,
+                 chunk_size=256 * 1024, progress=None, sync=False, delete=False, lazy=False, block_size=1024 * 1024,
+                 extract=False, **options):
+        super().__init__(protocol, path, persist_dir, **options)
+        if sync and not persist_dir:
+            raise ValueError('sync requires a persist_dir to sync to')
+        if lazy and (persist_dir or sync):
+            raise ValueError('lazy can not be combined with persist_dir or sync')
+        if extract and (sync or lazy):
+            raise ValueError('extract can not be combined with sync or lazy')
+        if lazy and self.verifier is not None:
+            raise ValueError('lazy can not be combined with checksum, the files are never transferred as a whole')
         self.password = password
         self.port = port
         self.private_key = private_key
+        self.channels = channels
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.sync = sync
+        self.delete = delete
+        self.manifest = None
+        self.lazy = lazy
+        self.block_size = block_size
+        self.extract = extract
+        self.fs = None
+        if lazy:
+            # Only the blocks which are read are transferred, there is nothing that could be cached
+            self.cache = False
         # We expect self.path to be in the format user@host:/path/on/host
         self.username, host_and_path = str(self.path).split('@', 1)
         self.host, self.path = host_and_path.split(':', 1)
 
         self.sftp = None
         self.path = Path(self.path)
+        self.transport = None
+        # One SFTP client (and with it one channel on the transport) per transfer thread
+        self.local = threading.local()
+        self.clients = []
+        self.lock = threading.Lock()
+        self.stats = {'files': 0, 'bytes': 0, 'seconds': 0.0}
+        self.start = None
 
     @BasePath.wrapped
     def fetch(self, paramiko):
-        self.sftp = paramiko.SFTPClient.from_transport(self._connect(paramiko))
+        self.transport = self._connect(paramiko)
+        self.sftp = paramiko.SFTPClient.from_transport(self.transport)
+        if self.lazy:
+            self.fs = _SftpFileSystem(self.sftp, self.out_path, self.block_size)
+            self.out_path = RemotePath(self.fs, self.sftp.normalize(str(self.path)))
+            return
         self.sftp.chdir(str(self.path.parent))
-        self._walk(self.path)
+        if self.sync:
+            self.manifest = Manifest(self.out_path)
+        try:
+            if self.extract:
+                self._extract()
+            else:
+                self._transfer(paramiko)
+            if self.manifest is not None and self.delete:
+                self.manifest.delete_unseen()
+        finally:
+            if self.manifest is not None:
+                self.manifest.save()
+            for client in self.clients:
+                client.close()
+            self.clients = []
+            self.transport.close()
 
     def _connect(self, paramiko):
         """Connects to the host via ssh
@@ -53,19 +143,138 @@ class SftpPath(BasePath):
         if hostkeys.lookup(self.host) is None:
             raise Exception(f'No hostkey for host {self.host} found.')
 
+    def _transfer(self, paramiko):
+        """Walks through the remote path and fetches all found files.
+        Listing directories and downloading files are tasks which run on a pool of self.channels threads, each with
+        its own SFTP channel on the transport. Tasks return the follow-up tasks they discovered, so the walk goes on
+        concurrently until no tasks are left.
+        :param paramiko: The paramiko module
+        """
+        self.start = perf_counter()
+        with ThreadPoolExecutor(max_workers=self.channels) as executor:
+            pending = {executor.submit(self._list, paramiko, self.path)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for task in future.result():
+                        pending.add(executor.submit(*task))
+        self.stats['seconds'] = perf_counter() - self.start
+        self._count(self.stats['bytes'], self.stats['bytes'])
+        LOG.debug('Fetched %s files with %s bytes in %.3fs', self.stats['files'], self.stats['bytes'],
+                  self.stats['seconds'])
+
+    def _client(self, paramiko):
+        """Returns the SFTP client of the current thread"""
+        if not hasattr(self.local, 'sftp'):
+            self.local.sftp = paramiko.SFTPClient.from_transport(self.transport)
+            with self.lock:
+                self.clients.append(self.local.sftp)
+        return self.local.sftp
+
     # TODO: something nicer than replace first /
-    def _walk(self, path):
-        """Recursively walks through the remote path and fetches all found files
+    def _local(self, remote_path):
+        return self.out_path.joinpath(str(remote_path).replace('/', '', 1))
+
+    def _list(self, paramiko, path):
+        """Lists a remote directory
         :param paramiko: The paramiko module
+        :param path: The remote directory
+        :return: Tasks for listing the subdirectories and for fetching the files of the directory
         """
-        os.makedirs(self.out_path.joinpath(str(path).replace('/', '', 1)), exist_ok=True)
-        for entry in self.sftp.listdir_attr(str(path)):
+        os.makedirs(self._local(path), exist_ok=True)
+        tasks = []
+        for entry in self._client(paramiko).listdir_attr(str(path)):
             if S_ISDIR(entry.st_mode):
                 # Go a level deeper in the folder hierarchy
-                self._walk(path.joinpath(entry.filename))
-            else:
-                # If the element is a file, fetch it
-                self.get(path.joinpath(entry.filename))
+                tasks.append((self._list, paramiko, path.joinpath(entry.filename)))
+            elif self._changed(path.joinpath(entry.filename), entry):
+                # If the element is a new or changed file, fetch it
+                tasks.append((self._get, paramiko, path.joinpath(entry.filename), entry))
+        return tasks
+
+    def _changed(self, remote_path, entry):
+        if self.manifest is None:
+            return True
+        return self.manifest.changed(self._name(remote_path), entry.st_size, entry.st_mtime)
+
+    def _name(self, remote_path):
+        return self._local(remote_path).relative_to(self.out_path).as_posix()
+
+    def _get(self, paramiko, remote_path, entry):
+        self.get(remote_path, entry.st_size, self._client(paramiko))
+        if self.manifest is not None:
+            self.manifest.update(self._name(remote_path), entry.st_size, entry.st_mtime)
+        return []
+
+    def get(self, remote_path, size=None, sftp=None):
+        """Fetches a single remote file, its reads are pipelined via prefetching
+        :param remote_path: The path of the remote file
+        :param size: The size of the remote file if it is known
+        :param sftp: The SFTP client to be used, self.sftp if it is not given
+        """
+        sftp = sftp or self.sftp
+        name = self._name(remote_path)
+        hasher = self._hasher(name)
+        with sftp.open(str(remote_path), 'rb') as remote_file:
+            remote_file.prefetch(size)
+            with atomic_write(self._local(remote_path)) as local_file:
+                while True:
+                    data = remote_file.read(self.chunk_size)
+                    if not data:
+                        break
+                    local_file.write(data)
+                    if hasher is not None:
+                        hasher.update(data)
+                    self._report(len(data), 0)
+        self._hashed(name, hasher)
+        self._report(0, 1)
+
+    def _extract(self):
+        """Extracts the remote archive at self.path to out_path while it is transferred, the archive itself is not
+        written to disk. out_path becomes the directory of the extracted files.
+        """
+        self.start = perf_counter()
+        # A single checksum is the one of the archive
+        hasher = self._hasher()
+
+        def on_read(chunk):
+            if hasher is not None:
+                hasher.update(chunk)
+            self._report(len(chunk), 0)
+
+        with self.sftp.open(str(self.path), 'rb') as remote_file:
+            remote_file.prefetch(self.sftp.stat(str(self.path)).st_size)
+            chunks = iter(partial(remote_file.read, self.chunk_size), b'')
+            archive.extract(archive.IteratorReader(chunks, on_read), self.out_path)
+        self._hashed('', hasher)
+        self._report(0, 1)
+        self.stats['seconds'] = perf_counter() - self.start
+        self._count(self.stats['bytes'])
+        LOG.debug('Extracted %s bytes in %.3fs', self.stats['bytes'], self.stats['seconds'])
+
+    def close(self):
+        if self.fs is not None:
+            self.fs.close()
+            self.transport.close()
+            self.fs = None
+        super().close()
+
+    def _make_temp(self):
+        """In sync mode the files are fetched straight into persist_dir"""
+        if not self.sync:
+            return super()._make_temp()
+        self.out_path = Path(self.persist_dir).resolve()
+        self.out_path.mkdir(parents=True, exist_ok=True)
+
+    def _persist(self):
+        if not self.sync:
+            return super()._persist()
 
-    def get(self, remote_path):
-        self.sftp.get(str(remote_path), self.out_path.joinpath(str(remote_path).replace('/', '', 1)))
+    def _report(self, transferred, files):
+        with self.lock:
+            self.stats['bytes'] += transferred
+            self.stats['files'] += files
+            transferred, files = self.stats['bytes'], self.stats['files']
+        if self.progress is not None:
+            elapsed = perf_counter() - self.start if self.start else 0
+            self.progress(transferred, files, transferred / elapsed if elapsed > 0 else 0.0)
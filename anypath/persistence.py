@@ -0,0 +1,151 @@
+import logging
+import os
+import shutil
+from functools import partial
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOG = logging.getLogger('anypath.persistence')
+
+# ioctl request for cloning a file on filesystems with copy-on-write support (e.g. btrfs, xfs), see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+# Devices on which reflinks failed
+_NO_REFLINK = set()
+
+# All strategies in the order they are tried, from the cheapest to the most expensive one
+STRATEGIES = ('rename', 'hardlink', 'reflink', 'copy_file_range', 'copy')
+# Strategies which do not touch the source and can be used for files that are not owned by the PathProvider
+COPY_STRATEGIES = ('reflink', 'copy_file_range', 'copy')
+
+
+def persist(src: Path, dst: Path, strategies=STRATEGIES):
+    """Persists a file or directory tree from src to dst using the cheapest possible strategy.
+    'rename' moves src to dst in one step, which is only possible on the same filesystem and if dst does not exist
+    yet or is an empty directory. Otherwise every file is persisted on its own, via a hardlink, a reflink,
+    copy_file_range or a plain copy, whichever works first. 'rename' and 'hardlink' must only be used if src is a
+    temporary copy, as src is moved or shares its data with dst.
+    A directory which already holds files is replaced as a whole (see _replace), so that files which do not exist in
+    src anymore do not stay behind.
+    :param src: The fetched file or directory
+    :param dst: The path to persist it to
+    :param strategies: The strategies to try, in this order
+    """
+    if not src.is_dir() and dst.is_dir():
+        dst = dst.joinpath(src.name)
+    if src.is_dir() and dst.is_dir() and any(dst.iterdir()):
+        return _replace(src, dst, strategies)
+    if 'rename' in strategies and _rename(src, dst):
+        return
+    copy = partial(copy_file, strategies=strategies)
+    if src.is_dir():
+        shutil.copytree(str(src), str(dst), symlinks=True, copy_function=copy, dirs_exist_ok=True)
+    else:
+        copy(str(src), str(dst))
+
+
+def copy_file(src: str, dst: str, strategies=COPY_STRATEGIES):
+    """Copies a single file including its metadata, can be used as copy_function for shutil.copytree"""
+    for strategy in strategies:
+        if strategy in _FILE_STRATEGIES and _FILE_STRATEGIES[strategy](src, dst):
+            break
+    else:
+        raise ValueError(f'None of the strategies {strategies} can persist a file')
+    if strategy != 'hardlink':
+        shutil.copystat(src, dst)
+    return dst
+
+
+def _replace(src: Path, dst: Path, strategies):
+    """Persists src to a new directory next to dst, which then takes the place of dst. The old dst is renamed aside
+    right before and deleted afterwards, it is put back if the new directory can not be moved in.
+    """
+    staging = dst.with_name(f'.{dst.name}.{os.getpid()}.new')
+    old = dst.with_name(f'.{dst.name}.{os.getpid()}.old')
+    for leftover in (staging, old):
+        shutil.rmtree(leftover, ignore_errors=True)
+    try:
+        persist(src, staging, strategies)
+        os.rename(dst, old)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    try:
+        os.rename(staging, dst)
+    except BaseException:
+        os.rename(old, dst)
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    LOG.debug('Replaced the existing %s', dst)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _rename(src: Path, dst: Path):
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        # E.g. EXDEV if dst is on another filesystem or ENOTEMPTY if dst is a directory with files already
+        LOG.debug('Could not rename %s to %s: %s', src, dst, e.strerror)
+        return False
+    return True
+
+
+def _hardlink(src, dst):
+    tmp = f'{dst}.anypath-link'
+    try:
+        os.link(src, tmp)
+    except OSError:
+        return False
+    os.replace(tmp, dst)
+    return True
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        return False
+    with open(src, 'rb') as src_file:
+        device = os.fstat(src_file.fileno()).st_dev
+        if device in _NO_REFLINK:
+            return False
+        with open(dst, 'wb') as dst_file:
+            try:
+                fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+            except OSError:
+                # Remember filesystems without reflink support so that the remaining files are not tried again
+                _NO_REFLINK.add(device)
+                return False
+    return True
+
+
+def _copy_file_range(src, dst):
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        remaining = os.fstat(src_file.fileno()).st_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(src_file.fileno(), dst_file.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        except OSError:
+            return False
+    return True
+
+
+def _copy(src, dst):
+    shutil.copyfile(src, dst)
+    return True
+
+
+_FILE_STRATEGIES = {
+    'hardlink': _hardlink,
+    'reflink': _reflink,
+    'copy_file_range': _copy_file_range,
+    'copy': _copy,
+}
@@ -0,0 +1,230 @@
+import hashlib
+import io
+import logging
+import threading
+from abc import ABCMeta, abstractmethod
+from fnmatch import fnmatchcase
+from pathlib import Path, PurePosixPath
+from stat import S_ISDIR
+
+from anypath.sync import atomic_write
+
+LOG = logging.getLogger('anypath.remote')
+
+
+class RemoteFileSystem(metaclass=ABCMeta):
+    """Base class for remote filesystems which are accessed lazily via a RemotePath.
+    Metadata is cached in memory once it was listed, file contents are cached on disk in blocks of block_size, so
+    every block is transferred at most once.
+    :param cache_dir: The local directory for the block cache
+    :param block_size: The number of bytes that are transferred and cached at once
+    """
+
+    def __init__(self, cache_dir: Path, block_size: int = 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.attributes = {}
+        self.listings = {}
+        # Counters for transferred and cached blocks
+        self.blocks = {'transferred': 0, 'cached': 0}
+
+    @abstractmethod
+    def _stat(self, path: str):
+        """Returns the attributes of path with st_mode and st_size, raises FileNotFoundError if it does not exist"""
+        pass
+
+    @abstractmethod
+    def _listdir(self, path: str):
+        """Returns a list of (name, attributes) for all entries of the directory path"""
+        pass
+
+    @abstractmethod
+    def _read(self, path: str, offset: int, size: int):
+        """Returns up to size bytes of path starting at offset"""
+        pass
+
+    def close(self):
+        pass
+
+    def stat(self, path: str):
+        with self.lock:
+            if path in self.attributes:
+                return self.attributes[path]
+        attributes = self._stat(path)
+        with self.lock:
+            self.attributes[path] = attributes
+        return attributes
+
+    def listdir(self, path: str):
+        with self.lock:
+            if path in self.listings:
+                return self.listings[path]
+        entries = self._listdir(path)
+        with self.lock:
+            self.listings[path] = [name for name, _ in entries]
+            for name, attributes in entries:
+                self.attributes[str(PurePosixPath(path, name))] = attributes
+        return self.listings[path]
+
+    def read(self, path: str, offset: int, size: int):
+        """Reads a byte range of a remote file, only blocks that were not read before are transferred"""
+        end = min(offset + size, self.stat(path).st_size)
+        data = bytearray()
+        position = offset
+        while position < end:
+            index = position // self.block_size
+            start = position - index * self.block_size
+            chunk = self._block(path, index)[start:start + end - position]
+            if not chunk:
+                break
+            data += chunk
+            position += len(chunk)
+        return bytes(data)
+
+    def _block(self, path: str, index: int):
+        cached = self.cache_dir.joinpath(hashlib.sha1(path.encode()).hexdigest(), str(index))
+        try:
+            block = cached.read_bytes()
+            self.blocks['cached'] += 1
+            return block
+        except FileNotFoundError:
+            pass
+        LOG.debug('Transferring block %s of %s', index, path)
+        block = self._read(path, index * self.block_size, self.block_size)
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_write(cached) as f:
+            f.write(block)
+        self.blocks['transferred'] += 1
+        return block
+
+
+class RemotePath:
+    """A path on a remote filesystem that offers the reading part of the pathlib.Path interface.
+    Nothing is transferred until a file is read, then only the blocks that are read are transferred.
+    :param fs: The RemoteFileSystem the path belongs to
+    :param path: The absolute remote path
+    """
+
+    def __init__(self, fs: RemoteFileSystem, path):
+        self.fs = fs
+        self.path = PurePosixPath(path)
+
+    def __str__(self):
+        return str(self.path)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({str(self.path)!r})'
+
+    def __eq__(self, other):
+        return isinstance(other, RemotePath) and self.fs is other.fs and self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __truediv__(self, other):
+        return self.joinpath(other)
+
+    def joinpath(self, *other):
+        return RemotePath(self.fs, self.path.joinpath(*other))
+
+    @property
+    def name(self):
+        return self.path.name
+
+    @property
+    def suffix(self):
+        return self.path.suffix
+
+    @property
+    def parent(self):
+        return RemotePath(self.fs, self.path.parent)
+
+    def stat(self):
+        return self.fs.stat(str(self.path))
+
+    def exists(self):
+        try:
+            self.stat()
+        except FileNotFoundError:
+            return False
+        return True
+
+    def is_dir(self):
+        return self.exists() and S_ISDIR(self.stat().st_mode)
+
+    def is_file(self):
+        return self.exists() and not S_ISDIR(self.stat().st_mode)
+
+    def iterdir(self):
+        for name in self.fs.listdir(str(self.path)):
+            yield self.joinpath(name)
+
+    def glob(self, pattern: str):
+        """Yields all paths matching pattern relative to this path, '**' matches this and all subdirectories"""
+        paths = [self]
+        for part in pattern.split('/'):
+            if part == '**':
+                paths = [path for directory in paths for path in directory._walk()]
+            else:
+                paths = [child for directory in paths if directory.is_dir()
+                         for child in directory.iterdir() if fnmatchcase(child.name, part)]
+        yield from paths
+
+    def rglob(self, pattern: str):
+        yield from self.glob(f'**/{pattern}')
+
+    def _walk(self):
+        yield self
+        for child in self.iterdir():
+            if child.is_dir():
+                yield from child._walk()
+
+    def open(self, mode: str = 'r', encoding: str = None, errors: str = None, newline: str = None):
+        if mode not in ('r', 'rb', 'rt'):
+            raise ValueError(f'Remote paths can only be opened for reading, not with mode {mode!r}')
+        buffered = io.BufferedReader(RemoteFile(self), buffer_size=self.fs.block_size)
+        if mode == 'rb':
+            return buffered
+        return io.TextIOWrapper(buffered, encoding=encoding, errors=errors, newline=newline)
+
+    def read_bytes(self):
+        with self.open('rb') as f:
+            return f.read()
+
+    def read_text(self, encoding: str = None, errors: str = None):
+        with self.open('r', encoding=encoding, errors=errors) as f:
+            return f.read()
+
+
+class RemoteFile(io.RawIOBase):
+    """A seekable, read-only file object reading from the block cache of a RemoteFileSystem"""
+
+    def __init__(self, path: RemotePath):
+        super().__init__()
+        self.path = path
+        self.size = path.stat().st_size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def readinto(self, buffer):
+        data = self.path.fs.read(str(self.path), self.position, len(buffer))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
@@ -0,0 +1,159 @@
+import logging
+import os
+import signal
+import subprocess
+import threading
+from collections import deque
+from time import perf_counter
+
+from anypath import instrumentation
+
+LOG = logging.getLogger('anypath.runner')
+
+# The maximum number of subprocesses of PathProviders (e.g. git clone) which run at the same time in this process
+DEFAULT_LIMIT = 8
+# Lines of output kept for the message of a ProcessError
+TAIL_LINES = 50
+
+_slots = threading.BoundedSemaphore(DEFAULT_LIMIT)
+limit = DEFAULT_LIMIT
+
+
+class ProcessError(Exception):
+    """Raised if a subprocess of a PathProvider exits with an error
+    :param command: The command that was run
+    :param returncode: Its exit code
+    :param output: The last lines of its output (stdout and stderr)
+    """
+
+    def __init__(self, command: list, returncode: int, output: str):
+        self.command = command
+        self.returncode = returncode
+        self.output = output
+        super().__init__(f'{" ".join(map(str, command))} {self._reason()}:\n{output}')
+
+    def _reason(self):
+        return f'exited with {self.returncode}'
+
+
+class ProcessTimeout(ProcessError):
+    """Raised if a subprocess of a PathProvider did not finish within its timeout, it was killed with all its children"""
+
+    def _reason(self):
+        return 'timed out'
+
+
+def set_limit(new_limit: int):
+    """Sets the maximum number of concurrent subprocesses, running subprocesses keep their slot until they finish"""
+    global _slots, limit
+    _slots = threading.BoundedSemaphore(new_limit)
+    limit = new_limit
+
+
+def run(command: list, timeout: float = None, record=None, on_output=None):
+    """Runs a command once one of the limited slots is free.
+    Its output is read by a thread while it runs, so a chatty process can not block on a full pipe.
+    :param command: The command, e.g. ['git', 'clone', url, path]
+    :param timeout: Seconds after which the process and all processes it started are killed, None to wait forever
+    :param record: The FetchRecord of the running fetch, the time waited for a slot is recorded as phase queue
+    :param on_output: Called with every line of output (stdout and stderr), e.g. to show the progress of a clone
+    :raises ProcessError: If the command exits with an error
+    :raises ProcessTimeout: If the command did not finish within timeout
+    """
+    slots = _slots
+    with instrumentation.phase(record, 'queue'):
+        slots.acquire()
+    try:
+        start = perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+        output = deque(maxlen=TAIL_LINES)
+        reader = threading.Thread(target=_read, args=(process.stdout, output, on_output), daemon=True)
+        reader.start()
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            _kill(process)
+            process.wait()
+            raise ProcessTimeout(command, process.returncode, _joined(output, reader))
+        except BaseException:
+            # E.g. KeyboardInterrupt, the process must not outlive the fetch
+            _kill(process)
+            raise
+        _check(command, process.returncode, output, reader, start)
+    finally:
+        slots.release()
+
+
+async def arun(command: list, timeout: float = None, record=None, on_output=None):
+    """The asynchronous variant of run, cancelling it kills the process"""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    slots = _slots
+    with instrumentation.phase(record, 'queue'):
+        acquired = loop.run_in_executor(None, slots.acquire)
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            # The slot is still acquired on the executor, it is freed as soon as it is
+            acquired.add_done_callback(lambda _: slots.release())
+            raise
+    try:
+        start = perf_counter()
+        process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.STDOUT, start_new_session=True)
+        output = deque(maxlen=TAIL_LINES)
+        try:
+            await asyncio.wait_for(_aread(process, output, on_output), timeout)
+        except asyncio.TimeoutError:
+            _kill(process)
+            await process.wait()
+            raise ProcessTimeout(command, process.returncode, '\n'.join(output))
+        except BaseException:
+            _kill(process)
+            raise
+        _check(command, process.returncode, output, None, start)
+    finally:
+        slots.release()
+
+
+def _read(stream, output: deque, on_output):
+    with stream:
+        for line in stream:
+            _line(line, output, on_output)
+
+
+async def _aread(process, output: deque, on_output):
+    async for line in process.stdout:
+        _line(line, output, on_output)
+    await process.wait()
+
+
+def _line(line: bytes, output: deque, on_output):
+    line = line.decode(errors='replace').rstrip()
+    output.append(line)
+    if on_output is not None:
+        on_output(line)
+
+
+def _joined(output: deque, reader: threading.Thread):
+    if reader is not None:
+        reader.join()
+    return '\n'.join(output)
+
+
+def _check(command: list, returncode: int, output: deque, reader, start: float):
+    output = _joined(output, reader)
+    LOG.debug('%s exited with %s after %.3fs', command[:2], returncode, perf_counter() - start)
+    if returncode != 0:
+        raise ProcessError(command, returncode, output)
+
+
+def _kill(process):
+    """Kills the process and all processes it started (e.g. git-remote-https), they share its process group"""
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
@@ -0,0 +1,173 @@
+import json
+import logging
+import threading
+
+from anypath.anypath import AnyPath
+from anypath.cache import normalize
+
+LOG = logging.getLogger('anypath.scheduler')
+
+
+class SharedFetch:
+    """A single fetch of a resource which is shared by all callers that request it while it is in use
+    :param key: The key of the resource in the scheduler
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.fetcher = None
+        self.path = None
+        # The result of the post-processing function, if one was given
+        self.result = None
+        self.exception = None
+        self.done = threading.Event()
+        # Number of leases which have not been closed yet
+        self.refs = 0
+
+
+class Lease:
+    """A reference to a shared fetch, returned by FetchScheduler.open.
+    It is used like a single AnyPath: the resource is fetched (or awaited) on fetch/__enter__, and released on
+    close/__exit__. The temporary files are deleted once the last lease of the fetch is released.
+    """
+
+    def __init__(self, scheduler, key: str, uri: str, persist_dir: str, process, options: dict):
+        self.scheduler = scheduler
+        self.key = key
+        self.uri = uri
+        self.persist_dir = persist_dir
+        self.process = process
+        self.options = options
+        self.shared = None
+
+    @property
+    def result(self):
+        """The result of the post-processing function, None if no function was given"""
+        return None if self.shared is None else self.shared.result
+
+    def fetch(self):
+        if self.shared is None:
+            self.shared = self.scheduler._acquire(self)
+        shared = self.shared
+        shared.done.wait()
+        if shared.exception is not None:
+            self.close()
+            raise shared.exception
+        return shared.path
+
+    def close(self):
+        if self.shared is not None:
+            self.scheduler._release(self.shared)
+            self.shared = None
+
+    def __enter__(self):
+        return self.fetch()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FetchScheduler:
+    """Coalesces concurrent fetches of the same resource, e.g. of the worker threads of a service.
+    The first caller fetches the resource on its thread, all callers which request the same uri with the same options
+    while it is in use wait for that fetch and share its path. The temporary files are deleted when the last caller
+    released it, a later request fetches the resource again (or restores it from a FetchCache).
+    CPU heavy work, i.e. hashing files on disk for a checksum and the post-processing function, runs on a process pool.
+    Usage example:
+    with FetchScheduler(processes=4) as scheduler:
+        with scheduler.open('https://example.org/data.tar.gz', extract=True) as path: ...
+    :param processes: The number of processes of the pool, None for the number of CPUs
+    """
+
+    def __init__(self, processes: int = None):
+        self.processes = processes
+        self.lock = threading.Lock()
+        # The fetches that are running or in use, by key
+        self.shared = {}
+        self.executor = None
+        self.stats = {'fetches': 0, 'coalesced': 0}
+
+    @staticmethod
+    def key(uri: str, persist_dir: str, process, options: dict):
+        """Returns the key under which fetches are coalesced.
+        Options which are not JSON serializable (e.g. progress callbacks) and the post-processing function are
+        compared by identity, so callers only share a fetch if they pass the same objects.
+        """
+        return json.dumps([normalize(uri), persist_dir, options, id(process) if process else None],
+                          sort_keys=True, default=id)
+
+    def open(self, uri: str, persist_dir: str = None, process=None, **options):
+        """Returns a Lease for a resource, it is fetched when the lease is entered
+        :param uri: The path to be fetched, e.g. 'http://example.org'
+        :param persist_dir: Passed to AnyPath
+        :param process: A picklable function which is called with the fetched path in the process pool once per fetch,
+        its return value is available as lease.result, e.g. to parse or index the fetched files
+        :param options: The options for the PathProvider
+        """
+        return Lease(self, self.key(uri, persist_dir, process, options), uri, persist_dir, process, options)
+
+    def _acquire(self, lease: Lease):
+        with self.lock:
+            shared = self.shared.get(lease.key)
+            owner = shared is None
+            if owner:
+                shared = self.shared[lease.key] = SharedFetch(lease.key)
+                self.stats['fetches'] += 1
+            else:
+                self.stats['coalesced'] += 1
+            shared.refs += 1
+        if owner:
+            self._fetch(shared, lease)
+        else:
+            LOG.debug('Waiting for the running fetch of %s', lease.uri)
+        return shared
+
+    def _fetch(self, shared: SharedFetch, lease: Lease):
+        try:
+            shared.fetcher = AnyPath(lease.uri, lease.persist_dir, **lease.options)
+            if shared.fetcher.verifier is not None:
+                shared.fetcher.executor = self._executor()
+            shared.path = shared.fetcher.fetch()
+            if lease.process is not None:
+                shared.result = self._executor().submit(lease.process, shared.path).result()
+        except BaseException as e:
+            # Also e.g. NotInstalledError or KeyboardInterrupt, which are raised for all callers by Lease.fetch
+            LOG.debug('Could not fetch %s: %s', lease.uri, e)
+            shared.exception = e
+            with self.lock:
+                # Later requests try again instead of getting the same exception
+                if self.shared.get(shared.key) is shared:
+                    del self.shared[shared.key]
+        finally:
+            shared.done.set()
+
+    def _release(self, shared: SharedFetch):
+        with self.lock:
+            shared.refs -= 1
+            if shared.refs > 0:
+                return
+            if self.shared.get(shared.key) is shared:
+                del self.shared[shared.key]
+        if shared.fetcher is not None:
+            LOG.debug('Last lease released, cleaning up %s', shared.fetcher.uri)
+            shared.fetcher.close()
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self.executor = ProcessPoolExecutor(max_workers=self.processes)
+            return self.executor
+
+    def shutdown(self):
+        """Shuts down the process pool, fetches which are still in use are not affected"""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
@@ -0,0 +1,241 @@
+import atexit
+import errno
+import hashlib
+import logging
+import os
+import queue
+import re
+import shutil
+import socket
+import threading
+from pathlib import Path
+from tempfile import gettempdir, mkdtemp
+from uuid import uuid4
+
+from anypath.instrumentation import disk_usage
+
+LOG = logging.getLogger('anypath.scratch')
+
+# Temporary directories and the ones waiting for deletion are named with the PID of their process
+PREFIX = 'anypath-'
+TRASH_PREFIX = '.anypath-trash-'
+_OWNED = re.compile(rf'^(?:{re.escape(PREFIX)}|{re.escape(TRASH_PREFIX)})(\d+)-')
+# An empty file which is created in every temporary directory, its name ends with the host and the boot it was created
+# on. Only directories with a marker of this host whose process does not run anymore are swept, a directory is never
+# deleted just because of its name. It is empty so that it does not count to disk usage.
+OWNER = '.anypath-owner-'
+BOOT_ID = '/proc/sys/kernel/random/boot_id'
+
+_default = None
+_default_lock = threading.Lock()
+
+
+class ScratchSpaceFull(OSError):
+    """Raised if a fetch needs a temporary directory but its ScratchSpace exceeds its quota"""
+    pass
+
+
+class ScratchSpace:
+    """Manages the temporary directories of fetches below a root directory.
+    Directories of closed fetches are renamed right away and deleted by a background thread, so that closing a fetch of
+    a large tree does not block. Directories left behind by crashed processes are deleted when the ScratchSpace is
+    created, the ones in other directories (e.g. next to persist_dir) when the first directory is created there.
+    Usage example: AnyPath('https://example.org/small.json', scratch=ScratchSpace('/dev/shm/anypath', quota=2 ** 30))
+    :param root: The directory in which temporary directories are created, the system temp dir if it is None
+    :param quota: The maximum number of bytes fetched into the root, None for no limit. Fetches are accounted once they
+    finished, a fetch is refused (or sent to fallback) if the quota is exceeded when it starts
+    :param fallback: The ScratchSpace that is used while this one exceeds its quota, e.g. a large disk for a tmpfs
+    :param sweep: Whether directories of processes which do not run anymore are deleted
+    """
+
+    def __init__(self, root: str = None, quota: int = None, fallback=None, sweep: bool = True):
+        self.root = Path(root or gettempdir()).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.quota = quota
+        self.fallback = fallback
+        self.lock = threading.Lock()
+        # Bytes in the temporary directories in use, by directory. Directories are measured once their fetch finished
+        self.usage = {}
+        # Bytes in directories which wait for deletion
+        self.pending = 0
+        self.queue = queue.Queue()
+        self.thread = None
+        self.sweeping = sweep
+        # The directories other than the root in which temporary directories were created, they are swept once
+        self.roots = set()
+        if sweep:
+            self.sweep()
+
+    def create(self, root: str = None):
+        """Creates a temporary directory for a fetch
+        :param root: A directory to create it in instead of the root of the ScratchSpace, e.g. next to persist_dir
+        :return: The path of the directory
+        :raises ScratchSpaceFull: If the quota is exceeded and there is no fallback
+        """
+        if root is None and self.quota is not None and self.used() >= self.quota:
+            if self.fallback is not None:
+                LOG.debug('%s exceeds its quota, using %s', self.root, self.fallback.root)
+                return self.fallback.create()
+            raise ScratchSpaceFull(errno.ENOSPC, f'Scratch space {self.root} exceeds its quota of {self.quota} bytes')
+        if root is not None:
+            self._sweep_once(Path(root).resolve())
+        td = mkdtemp(prefix=f'{PREFIX}{os.getpid()}-', dir=str(root or self.root))
+        try:
+            Path(td).joinpath(_marker()).touch()
+        except BaseException:
+            shutil.rmtree(td, ignore_errors=True)
+            raise
+        with self.lock:
+            self.usage[td] = 0
+        return td
+
+    def measure(self, td: str):
+        """Accounts the bytes in a temporary directory to the quota, e.g. once its fetch finished
+        :return: The bytes in the directory
+        """
+        size = disk_usage(td)
+        with self.lock:
+            if td in self.usage:
+                self.usage[td] = size
+                return size
+        if self.fallback is not None:
+            return self.fallback.measure(td)
+        return size
+
+    def used(self):
+        """Returns the bytes in the temporary directories of this process, including the ones waiting for deletion"""
+        with self.lock:
+            return sum(self.usage.values()) + self.pending
+
+    def release(self, td: str):
+        """Deletes a temporary directory. Directories in the root are renamed and deleted in the background, others
+        (e.g. next to persist_dir, which are empty after persisting) are deleted right away.
+        """
+        with self.lock:
+            owned = td in self.usage
+            size = self.usage.pop(td, 0)
+        if not owned and self.fallback is not None:
+            return self.fallback.release(td)
+        if Path(td).parent != self.root:
+            shutil.rmtree(td, onerror=_log_error)
+            return
+        trash = self.root.joinpath(f'{TRASH_PREFIX}{os.getpid()}-{uuid4().hex}')
+        try:
+            os.rename(td, trash)
+        except FileNotFoundError:
+            return
+        self._delete_later(trash, size)
+
+    def sweep(self, directory: Path = None):
+        """Deletes the temporary directories of processes which do not run anymore, e.g. after a crash.
+        Only directories with an owner marker of this host are deleted, see _orphaned.
+        :param directory: The directory to be swept, the root if it is None
+        :return: The number of directories which are deleted
+        """
+        if os.name != 'posix':
+            # Whether a process runs is checked with signal 0, which only exists on POSIX
+            return 0
+        swept = 0
+        for entry in os.scandir(directory or self.root):
+            match = _OWNED.match(entry.name)
+            if match is None or not entry.is_dir(follow_symlinks=False):
+                continue
+            if not _orphaned(entry.path, int(match.group(1))):
+                continue
+            LOG.debug('Deleting orphaned temporary directory %s', entry.path)
+            self._delete_later(Path(entry.path), 0)
+            swept += 1
+        return swept
+
+    def _sweep_once(self, directory: Path):
+        """Sweeps a directory other than the root the first time a temporary directory is created in it"""
+        with self.lock:
+            if not self.sweeping or directory == self.root or directory in self.roots:
+                return
+            self.roots.add(directory)
+        try:
+            self.sweep(directory)
+        except OSError as e:
+            LOG.warning('Could not sweep %s: %s', directory, e)
+
+    def flush(self):
+        """Waits until all directories waiting for deletion are deleted"""
+        self.queue.join()
+
+    def _delete_later(self, path: Path, size: int):
+        with self.lock:
+            self.pending += size
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._delete, name='anypath-scratch', daemon=True)
+                self.thread.start()
+                # The thread is a daemon, pending deletions are finished when the interpreter exits
+                atexit.register(self.flush)
+        self.queue.put((path, size))
+
+    def _delete(self):
+        while True:
+            path, size = self.queue.get()
+            try:
+                shutil.rmtree(path, onerror=_log_error)
+            finally:
+                with self.lock:
+                    self.pending -= size
+                self.queue.task_done()
+
+
+def default():
+    """Returns the ScratchSpace in the system temp dir, which is used if no other one is configured"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = ScratchSpace()
+        return _default
+
+
+def _host_marker():
+    """Returns the start of the names of the owner markers of this host"""
+    return f'{OWNER}{hashlib.sha1(socket.gethostname().encode()).hexdigest()[:16]}-'
+
+
+def _marker():
+    """Returns the name of the owner marker of this process, it ends with the boot id on Linux, which tells PIDs of
+    earlier boots apart
+    """
+    try:
+        with open(BOOT_ID) as f:
+            boot = f.read().strip()
+    except OSError:
+        boot = 'unknown'
+    return _host_marker() + boot
+
+
+def _orphaned(path: str, pid: int):
+    """Checks if a temporary directory was created by a process of this host which does not run anymore.
+    Directories without an owner marker (e.g. of the user, or of a process that crashed before creating it) and the
+    ones of other hosts are never orphaned.
+    :param pid: The PID in the name of the directory
+    """
+    try:
+        names = [name for name in os.listdir(path) if name.startswith(_host_marker())]
+    except OSError:
+        return False
+    if not names:
+        return False
+    # With a marker of an earlier boot of this host the PID may have been reused since
+    return _marker() not in names or not _running(pid)
+
+
+def _running(pid: int):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process runs as another user
+        return True
+    return True
+
+
+def _log_error(function, path, exc_info):
+    if not issubclass(exc_info[0], FileNotFoundError):
+        LOG.warning('Could not delete temporary file %s: %s', path, exc_info[1])
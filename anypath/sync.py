@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOG = logging.getLogger('anypath.sync')
+
+MANIFEST = '.anypath-manifest.json'
+
+
+class Manifest:
+    """Records the size and modification time of every file synced to a directory.
+    It is stored inside the directory, so that the next sync only has to transfer the files that changed since.
+    :param root: The directory the files are synced to
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.path = self.root.joinpath(MANIFEST)
+        self.lock = threading.Lock()
+        try:
+            self.entries = json.loads(self.path.read_text())
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+        # Files which were found in the source during the current sync
+        self.seen = set()
+        # Whether entries changed since the manifest was read, it is only written then
+        self.modified = False
+
+    def changed(self, name: str, size: int, mtime: float):
+        """Checks if a file has to be transferred and marks it as seen
+        :param name: The path of the file relative to root
+        :param size: The size of the source file
+        :param mtime: The modification time of the source file
+        """
+        with self.lock:
+            self.seen.add(name)
+            return self.entries.get(name) != [size, mtime] or not os.path.exists(os.path.join(self.root, name))
+
+    def update(self, name: str, size: int, mtime: float):
+        with self.lock:
+            self.entries[name] = [size, mtime]
+            self.modified = True
+
+    def delete_unseen(self):
+        """Deletes all files that were synced before but were not found in the source anymore"""
+        for name in set(self.entries) - self.seen:
+            LOG.debug('Deleting %s which does not exist in the source anymore', name)
+            try:
+                self.root.joinpath(name).unlink()
+            except FileNotFoundError:
+                pass
+            del self.entries[name]
+            self.modified = True
+
+    def save(self):
+        with self.lock:
+            if not self.modified:
+                return
+            # json.dumps encodes in C, json.dump in Python
+            data = json.dumps(self.entries)
+            with atomic_write(self.path, 'w') as f:
+                f.write(data)
+            self.modified = False
+
+
+@contextmanager
+def atomic_write(path: Path, mode: str = 'wb'):
+    """Opens a temporary file next to path for writing, it replaces path only if it was written completely.
+    Usage example: with atomic_write(path) as f: f.write(data)
+    :param path: The path of the file to be written
+    :param mode: The mode for opening the file
+    """
+    path = Path(path)
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.part')
+    try:
+        with open(tmp, mode) as f:
+            yield f
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    os.replace(tmp, path)
+
+
+def _lock(path: Path):
+    """Opens the lock file and blocks until the exclusive lock on it is held
+    :return: The open lock file, None without fcntl
+    """
+    if fcntl is None:
+        return None
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    except BaseException:
+        lock_file.close()
+        raise
+    return lock_file
+
+
+def _unlock(lock_file):
+    if lock_file is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+@contextmanager
+def locked(path: Path):
+    """Holds an exclusive lock on a lock file, which excludes other threads and processes that lock the same file, e.g.
+    while a persistent repository is updated. Without fcntl (e.g. on Windows) nothing is locked.
+    :param path: The lock file, it is created if it does not exist
+    """
+    lock_file = _lock(Path(path))
+    try:
+        yield
+    finally:
+        _unlock(lock_file)
+
+
+@asynccontextmanager
+async def alocked(path: Path):
+    """Like locked, the lock is awaited in a thread so that the event loop is not blocked"""
+    future = asyncio.get_running_loop().run_in_executor(None, _lock, Path(path))
+    try:
+        lock_file = await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # The thread still takes the lock, it is released once it has it
+        future.add_done_callback(lambda f: f.cancelled() or f.exception() or _unlock(f.result()))
+        raise
+    try:
+        yield
+    finally:
+        _unlock(lock_file)
+
+
+@contextmanager
+def build_atomically(path: Path):
+    """Yields a temporary path next to path for building a directory, which is moved to path once it is complete.
+    It is deleted if building it fails, a leftover of a build that was killed is deleted before. The caller must hold a
+    lock for path, see locked.
+    Usage example: with build_atomically(path) as partial: clone(url, partial)
+    :param path: The directory to be built, it must not exist
+    """
+    path = Path(path)
+    partial = path.with_name(f'.{path.name}.partial')
+    shutil.rmtree(partial, ignore_errors=True)
+    try:
+        yield partial
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    os.rename(partial, path)
@@ -0,0 +1,44 @@
+"""Measures the cost of resolving a path to its PathProvider depending on the number of registered patterns.
+The linear scan over the registry, which AnyPath used before, is measured for comparison.
+Usage: python -m benchmarks.bench_dispatch [--lookups N]
+"""
+import argparse
+from timeit import timeit
+
+from anypath.anypath import BasePath, _Provider, pattern
+
+COUNTS = [8, 32, 128, 512]
+
+
+def linear_scan(registry, path):
+    for protocol, provider in registry.items():
+        if path.startswith(protocol):
+            return protocol, provider
+
+
+def create_provider(count):
+    provider = _Provider()
+    for i in range(count):
+        provider.add(pattern(f'scheme{i}://', f'scheme{i}+https://')(type(f'Path{i}', (BasePath,), {})))
+    return provider
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lookups', type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f'{"patterns":>9}{"linear us":>11}{"trie us":>9}{"cached us":>11}')
+    for count in COUNTS:
+        provider = create_provider(count // 2)
+        # The last registered pattern is the worst case for the linear scan
+        paths = [f'scheme{count // 2 - 1}+https://host{i}/path' for i in range(args.lookups)]
+        linear = timeit(lambda: [linear_scan(provider.registry, path) for path in paths], number=1)
+        trie = timeit(lambda: [provider.trie.longest_match(path) for path in paths], number=1)
+        cached = timeit(lambda: [provider.resolve(path) for path in paths], number=1)
+        print(f'{count:>9}{linear / args.lookups * 1e6:>11.3f}{trie / args.lookups * 1e6:>9.3f}'
+              f'{cached / args.lookups * 1e6:>11.3f}')
+
+
+if __name__ == '__main__':
+    main()
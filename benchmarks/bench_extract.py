@@ -0,0 +1,56 @@
+"""Compares downloading an archive and extracting it afterwards with extracting it while it is downloaded.
+Usage: python -m benchmarks.bench_extract [--dir DIR]
+The archives are served from and extracted inside DIR (default: the temp directory).
+"""
+import argparse
+import tarfile
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from anypath.anypath import AnyPath, path_provider
+from anypath.pathprovider.http import HttpPath
+from benchmarks.datasets import create_tree
+from benchmarks.servers import HttpServer, file_handler
+
+# name: (number of files, size of each file in bytes)
+DATASETS = {'many-small': (5000, 4 * 1024), 'few-large': (8, 64 * 1024 * 1024)}
+
+
+def download_then_extract(url, dst):
+    with AnyPath(url, cache=False) as path:
+        with tarfile.open(str(path)) as tar:
+            tar.extractall(str(dst))
+
+
+def extract_while_downloading(url, dst):
+    AnyPath(url, persist_dir=str(dst), cache=False, extract=True).fetch()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dir', default=None)
+    args = parser.parse_args()
+
+    path_provider.add(HttpPath)
+    print(f'{"dataset":<12}{"archive MiB":>12}{"mode":>28}{"seconds":>10}')
+    for name, (files, size) in DATASETS.items():
+        with TemporaryDirectory(dir=args.dir) as td:
+            served = Path(td).joinpath('served')
+            served.mkdir()
+            tree = create_tree(Path(td).joinpath('tree'), files, size)
+            with tarfile.open(str(served.joinpath('data.tar.gz')), 'w:gz', compresslevel=1) as tar:
+                tar.add(str(tree), arcname='data')
+            archive_size = served.joinpath('data.tar.gz').stat().st_size / 2 ** 20
+            with HttpServer(file_handler(served)) as url:
+                for mode in [download_then_extract, extract_while_downloading]:
+                    dst = Path(td).joinpath(mode.__name__)
+                    start = perf_counter()
+                    mode(f'{url}/data.tar.gz', dst)
+                    elapsed = perf_counter() - start
+                    print(f'{name:<12}{archive_size:>12.1f}{mode.__name__:>28}{elapsed:>10.3f}')
+    path_provider.shutdown()
+
+
+if __name__ == '__main__':
+    main()
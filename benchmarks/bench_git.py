@@ -0,0 +1,49 @@
+"""Compares the latency of repeated GitPath fetches with a full clone and with a persistent mirror (mirror_dir).
+The remotes are local bare repositories of different sizes which get one new commit before every repeated fetch.
+Usage: python -m benchmarks.bench_git [--repeats N]
+"""
+import argparse
+from pathlib import Path
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from anypath.anypath import AnyPath, path_provider
+from anypath.pathprovider.git import GitPath
+from benchmarks.repos import GitRepo
+
+# (number of files, size of each file in bytes, number of commits)
+SHAPES = [(100, 1024, 10), (2000, 4096, 50), (10000, 16384, 100)]
+
+
+def run(repo, repeats, **options):
+    timings = []
+    for _ in range(repeats):
+        repo.commit({'changing.txt': str(perf_counter())})
+        start = perf_counter()
+        with AnyPath(repo.uri, **options):
+            timings.append(perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    path_provider.add(GitPath)
+    print(f'{"files":>8}{"file KiB":>10}{"commits":>9}{"mode":>16}{"first s":>10}{"repeat s":>10}')
+    for files, size, commits in SHAPES:
+        with TemporaryDirectory() as td:
+            repo = GitRepo.create(Path(td).joinpath('remote.git'), files, size, commits)
+            modes = [('clone', {}),
+                     ('mirror', {'mirror_dir': str(Path(td).joinpath('mirrors'))}),
+                     ('mirror+shallow', {'mirror_dir': str(Path(td).joinpath('shallow')), 'depth': 1})]
+            for mode, options in modes:
+                timings = run(repo, args.repeats + 1, **options)
+                print(f'{files:>8}{size / 1024:>10.0f}{commits:>9}{mode:>16}{timings[0]:>10.3f}'
+                      f'{median(timings[1:]):>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
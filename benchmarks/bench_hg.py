@@ -0,0 +1,51 @@
+"""Compares the latency of repeated HgPath fetches with a full clone and with a persistent store (store_dir).
+The remotes are local repositories of different sizes, served with hg serve, which get one new changeset before every
+repeated fetch.
+Usage: python -m benchmarks.bench_hg [--repeats N]
+"""
+import argparse
+from pathlib import Path
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from anypath.anypath import AnyPath, path_provider
+from anypath.pathprovider.mercurial import HgPath
+from benchmarks.repos import HgRepo
+
+# (number of files, size of each file in bytes, number of commits)
+SHAPES = [(100, 1024, 10), (2000, 4096, 50), (10000, 16384, 100)]
+
+
+def run(repo, uri, repeats, **options):
+    timings = []
+    for _ in range(repeats):
+        repo.commit({'changing.txt': str(perf_counter())})
+        start = perf_counter()
+        with AnyPath(uri, **options):
+            timings.append(perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    path_provider.add(HgPath)
+    print(f'{"files":>8}{"file KiB":>10}{"commits":>9}{"mode":>14}{"first s":>10}{"repeat s":>10}')
+    for files, size, commits in SHAPES:
+        with TemporaryDirectory() as td:
+            repo = HgRepo.create(Path(td).joinpath('remote'), files, size, commits)
+            modes = [('clone', {}),
+                     ('store', {'store_dir': str(Path(td).joinpath('stores'))}),
+                     ('store+narrow', {'store_dir': str(Path(td).joinpath('narrow')), 'narrow': ['0']})]
+            with repo.serve() as uri:
+                for mode, options in modes:
+                    timings = run(repo, uri, args.repeats + 1, **options)
+                    print(f'{files:>8}{size / 1024:>10.0f}{commits:>9}{mode:>14}{timings[0]:>10.3f}'
+                          f'{median(timings[1:]):>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
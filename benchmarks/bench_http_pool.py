@@ -0,0 +1,37 @@
+"""Compares N sequential HttpPath fetches from a local stand-in server with and without the shared session pool.
+Usage: python -m benchmarks.bench_http_pool [-n FETCHES]
+"""
+import argparse
+from time import perf_counter
+
+from anypath.anypath import AnyPath, path_provider
+from anypath.pathprovider.http import HttpPath
+from benchmarks.servers import HttpServer
+
+
+def run(url, fetches, pooled):
+    start = perf_counter()
+    for _ in range(fetches):
+        with AnyPath(f'{url}/bytes/1024', pooled=pooled):
+            pass
+    elapsed = perf_counter() - start
+    path_provider.shutdown()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--fetches', type=int, default=500)
+    args = parser.parse_args()
+
+    path_provider.add(HttpPath)
+    with HttpServer() as url:
+        print(f'{"mode":<10}{"fetches":>10}{"total s":>10}{"ms/fetch":>10}')
+        for pooled in [False, True]:
+            elapsed = run(url, args.fetches, pooled)
+            mode = 'pooled' if pooled else 'unpooled'
+            print(f'{mode:<10}{args.fetches:>10}{elapsed:>10.3f}{elapsed / args.fetches * 1000:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
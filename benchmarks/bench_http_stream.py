@@ -0,0 +1,58 @@
+"""Measures peak RSS and throughput of HttpPath downloads against a local stand-in server.
+Every payload size is fetched in a fresh child process so that peak RSS is not carried over between runs.
+Usage: python -m benchmarks.bench_http_stream [--max-size BYTES]
+"""
+import argparse
+import multiprocessing
+import resource
+from time import perf_counter
+
+from benchmarks.servers import HttpServer
+
+SIZES = [2 ** 20, 16 * 2 ** 20, 128 * 2 ** 20, 512 * 2 ** 20, 2 * 2 ** 30]
+
+
+def _fetch(url, stream, queue):
+    from anypath.anypath import AnyPath, path_provider
+    from anypath.pathprovider.http import HttpPath
+
+    path_provider.add(HttpPath)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = perf_counter()
+    with AnyPath(url, stream=stream, chunk_size=1024 * 1024) as path:
+        size = path.stat().st_size
+    elapsed = perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((size, elapsed, baseline, peak))
+
+
+def run(url, size, stream):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_fetch, args=(f'{url}/bytes/{size}', stream, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--max-size', type=int, default=SIZES[-1])
+    parser.add_argument('--buffered', action='store_true', help='Also run with stream=False for comparison')
+    args = parser.parse_args()
+
+    modes = [True, False] if args.buffered else [True]
+    with HttpServer() as url:
+        print(f'{"mode":<10}{"size MiB":>10}{"MiB/s":>10}{"peak RSS MiB":>14}{"RSS delta MiB":>15}')
+        for stream in modes:
+            for size in [s for s in SIZES if s <= args.max_size]:
+                fetched, elapsed, baseline, peak = run(url, size, stream)
+                assert fetched == size, f'Expected {size} bytes, got {fetched}'
+                mode = 'stream' if stream else 'buffered'
+                print(f'{mode:<10}{size / 2 ** 20:>10.0f}{size / 2 ** 20 / elapsed:>10.1f}'
+                      f'{peak / 1024:>14.1f}{(peak - baseline) / 1024:>15.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Compares persisting a local tree on every fetch with syncing only the files which changed since the last fetch.
+Usage: python -m benchmarks.bench_local_sync [--files 100000] [--size 1024] [--workers 8] [--dir DIR]
+The trees are created inside DIR (default: the temp directory), the results depend on its filesystem.
+"""
+import argparse
+import os
+import shutil
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from anypath.anypath import AnyPath, path_provider
+from anypath.pathprovider.local import LocalPath
+from benchmarks.datasets import create_tree
+
+# Share of the files which are changed before the last run
+CHANGED = 0.01
+
+
+def fetch(src: Path, dst: Path, **options):
+    start = perf_counter()
+    with AnyPath(f'file://{src}', persist_dir=str(dst), **options):
+        pass
+    return perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--dir', default=None)
+    args = parser.parse_args()
+    path_provider.add(LocalPath)
+
+    with TemporaryDirectory(dir=args.dir) as td:
+        src = create_tree(Path(td).joinpath('src'), args.files, args.size)
+        dst = Path(td).joinpath('dst')
+        print(f'{args.files} files of {args.size} bytes')
+        print(f'{"mode":<28}{"seconds":>10}')
+        print(f'{"persist (copytree)":<28}{fetch(src, dst):>10.3f}')
+        shutil.rmtree(str(dst))
+        print(f'{"sync, first run":<28}{fetch(src, dst, sync=True, workers=args.workers):>10.3f}')
+        print(f'{"sync, unchanged":<28}{fetch(src, dst, sync=True, workers=args.workers):>10.3f}')
+        for i in range(0, args.files, int(1 / CHANGED)):
+            path = src.joinpath(f'd{i // 100}', f'f{i}.bin')
+            path.write_bytes(os.urandom(args.size))
+        mode = f'sync, {CHANGED:.0%} changed'
+        print(f'{mode:<28}{fetch(src, dst, sync=True, workers=args.workers):>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Compares the persistence strategies for fetched trees, from shutil.copytree to a single rename.
+Usage: python -m benchmarks.bench_persist [--dir DIR]
+The trees are created inside DIR (default: the temp directory), the results depend on its filesystem.
+"""
+import argparse
+import shutil
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from anypath import persistence
+from benchmarks.datasets import create_tree
+
+# name: (number of files, size of each file in bytes)
+DATASETS = {'many-small': (5000, 4 * 1024), 'few-large': (8, 128 * 1024 * 1024)}
+MODES = {
+    'shutil.copytree': None,
+    'copy': ('copy',),
+    'copy_file_range': ('copy_file_range', 'copy'),
+    'reflink': ('reflink', 'copy'),
+    'hardlink': ('hardlink', 'copy'),
+    'rename': persistence.STRATEGIES,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dir', default=None)
+    args = parser.parse_args()
+
+    print(f'{"dataset":<12}{"strategy":<18}{"seconds":>10}')
+    for name, (files, size) in DATASETS.items():
+        with TemporaryDirectory(dir=args.dir) as td:
+            for mode, strategies in MODES.items():
+                src = create_tree(Path(td).joinpath('src'), files, size)
+                dst = Path(td).joinpath('dst')
+                start = perf_counter()
+                if strategies is None:
+                    shutil.copytree(str(src), str(dst))
+                else:
+                    persistence.persist(src, dst, strategies)
+                print(f'{name:<12}{mode:<18}{perf_counter() - start:>10.3f}')
+                shutil.rmtree(str(dst))
+                shutil.rmtree(str(src), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Compares N threads fetching the same or distinct uris from a local stand-in server, each with its own AnyPath and
+through a FetchScheduler which coalesces identical in-flight fetches.
+Usage: python -m benchmarks.bench_scheduler [-n THREADS] [--size BYTES]
+"""
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from anypath.anypath import AnyPath, path_provider
+from anypath.pathprovider.http import HttpPath
+from anypath.scheduler import FetchScheduler
+from benchmarks.servers import HttpServer
+
+
+def run(uris, open_path):
+    """Fetches all uris at once, every thread holds its path until all threads fetched theirs like a busy service"""
+    barrier = threading.Barrier(len(uris))
+
+    def fetch(uri):
+        with open_path(uri) as path:
+            size = path.stat().st_size
+            barrier.wait()
+        return size
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=len(uris)) as executor:
+        total = sum(executor.map(fetch, uris))
+    return perf_counter() - start, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--threads', type=int, default=100)
+    parser.add_argument('--size', type=int, default=8 * 1024 * 1024)
+    args = parser.parse_args()
+
+    path_provider.add(HttpPath)
+    with HttpServer() as url, FetchScheduler() as scheduler:
+        workloads = {
+            'same': [f'{url}/bytes/{args.size}'] * args.threads,
+            # Distinct uris of the same size, the scheduler can not coalesce them
+            'distinct': [f'{url}/{i}/bytes/{args.size}' for i in range(args.threads)],
+        }
+        print(f'{"uris":<10}{"mode":<11}{"threads":>8}{"fetches":>9}{"total s":>9}{"MiB read":>10}')
+        for name, uris in workloads.items():
+            elapsed, total = run(uris, lambda uri: AnyPath(uri, cache=False))
+            print(f'{name:<10}{"anypath":<11}{len(uris):>8}{len(uris):>9}{elapsed:>9.3f}{total / 2 ** 20:>10.0f}')
+            before = scheduler.stats['fetches']
+            elapsed, total = run(uris, lambda uri: scheduler.open(uri, cache=False))
+            fetches = scheduler.stats['fetches'] - before
+            print(f'{name:<10}{"scheduler":<11}{len(uris):>8}{fetches:>9}{elapsed:>9.3f}{total / 2 ** 20:>10.0f}')
+    path_provider.shutdown()
+
+
+if __name__ == '__main__':
+    main()
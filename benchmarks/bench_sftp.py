@@ -0,0 +1,41 @@
+"""Measures SftpPath directory transfers against a local stand-in SFTP server with different numbers of channels.
+Usage: python -m benchmarks.bench_sftp [--channels 1 4 8]
+"""
+import argparse
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from anypath.anypath import AnyPath, path_provider
+from anypath.pathprovider.sftp import SftpPath
+from benchmarks.datasets import create_tree
+from benchmarks.sftpserver import SftpServer
+
+# name: (number of files, size of each file in bytes)
+DATASETS = {'many-small': (2000, 4 * 1024), 'few-large': (4, 64 * 1024 * 1024)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--channels', type=int, nargs='+', default=[1, 4, 8])
+    args = parser.parse_args()
+
+    path_provider.add(SftpPath)
+    with TemporaryDirectory() as td:
+        for name, (files, size) in DATASETS.items():
+            create_tree(Path(td).joinpath(name), files, size)
+        with SftpServer(td) as (host, port):
+            print(f'{"dataset":<12}{"channels":>9}{"seconds":>10}{"files/s":>10}{"MiB/s":>10}')
+            for name, (files, size) in DATASETS.items():
+                for channels in args.channels:
+                    start = perf_counter()
+                    fetcher = AnyPath(f'sftp://bench@{host}:/{name}', password='bench', port=port, channels=channels)
+                    with fetcher:
+                        elapsed = perf_counter() - start
+                    assert fetcher.stats['files'] == files, f'Expected {files} files, got {fetcher.stats["files"]}'
+                    print(f'{name:<12}{channels:>9}{elapsed:>10.3f}{files / elapsed:>10.0f}'
+                          f'{files * size / 2 ** 20 / elapsed:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+"""Generated datasets used by the benchmarks."""
+import os
+from pathlib import Path
+
+
+def create_tree(root: Path, files: int, size: int, per_dir: int = 100):
+    """Creates a directory tree with files of size random bytes, spread over subdirectories of per_dir files each
+    :return: The root of the tree
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    for i in range(files):
+        path = root.joinpath(f'd{i // per_dir}', f'f{i}.bin')
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(os.urandom(size))
+    return root
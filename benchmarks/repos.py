@@ -0,0 +1,107 @@
+"""Local stand-in repositories used by the benchmarks."""
+import os
+import socket
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def _run(*args, cwd=None):
+    subprocess.run(args, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class GitRepo:
+    """A local bare git repository with a working copy next to it from which commits are pushed
+    :param bare: The path of the bare repository
+    """
+
+    def __init__(self, bare: Path):
+        self.bare = bare
+        self.work = bare.with_name(bare.name + '.work')
+
+    @property
+    def uri(self):
+        return f'git+file://{self.bare}'
+
+    @classmethod
+    def create(cls, bare: Path, files: int, size: int, commits: int):
+        """Creates a repository with files of size bytes, spread over commits commits"""
+        repo = cls(bare)
+        _run('git', 'init', '-q', '-b', 'master', str(repo.work))
+        _run('git', 'init', '-q', '--bare', '-b', 'master', str(bare))
+        _run('git', 'remote', 'add', 'origin', str(bare), cwd=repo.work)
+        per_commit = max(files // commits, 1)
+        for start in range(0, files, per_commit):
+            repo.commit({f'{i % 100}/{i}.bin': os.urandom(size) for i in range(start, min(start + per_commit, files))})
+        return repo
+
+    def commit(self, files: dict):
+        """Commits files, given as {relative path: content}, and pushes them to the bare repository"""
+        for name, content in files.items():
+            path = self.work.joinpath(name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if isinstance(content, str):
+                content = content.encode()
+            path.write_bytes(content)
+        _run('git', 'add', '-A', cwd=self.work)
+        _run('git', '-c', 'user.name=anypath', '-c', 'user.email=anypath@localhost', 'commit', '-q', '-m', 'commit',
+             cwd=self.work)
+        _run('git', 'push', '-q', 'origin', 'master', cwd=self.work)
+
+
+class HgRepo:
+    """A local mercurial repository which is committed to directly
+    :param root: The path of the repository
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    @property
+    def uri(self):
+        return f'hg+file://{self.root}'
+
+    @contextmanager
+    def serve(self):
+        """Serves the repository with hg serve on a free localhost port. Local clones hardlink the history of the
+        repository, over http it is transferred like from a real remote.
+        :return: The uri of the served repository
+        """
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        # The narrow extension lets the server answer narrow clones
+        args = ['hg', '--config', 'extensions.narrow=', 'serve', '-R', str(self.root), '-a', '127.0.0.1', '-p', str(port)]
+        process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    socket.create_connection(('127.0.0.1', port)).close()
+                    break
+                except ConnectionRefusedError:
+                    time.sleep(0.05)
+            yield f'hg+http://127.0.0.1:{port}/'
+        finally:
+            process.terminate()
+            process.wait()
+
+    @classmethod
+    def create(cls, root: Path, files: int, size: int, commits: int):
+        """Creates a repository with files of size bytes, spread over commits commits"""
+        repo = cls(root)
+        _run('hg', 'init', str(root))
+        per_commit = max(files // commits, 1)
+        for start in range(0, files, per_commit):
+            repo.commit({f'{i % 100}/{i}.bin': os.urandom(size) for i in range(start, min(start + per_commit, files))})
+        return repo
+
+    def commit(self, files: dict):
+        """Commits files, given as {relative path: content}"""
+        for name, content in files.items():
+            path = self.root.joinpath(name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if isinstance(content, str):
+                content = content.encode()
+            path.write_bytes(content)
+        _run('hg', '--config', 'ui.username=anypath', 'commit', '-A', '-m', 'commit', cwd=self.root)
@@ -0,0 +1,72 @@
+"""Local stand-in servers used by the benchmarks.
+They run in a background thread of the benchmarking process and only listen on localhost.
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+CHUNK = b'\x00\x01\x02\x03\xfd\xfe\xff\n' * 8192
+
+
+class _PayloadHandler(BaseHTTPRequestHandler):
+    """Serves /bytes/<n> as a generated binary body of n bytes without holding it in memory."""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        try:
+            size = int(self.path.rsplit('/', 1)[-1])
+        except ValueError:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        remaining = size
+        while remaining > 0:
+            chunk = CHUNK[:remaining]
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpServer:
+    """Context manager that starts a threaded HTTP server on a free localhost port.
+    Usage example: with HttpServer() as url: AnyPath(url + '/bytes/1024')
+    """
+
+    def __init__(self, handler=_PayloadHandler):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self.url
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def file_handler(directory):
+    """Returns a handler class which serves the files of directory"""
+
+    class _FileHandler(SimpleHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(directory), **kwargs)
+
+        def log_message(self, format, *args):
+            pass
+
+    return _FileHandler
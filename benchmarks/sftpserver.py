@@ -0,0 +1,124 @@
+"""A local stand-in SFTP server based on paramiko, serving a local directory read-only.
+Any username and password are accepted. As SftpPath checks ~/.ssh/known_hosts the server writes a known_hosts file with
+its host key into a temporary HOME directory and points HOME to it while it runs.
+"""
+import logging
+import os
+import socket
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import paramiko
+
+# Clients closing their connection are logged as errors by the server transports
+logging.getLogger('paramiko.transport').addHandler(logging.NullHandler())
+
+
+class _SshServer(paramiko.ServerInterface):
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+
+class _SftpHandle(paramiko.SFTPHandle):
+
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class _SftpInterface(paramiko.SFTPServerInterface):
+
+    def __init__(self, server, root, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _real(self, path):
+        return os.path.join(self.root, self.canonicalize(path).lstrip('/'))
+
+    def list_folder(self, path):
+        try:
+            with os.scandir(self._real(path)) as entries:
+                return [paramiko.SFTPAttributes.from_stat(entry.stat(), entry.name) for entry in entries]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._real(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        if flags & (os.O_WRONLY | os.O_RDWR):
+            return paramiko.SFTP_PERMISSION_DENIED
+        try:
+            handle = _SftpHandle(flags)
+            handle.filename = self._real(path)
+            handle.readfile = open(handle.filename, 'rb')
+            return handle
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class SftpServer:
+    """Context manager that serves root via SFTP on a free localhost port.
+    Usage example: with SftpServer('/data') as (host, port): AnyPath(f'sftp://user@{host}:/dir', port=port)
+    Remote paths are relative to root, i.e. '/dir' is served from root/dir.
+    :param root: The local directory to be served
+    """
+
+    def __init__(self, root):
+        self.root = str(root)
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(('127.0.0.1', 0))
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.transports = []
+        self.home = None
+        self.old_home = None
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self.socket.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _SftpInterface, root=self.root)
+            transport.start_server(server=_SshServer())
+            self.transports.append(transport)
+
+    def __enter__(self):
+        self.home = TemporaryDirectory()
+        ssh_dir = Path(self.home.name).joinpath('.ssh')
+        ssh_dir.mkdir()
+        ssh_dir.joinpath('known_hosts').write_text(
+            f'127.0.0.1 {self.host_key.get_name()} {self.host_key.get_base64()}\n')
+        self.old_home = os.environ.get('HOME')
+        os.environ['HOME'] = self.home.name
+        self.socket.listen(16)
+        self.thread.start()
+        return self.socket.getsockname()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.socket.close()
+        for transport in self.transports:
+            transport.close()
+        if self.old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = self.old_home
+        self.home.cleanup()
@@ -0,0 +1,216 @@
+"""Runs the PathProviders against local stand-ins over dataset shapes and compares the results with a stored baseline.
+Usage: python -m benchmarks.suite [--providers local http sftp git hg] [--shapes 1x16777216 32x262144 1000x1024]
+                                  [--repeat 5] [--baseline benchmarks/baseline.json] [--save] [--tolerance 0.25]
+                                  [--allow-missing-baseline]
+A shape is FILESxSIZE, a tree of FILES files of SIZE bytes each. The stand-ins run in this process: an http server which
+serves the files of the tree one by one, a paramiko sftp server, a bare git repository fetched via file:// and a
+mercurial repository served by hg serve. Local fetches persist the tree to a new persist_dir.
+Every case (provider and shape) is measured in a new process, so that its peak RSS (the maximum of the process and of
+its subprocesses, e.g. git) is its own. The run fails with exit code 1 if a case has a lower throughput, a higher
+latency or a higher peak RSS than in the baseline by more than tolerance, or if there is no baseline file unless
+--save or --allow-missing-baseline is given. --save stores the results as the baseline, baselines are only comparable
+on the same machine.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from benchmarks.datasets import create_tree
+
+BASELINE = Path(__file__).with_name('baseline.json')
+SHAPES = ['1x16777216', '32x262144', '1000x1024']
+# Metrics of a case and whether higher values are better
+METRICS = {'throughput': True, 'p50': False, 'p99': False, 'rss': False}
+
+
+@contextmanager
+def _local(root: Path, files: int, size: int):
+    tree = create_tree(root.joinpath('tree'), files, size)
+    yield [(f'file://{tree}', {}, True)]
+
+
+@contextmanager
+def _http(root: Path, files: int, size: int):
+    from benchmarks.servers import HttpServer, file_handler
+    tree = create_tree(root.joinpath('tree'), files, size)
+    with HttpServer(file_handler(tree)) as url:
+        yield [(f'{url}/d{i // 100}/f{i}.bin', {}, False) for i in range(files)]
+
+
+@contextmanager
+def _sftp(root: Path, files: int, size: int):
+    from benchmarks.sftpserver import SftpServer
+    create_tree(root.joinpath('tree'), files, size)
+    with SftpServer(root) as (host, port):
+        yield [(f'sftp://bench@{host}:/tree', {'password': 'bench', 'port': port}, False)]
+
+
+@contextmanager
+def _git(root: Path, files: int, size: int):
+    from benchmarks.repos import GitRepo
+    yield [(GitRepo.create(root.joinpath('repo.git'), files, size, commits=1).uri, {}, False)]
+
+
+@contextmanager
+def _hg(root: Path, files: int, size: int):
+    from benchmarks.repos import HgRepo
+    with HgRepo.create(root.joinpath('repo'), files, size, commits=1).serve() as uri:
+        yield [(uri, {}, False)]
+
+
+# Stand-ins by provider, they yield the fetches of one run as (uri, options, whether to persist) tuples
+STAND_INS = {'local': _local, 'http': _http, 'sftp': _sftp, 'git': _git, 'hg': _hg}
+
+
+def _measure(fetches: list, repeat: int, warmup: int):
+    """Runs the fetches warmup + repeat times in the current process
+    :return: The latencies of the measured fetches in seconds and the peak RSS in bytes
+    """
+    from anypath.anypath import AnyPath, path_provider
+    from anypath.pathprovider.git import GitPath
+    from anypath.pathprovider.http import HttpPath
+    from anypath.pathprovider.local import LocalPath
+    from anypath.pathprovider.mercurial import HgPath
+    from anypath.pathprovider.sftp import SftpPath
+    path_provider.add(LocalPath, HttpPath, SftpPath, GitPath, HgPath)
+    latencies = []
+    with TemporaryDirectory() as work:
+        for run in range(warmup + repeat):
+            for uri, options, persist in fetches:
+                if persist:
+                    options = dict(options, persist_dir=os.path.join(work, str(run)))
+                start = perf_counter()
+                fetcher = AnyPath(uri, **options)
+                fetcher.fetch()
+                elapsed = perf_counter() - start
+                fetcher.close()
+                if run >= warmup:
+                    latencies.append(elapsed)
+    return latencies, _peak_rss()
+
+
+def _peak_rss():
+    """Returns the peak RSS in bytes of this process or of its largest finished subprocess, None if it is unknown"""
+    own = None
+    try:
+        # On Linux ru_maxrss keeps the peak of the parent across fork and exec, VmHWM is the one of this process only
+        with open('/proc/self/status') as f:
+            own = next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return own
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    if own is None:
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return max(own, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def percentile(values: list, p: float):
+    """Returns the p-th percentile of values with the nearest-rank method"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def run_case(provider: str, files: int, size: int, repeat: int, warmup: int, directory: str = None):
+    """Measures the fetches of a provider for a shape in a new process
+    :return: The metrics of the case: throughput in MiB/s, p50 and p99 latency in seconds and peak RSS in MiB
+    """
+    with TemporaryDirectory(dir=directory) as td:
+        with STAND_INS[provider](Path(td), files, size) as fetches:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                latencies, rss = executor.submit(_measure, fetches, repeat, warmup).result()
+    return {
+        'throughput': files * size * repeat / 2 ** 20 / sum(latencies),
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'rss': None if rss is None else rss / 2 ** 20,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Compares the metrics of all cases with the baseline, cases and metrics which are not in both are skipped
+    :return: A description of every regression beyond tolerance
+    """
+    regressions = []
+    for case, metrics in results.items():
+        for metric, higher_is_better in METRICS.items():
+            old, new = baseline.get(case, {}).get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f'{case} {metric}: {old:.4g} -> {new:.4g} ({change:+.0%})')
+    return regressions
+
+
+def _shape(value: str):
+    files, size = value.lower().split('x')
+    return int(files), int(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--providers', nargs='+', choices=list(STAND_INS), default=list(STAND_INS))
+    parser.add_argument('--shapes', nargs='+', type=_shape, default=[_shape(shape) for shape in SHAPES])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='Store the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--allow-missing-baseline', action='store_true',
+                        help='Only print the results if there is no baseline instead of failing')
+    parser.add_argument('--dir', default=None, help='The directory for the datasets, the temp directory by default')
+    args = parser.parse_args()
+
+    try:
+        stored = json.loads(args.baseline.read_text())
+    except FileNotFoundError:
+        print(f'No baseline at {args.baseline}, nothing is compared')
+        if not (args.save or args.allow_missing_baseline):
+            print('Run with --save to store one, or with --allow-missing-baseline to only print the results')
+            sys.exit(1)
+        stored = {'platform': platform.platform(), 'cases': {}}
+    if stored['platform'] != platform.platform():
+        print(f'The baseline was recorded on {stored["platform"]}, the results may not be comparable')
+
+    results = {}
+    print(f'{"case":<24}{"MiB/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"RSS MiB":>10}')
+    for files, size in args.shapes:
+        for provider in args.providers:
+            case = f'{provider}/{files}x{size}'
+            metrics = results[case] = run_case(provider, files, size, args.repeat, args.warmup, args.dir)
+            rss = '-' if metrics['rss'] is None else f'{metrics["rss"]:.0f}'
+            print(f'{case:<24}{metrics["throughput"]:>10.1f}{metrics["p50"] * 1000:>10.1f}'
+                  f'{metrics["p99"] * 1000:>10.1f}{rss:>10}', flush=True)
+
+    missing = [case for case in results if case not in stored['cases']]
+    if stored['cases'] and missing:
+        print(f'Not in the baseline, not compared: {", ".join(missing)}')
+    regressions = compare(results, stored['cases'], args.tolerance)
+    for regression in regressions:
+        print(f'Regression: {regression}')
+    if args.save:
+        stored['platform'] = platform.platform()
+        stored['cases'].update(results)
+        args.baseline.write_text(json.dumps(stored, indent=2, sort_keys=True) + '\n')
+        print(f'Stored the results as baseline in {args.baseline}')
+    elif regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -17,9 +17,31 @@ setup(
     author_email='vdbarth@posteo.at',
     classifiers=[
         'Programming Language :: Python :: 3 :: Only',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
         'License :: OSI Approved :: Mozilla Public License 2.0 (MPL 2.0)'
     ],
     packages=['anypath', 'anypath.pathprovider'],
-    install_requires=[]
+    python_requires='>=3.9',
+    install_requires=[],
+    entry_points={
+        'anypath.providers': [
+            'http:// = anypath.pathprovider.http:HttpPath',
+            'https:// = anypath.pathprovider.http:HttpPath',
+            'sftp:// = anypath.pathprovider.sftp:SftpPath',
+            'ssh:// = anypath.pathprovider.sftp:SftpPath',
+            'git+http:// = anypath.pathprovider.git:GitPath',
+            'git+https:// = anypath.pathprovider.git:GitPath',
+            'git+file:// = anypath.pathprovider.git:GitPath',
+            'git:// = anypath.pathprovider.git:GitPath',
+            'hg+http:// = anypath.pathprovider.mercurial:HgPath',
+            'hg+https:// = anypath.pathprovider.mercurial:HgPath',
+            'hg+file:// = anypath.pathprovider.mercurial:HgPath',
+            'file:// = anypath.pathprovider.local:LocalPath',
+            '/ = anypath.pathprovider.local:LocalPath',
+            './ = anypath.pathprovider.local:LocalPath',
+        ]
+    }
 )
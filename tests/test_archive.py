@@ -0,0 +1,114 @@
+import io
+import os
+import tarfile
+import unittest
+import zipfile
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from anypath.archive import IteratorReader, UnsafeArchiveError, extract
+from anypath.pathprovider.sftp import SftpPath
+
+
+def create_tar(members, mode='w:gz'):
+    """Returns a tar archive of members, a list of (name, content) for files or (name, linkname) for symlinks"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as tar:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            if isinstance(content, bytes):
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+            else:
+                info.type, info.linkname = tarfile.SYMTYPE, content
+                tar.addfile(info)
+    return buffer.getvalue()
+
+
+def chunked(data, size=1000):
+    """A non-seekable reader which returns data in chunks like a streamed response"""
+    return IteratorReader(data[i:i + size] for i in range(0, len(data), size))
+
+
+class TestExtract(unittest.TestCase):
+
+    def setUp(self):
+        self.td = TemporaryDirectory()
+        self.dst = Path(self.td.name).joinpath('out')
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_tar(self):
+        for mode in ['w', 'w:gz', 'w:bz2', 'w:xz']:
+            data = create_tar([('a.txt', b'Content'), ('sub/b.bin', os.urandom(5000)), ('link', 'a.txt')], mode)
+            extract(chunked(data), self.dst.joinpath(mode))
+            self.assertEqual(self.dst.joinpath(mode, 'a.txt').read_text(), 'Content')
+            self.assertEqual(self.dst.joinpath(mode, 'sub', 'b.bin').stat().st_size, 5000)
+            self.assertEqual(self.dst.joinpath(mode, 'link').read_text(), 'Content')
+
+    def test_zip(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('a.txt', 'Content')
+            archive.writestr('sub/b.txt', 'More content')
+        extract(chunked(buffer.getvalue()), self.dst)
+        self.assertEqual(self.dst.joinpath('sub', 'b.txt').read_text(), 'More content')
+
+    def test_traversal(self):
+        archives = [
+            [('../evil.txt', b'Evil')],
+            [('/tmp/evil.txt', b'Evil')],
+            [('link', '../..')],
+            [('link', '/etc')],
+            # The first link is harmless, the second one escapes through it
+            [('inner', '.'), ('inner/escape', '..')],
+        ]
+        for members in archives:
+            with self.assertRaises(UnsafeArchiveError, msg=members):
+                extract(chunked(create_tar(members)), self.dst)
+        self.assertEqual(sorted(p.name for p in Path(self.td.name).iterdir()), ['out'])
+
+    def test_attributes(self):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w') as tar:
+            for name, mode in [('setuid', 0o4777), ('readonly', 0o444)]:
+                info = tarfile.TarInfo(name)
+                info.mode, info.uid, info.uname = mode, 12345, 'someone'
+                tar.addfile(info, io.BytesIO(b''))
+        data_filter = getattr(tarfile, 'data_filter', None)
+        for fallback in [False, True]:
+            dst = self.dst.joinpath(str(fallback))
+            if fallback and data_filter is not None:
+                # Like older Python versions without extraction filters
+                del tarfile.data_filter
+                self.addCleanup(setattr, tarfile, 'data_filter', data_filter)
+            extract(io.BytesIO(buffer.getvalue()), dst)
+            self.assertEqual(dst.joinpath('setuid').stat().st_mode & 0o7777, 0o755)
+            self.assertEqual(dst.joinpath('readonly').stat().st_mode & 0o7777, 0o644)
+            self.assertEqual(dst.joinpath('setuid').stat().st_uid, os.geteuid())
+
+
+class TestSftpExtract(unittest.TestCase):
+
+    def setUp(self):
+        self.paramiko = MagicMock()
+        self.paramiko.hostkeys.HostKeys().items.return_value = {'key': 'value'}
+        patcher = patch.object(SftpPath, '_check_dependencies', return_value=[self.paramiko])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_extract(self):
+        data = create_tar([('a.txt', b'Content')])
+        client = self.paramiko.SFTPClient.from_transport()
+        client.open().__enter__().read.side_effect = [data, b'']
+        fetcher = SftpPath('sftp://', 'user@host:/data.tar.gz', None, cache=False, extract=True)
+        with fetcher as path:
+            self.assertEqual(path.joinpath('a.txt').read_text(), 'Content')
+        self.assertEqual(fetcher.stats['bytes'], len(data))
+        client.listdir_attr.assert_not_called()
+
+    def test_options(self):
+        with self.assertRaises(ValueError):
+            SftpPath('sftp://', 'user@host:/data.tar.gz', None, lazy=True, extract=True)
@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from anypath.anypath import AnyPath, path_provider
+from anypath.pathprovider.git import GitPath
+from anypath.pathprovider.http import HttpPath
+from anypath.pathprovider.local import LocalPath
+from anypath.pathprovider.mercurial import HgPath
+
+
+class TestAsyncFetching(unittest.TestCase):
+
+    def setUp(self):
+        path_provider.add(LocalPath, HttpPath, GitPath, HgPath)
+        self.deps = []
+
+    def tearDown(self):
+        path_provider.shutdown()
+
+    def mocked_dependencies(self):
+        return self.deps
+
+    def test_local(self):
+        async def fetch():
+            async with AnyPath('./resources/localfile.txt') as path:
+                return path.read_text()
+
+        self.assertEqual(asyncio.run(fetch()), 'Content')
+
+    def test_sync_fallback(self):
+        HttpPath._check_dependencies = self.mocked_dependencies
+        req_mock = MagicMock()
+        req_mock.Session().send.return_value.iter_content.return_value = [b'Content']
+        self.deps.append(req_mock)
+
+        async def fetch():
+            async with AnyPath('http://example.com') as path:
+                return path, path.read_text()
+
+        path, content = asyncio.run(fetch())
+        self.assertEqual(content, 'Content')
+        self.assertFalse(path.parent.exists(), 'Temporary directory was not deleted')
+
+    def test_git_native(self):
+        GitPath._check_dependencies = self.mocked_dependencies
+        with patch('asyncio.create_subprocess_exec', new_callable=AsyncMock) as exec_mock, \
+                patch('subprocess.Popen') as popen_mock:
+            exec_mock.return_value.returncode = 0
+            async def fetch():
+                async with AnyPath('git://host/repo', branch='dev') as path:
+                    self.assertTrue(path.parent.exists(), 'Path was not created')
+                    return path
+
+            path = asyncio.run(fetch())
+        popen_mock.assert_not_called()
+        self.assertEqual(exec_mock.call_args[0], ('git', 'clone', '-b', 'dev', 'git://host/repo', str(path)))
+        exec_mock.return_value.wait.assert_awaited()
+
+    def test_hg_native(self):
+        HgPath._check_dependencies = self.mocked_dependencies
+        with patch('asyncio.create_subprocess_exec', new_callable=AsyncMock) as exec_mock:
+            exec_mock.return_value.returncode = 0
+
+            async def fetch():
+                async with AnyPath('hg+https://host/repo') as path:
+                    return path
+
+            path = asyncio.run(fetch())
+        self.assertEqual(exec_mock.call_args[0], ('hg', 'clone', 'https://host/repo', str(path)))
@@ -0,0 +1,101 @@
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from anypath.anypath import AnyPath, BasePath, pattern, path_provider, UnknownProtocol
+from anypath.dependencies import NotInstalledError
+from anypath.pathprovider.local import LocalPath
+
+
+@pattern('slow://')
+class SlowPath(BasePath):
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def __init__(self, protocol, path, persist_dir, fail=False):
+        super().__init__(protocol, path, persist_dir)
+        self.fail = fail
+
+    @BasePath.wrapped
+    def fetch(self):
+        with SlowPath.lock:
+            SlowPath.running += 1
+            SlowPath.peak = max(SlowPath.peak, SlowPath.running)
+        time.sleep(0.02)
+        with SlowPath.lock:
+            SlowPath.running -= 1
+        if self.fail:
+            raise IOError('Fetch failed')
+        self.out_path.write_text(self.path)
+
+
+@pattern('missing://')
+class MissingPath(BasePath):
+    dependencies = ['anypath_missing_module']
+
+    @BasePath.wrapped
+    def fetch(self, missing):
+        pass
+
+
+@pattern('interrupted://')
+class InterruptedPath(BasePath):
+    concurrent = False
+
+    @BasePath.wrapped
+    def fetch(self):
+        raise KeyboardInterrupt()
+
+
+class TestFetchMany(unittest.TestCase):
+
+    def setUp(self):
+        path_provider.add(LocalPath, SlowPath, MissingPath, InterruptedPath)
+        SlowPath.peak = 0
+
+    def test_order_and_cleanup(self):
+        uris = [f'slow://host{i}/{i}' for i in range(6)] + ['./resources/localfile.txt']
+        with AnyPath.fetch_many(uris, max_workers=3) as paths:
+            contents = [path.read_text() for path in paths]
+            temp_dirs = [path.parent for path in paths[:-1]]
+        self.assertEqual(contents, [f'host{i}/{i}' for i in range(6)] + ['Content'])
+        self.assertEqual(SlowPath.peak, 3)
+        self.assertFalse(any(td.exists() for td in temp_dirs), 'Temporary directories were not deleted')
+        self.assertTrue(Path('./resources/localfile.txt').exists())
+
+    def test_provider_limit(self):
+        with AnyPath.fetch_many([f'slow://host{i}/' for i in range(6)], provider_limits={SlowPath: 2}):
+            pass
+        self.assertEqual(SlowPath.peak, 2)
+
+    def test_host_limit(self):
+        with AnyPath.fetch_many(['slow://host/'] * 6, host_limit=1):
+            pass
+        self.assertEqual(SlowPath.peak, 1)
+
+    def test_errors(self):
+        batch = AnyPath.fetch_many(['slow://host/a', ('slow://host/b', {'fail': True}), 'unknown://c'])
+        with batch as paths:
+            self.assertEqual(paths[0].read_text(), 'host/a')
+            self.assertEqual(paths[1:], [None, None])
+        self.assertEqual(sorted(batch.errors), [1, 2])
+        self.assertIsInstance(batch.errors[1], IOError)
+        self.assertIsInstance(batch.errors[2], UnknownProtocol)
+
+    def test_missing_dependency(self):
+        batch = AnyPath.fetch_many(['slow://host/a', 'missing://b', 'slow://host/c'])
+        with batch as paths:
+            temp_dirs = [paths[0].parent, paths[2].parent]
+            self.assertIsNone(paths[1])
+        self.assertEqual(list(batch.errors), [1])
+        self.assertIsInstance(batch.errors[1], NotInstalledError)
+        self.assertFalse(any(td.exists() for td in temp_dirs), 'Temporary directories were not deleted')
+
+    def test_interrupted(self):
+        batch = AnyPath.fetch_many(['slow://host/a', 'interrupted://b', 'slow://host/c'])
+        with self.assertRaises(KeyboardInterrupt):
+            batch.fetch()
+        self.assertFalse(any(fetcher.td is not None and Path(fetcher.td).exists() for fetcher in batch.fetchers),
+                         'Temporary directories were not deleted')
@@ -0,0 +1,101 @@
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from anypath.anypath import AnyPath, BasePath, pattern, path_provider
+from anypath.cache import FetchCache, normalize
+from anypath.pathprovider.http import HttpPath
+
+
+@pattern('count://')
+class CountingPath(BasePath):
+    fetches = 0
+
+    def __init__(self, protocol, path, persist_dir, size=1, **options):
+        super().__init__(protocol, path, persist_dir, **options)
+        self.size = size
+
+    @BasePath.wrapped
+    def fetch(self):
+        CountingPath.fetches += 1
+        self.out_path.mkdir()
+        self.out_path.joinpath('file').write_bytes(b'x' * self.size)
+
+
+class TestFetchCache(unittest.TestCase):
+
+    def setUp(self):
+        path_provider.add(CountingPath, HttpPath)
+        CountingPath.fetches = 0
+        self.td = TemporaryDirectory()
+        self.cache = FetchCache(self.td.name, ttl=60)
+
+    def tearDown(self):
+        path_provider.cache = None
+        path_provider.shutdown()
+        self.td.cleanup()
+
+    def fetch(self, uri, **options):
+        with AnyPath(uri, cache=self.cache, **options) as path:
+            return path.joinpath('file').read_bytes()
+
+    def test_normalize(self):
+        self.assertEqual(normalize('HTTP://Example.ORG/Path'), 'http://example.org/Path')
+        self.assertEqual(normalize('./Relative'), './Relative')
+
+    def test_hit(self):
+        self.assertEqual(self.fetch('count://host/a'), b'x')
+        self.assertEqual(self.fetch('count://HOST/a'), b'x')
+        self.assertEqual(CountingPath.fetches, 1)
+        self.assertEqual(self.cache.stats['hits'], 1)
+        self.assertEqual(self.cache.stats['misses'], 1)
+
+    def test_options_are_part_of_key(self):
+        self.fetch('count://a', size=1)
+        self.assertEqual(self.fetch('count://a', size=2), b'xx')
+        self.assertEqual(CountingPath.fetches, 2)
+
+    def test_ttl(self):
+        self.cache.ttls = {CountingPath: 0}
+        self.fetch('count://a')
+        self.fetch('count://a')
+        self.assertEqual(CountingPath.fetches, 2)
+
+    def test_global_cache_and_bypass(self):
+        path_provider.cache = self.cache
+        with AnyPath('count://a'):
+            pass
+        with AnyPath('count://a'):
+            pass
+        with AnyPath('count://a', cache=False):
+            pass
+        self.assertEqual(CountingPath.fetches, 2)
+
+    def test_lru_eviction(self):
+        self.cache.max_size = 25
+        self.fetch('count://a', size=10)
+        self.fetch('count://b', size=10)
+        # Using a makes b the least recently used entry
+        self.fetch('count://a', size=10)
+        self.fetch('count://c', size=10)
+        self.assertEqual(self.cache.stats['evictions'], 1)
+        self.fetch('count://a', size=10)
+        self.fetch('count://b', size=10)
+        self.assertEqual(CountingPath.fetches, 4)
+
+    def test_http_revalidation(self):
+        req_mock = MagicMock()
+        session = req_mock.Session()
+        first = MagicMock(status_code=200, headers={'ETag': '"v1"'})
+        first.iter_content.return_value = [b'Content']
+        second = MagicMock(status_code=304, headers={'ETag': '"v1"'})
+        session.send.side_effect = [first, second]
+        self.cache.ttl = 0
+
+        with patch.object(HttpPath, '_check_dependencies', return_value=[req_mock]):
+            for _ in range(2):
+                with AnyPath('http://example.com', cache=self.cache) as path:
+                    self.assertEqual(path.read_text(), 'Content')
+
+        self.assertEqual(req_mock.Request.call_args_list[1][1]['headers'], {'If-None-Match': '"v1"'})
+        self.assertEqual(self.cache.stats['revalidations'], 1)
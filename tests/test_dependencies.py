@@ -1,6 +1,12 @@
+import os
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 
-from anypath.anypath import path_provider
+from anypath import dependencies
+from anypath.anypath import BasePath, _Provider, path_provider, pattern
+from anypath.dependencies import NotInstalledError, check_executable, do_import
 from anypath.pathprovider.git import GitPath
 from anypath.pathprovider.http import HttpPath
 from anypath.pathprovider.local import LocalPath
@@ -44,3 +50,86 @@ class TestProviderRequirements(unittest.TestCase):
     def test_get_requirements_executables(self):
         requirements = path_provider.get_requirements()
         self.assertEqual(['git', 'hg'].sort(), requirements['executables'].sort())
+
+
+class TestMemoization(unittest.TestCase):
+
+    def setUp(self):
+        dependencies.invalidate()
+        self.addCleanup(dependencies.invalidate)
+
+    def test_import_memoized(self):
+        with patch('importlib.import_module', side_effect=ModuleNotFoundError) as import_module:
+            for _ in range(3):
+                with self.assertRaises(NotInstalledError):
+                    do_import('missing_module')
+        self.assertEqual(1, import_module.call_count)
+
+    def test_executable_memoized(self):
+        with patch('shutil.which', return_value='/usr/bin/git') as which:
+            self.assertEqual('/usr/bin/git', check_executable('git'))
+            self.assertEqual('/usr/bin/git', check_executable('git'))
+        self.assertEqual(1, which.call_count)
+
+    def test_path_change(self):
+        with patch('shutil.which', return_value=None) as which:
+            with self.assertRaises(NotInstalledError):
+                check_executable('git')
+            with patch.dict(os.environ, {'PATH': '/opt/git/bin'}):
+                which.return_value = '/opt/git/bin/git'
+                self.assertEqual('/opt/git/bin/git', check_executable('git'))
+        self.assertEqual(2, which.call_count)
+
+    def test_invalidate(self):
+        with patch('shutil.which', return_value=None) as which:
+            with self.assertRaises(NotInstalledError):
+                check_executable('git')
+            which.return_value = '/usr/bin/git'
+            dependencies.invalidate()
+            self.assertEqual('/usr/bin/git', check_executable('git'))
+
+    def test_resolved_executable(self):
+        with patch('shutil.which', return_value='/usr/bin/git'):
+            fetcher = GitPath('git+https://', 'host/repo.git', None)
+            BasePath._check_dependencies(fetcher)
+        self.assertEqual('/usr/bin/git', fetcher._commands()[0][0])
+
+
+class TestWarmUp(unittest.TestCase):
+
+    def setUp(self):
+        dependencies.invalidate()
+        self.addCleanup(dependencies.invalidate)
+
+    def test_warm_up(self):
+        provider = _Provider()
+        provider.add(GitPath, HgPath, LocalPath)
+        with patch('shutil.which', side_effect=lambda executable: '/usr/bin/git' if executable == 'git' else None):
+            results = provider.warm_up()
+            self.assertEqual({GitPath, HgPath, LocalPath}, set(results))
+            self.assertIsNone(results[GitPath])
+            self.assertIsNone(results[LocalPath])
+            self.assertIsInstance(results[HgPath], NotInstalledError)
+
+    def test_parallel(self):
+        providers = []
+        for name in ['one', 'two', 'three', 'four']:
+            provider = type(name, (BasePath,), {'dependencies': [f'slow_{name}'], 'executables': []})
+            providers.append(pattern(f'{name}://')(provider))
+        provider = _Provider()
+        provider.add(*providers)
+
+        def import_module(module):
+            time.sleep(0.3)
+            return module
+
+        with patch('importlib.import_module', side_effect=import_module) as imported:
+            start = time.perf_counter()
+            results = provider.warm_up(max_workers=4)
+            elapsed = time.perf_counter() - start
+            # Concurrent lookups of the same module wait for the running import
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                self.assertEqual(list(executor.map(do_import, ['slow_five'] * 4)), ['slow_five'] * 4)
+        self.assertEqual(set(results.values()), {None})
+        self.assertLess(elapsed, 0.9)
+        self.assertEqual(imported.call_count, 5)
@@ -1,4 +1,5 @@
 import unittest
+from stat import S_IFDIR, S_IFREG
 from unittest.mock import MagicMock, patch
 
 from anypath.anypath import AnyPath, path_provider
@@ -15,6 +16,9 @@ class TestFetching(unittest.TestCase):
         path_provider.add(LocalPath, HttpPath, SftpPath, GitPath, HgPath)
         self.deps = []
 
+    def tearDown(self):
+        path_provider.shutdown()
+
     def mocked_dependencies(self):
         return self.deps
 
@@ -27,7 +31,7 @@ class TestFetching(unittest.TestCase):
         HttpPath._check_dependencies = self.mocked_dependencies
         req_mock = MagicMock()
         res_mock = MagicMock()
-        res_mock.text = 'Content'
+        res_mock.iter_content.return_value = [b'Cont', b'ent']
         req_mock.Session().send.return_value = res_mock
 
         self.deps.append(req_mock)
@@ -36,6 +40,45 @@ class TestFetching(unittest.TestCase):
             content = path.read_text()
         self.assertEqual(content, 'Content', 'Content was not created')
 
+    def test_http_binary(self):
+        HttpPath._check_dependencies = self.mocked_dependencies
+        req_mock = MagicMock()
+        res_mock = MagicMock()
+        res_mock.headers = {'Content-Length': '4'}
+        res_mock.iter_content.return_value = [b'\x00\xff', b'\r\n']
+        req_mock.Session().send.return_value = res_mock
+        progress = MagicMock()
+
+        self.deps.append(req_mock)
+
+        with AnyPath('http://example.com', chunk_size=2, progress=progress) as path:
+            content = path.read_bytes()
+        self.assertEqual(content, b'\x00\xff\r\n', 'Binary content was altered')
+        res_mock.iter_content.assert_called_with(chunk_size=2)
+        self.assertEqual(progress.call_count, 2)
+        self.assertEqual(progress.call_args[0][:2], (4, 4))
+
+    def test_http_pooled(self):
+        HttpPath._check_dependencies = self.mocked_dependencies
+        req_mock = MagicMock()
+        req_mock.Session().send.return_value.iter_content.return_value = [b'Content']
+        req_mock.Session.reset_mock()
+
+        self.deps.append(req_mock)
+
+        for path in ['http://example.com/a', 'http://example.com/b']:
+            with AnyPath(path):
+                pass
+        with AnyPath('http://example.org'):
+            pass
+        self.assertEqual(req_mock.Session.call_count, 2, 'Sessions were not reused per host')
+
+        path_provider.shutdown()
+        with AnyPath('http://example.com/a', pooled=False):
+            pass
+        self.assertEqual(req_mock.Session.call_count, 3)
+        self.assertEqual(HttpPath.pool.sessions, {})
+
     def test_sftp(self):
         SftpPath._check_dependencies = self.mocked_dependencies
         sftp_mock = MagicMock()
@@ -46,14 +89,38 @@ class TestFetching(unittest.TestCase):
         with AnyPath('ssh://user@host:example') as path:
             self.assertTrue(path.parent.exists(), 'Path was not created')
 
+    def test_sftp_tree(self):
+        SftpPath._check_dependencies = self.mocked_dependencies
+        sftp_mock = MagicMock()
+        sftp_mock.hostkeys.HostKeys().items.return_value = {'key': 'value'}
+        tree = {'/data': [('sub', S_IFDIR), ('a.txt', S_IFREG)], '/data/sub': [('b.txt', S_IFREG)]}
+        client = sftp_mock.SFTPClient.from_transport()
+        client.listdir_attr.side_effect = lambda path: [MagicMock(filename=name, st_mode=mode, st_size=7)
+                                                        for name, mode in tree[path]]
+        client.open().__enter__().read.side_effect = lambda size: next(chunks)
+        chunks = iter([b'Content', b'', b'Content', b''])
+        progress = MagicMock()
+
+        self.deps.append(sftp_mock)
+
+        fetcher = AnyPath('ssh://user@host:/data', channels=1, progress=progress)
+        with fetcher as path:
+            self.assertEqual(path.joinpath('data', 'a.txt').read_text(), 'Content')
+            self.assertEqual(path.joinpath('data', 'sub', 'b.txt').read_text(), 'Content')
+        self.assertEqual(fetcher.stats['files'], 2)
+        self.assertEqual(fetcher.stats['bytes'], 14)
+        self.assertEqual(progress.call_args[0][:2], (14, 2))
+
     def test_git(self):
         GitPath._check_dependencies = self.mocked_dependencies
-        with patch('subprocess.Popen'):
+        with patch('subprocess.Popen') as popen_mock:
+            popen_mock.return_value.returncode = 0
             with AnyPath('git://asdas') as path:
                 self.assertTrue(path.parent.exists(), 'Path was not created')
 
     def test_hg(self):
         HgPath._check_dependencies = self.mocked_dependencies
-        with patch('subprocess.Popen'):
+        with patch('subprocess.Popen') as popen_mock:
+            popen_mock.return_value.returncode = 0
             with AnyPath('hg+http://asdas') as path:
                 self.assertTrue(path.parent.exists(), 'Path was not created')
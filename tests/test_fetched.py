@@ -0,0 +1,56 @@
+import io
+import unittest
+from tempfile import TemporaryDirectory
+
+from anypath.anypath import AnyPath, path_provider
+from anypath.fetched import FetchedPath, FetchedStream
+from anypath.pathprovider.local import LocalPath
+
+
+class TestFetchedPath(unittest.TestCase):
+
+    def setUp(self):
+        self.td = TemporaryDirectory()
+        self.path = FetchedPath(self.td.name, 'data.bin')
+        self.path.write_bytes(b'header\n' + b'x' * 100000)
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_fetch_returns_fetched_path(self):
+        path_provider.add(LocalPath)
+        with AnyPath('./resources/localfile.txt') as path:
+            self.assertIsInstance(path, FetchedPath)
+            with path.mmap() as mapped:
+                self.assertEqual(mapped[:], b'Content')
+
+    def test_mmap(self):
+        with self.path.mmap() as mapped:
+            self.assertEqual(len(mapped), 100007)
+            self.assertEqual(mapped[:6], b'header')
+            self.assertEqual(mapped.find(b'\n'), 6)
+        # Joined paths are FetchedPaths too
+        empty = self.path.parent.joinpath('empty')
+        empty.touch()
+        with empty.mmap() as mapped:
+            self.assertEqual(len(mapped), 0)
+
+    def test_iter_bytes(self):
+        chunks = list(self.path.iter_bytes(chunk_size=30000))
+        self.assertEqual([len(chunk) for chunk in chunks], [30000, 30000, 30000, 10007])
+        self.assertEqual(b''.join(chunks), self.path.read_bytes())
+
+
+class TestFetchedStream(unittest.TestCase):
+
+    def test_read_once(self):
+        stream = FetchedStream(iter([b'a,b\n', b'1,2\n']))
+        self.assertEqual(io.TextIOWrapper(stream.open()).readlines(), ['a,b\n', '1,2\n'])
+        with self.assertRaises(IOError):
+            stream.read_bytes()
+
+    def test_close(self):
+        closed = []
+        with FetchedStream(iter([b'a']), lambda: closed.append(True)) as stream:
+            self.assertEqual(list(stream.iter_bytes()), [b'a'])
+        self.assertEqual(closed, [True])
@@ -0,0 +1,128 @@
+import asyncio
+import shutil
+import subprocess
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from anypath.anypath import AnyPath, path_provider
+from anypath.batch import FetchBatch
+from anypath.pathprovider.git import GitPath
+from anypath.runner import ProcessTimeout
+
+
+def git(*args, cwd=None):
+    subprocess.run(['git', '-c', 'user.name=anypath', '-c', 'user.email=anypath@localhost', *args],
+                   cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def git_output(*args, cwd=None):
+    return subprocess.run(['git', *args], cwd=cwd, check=True, stdout=subprocess.PIPE, text=True).stdout.strip()
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git is not installed')
+class TestGitMirror(unittest.TestCase):
+
+    def setUp(self):
+        path_provider.add(GitPath)
+        # Other tests replace the dependency check with a mock of their own
+        patcher = patch.object(GitPath, '_check_dependencies', return_value=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.td = TemporaryDirectory()
+        self.remote = Path(self.td.name).joinpath('remote')
+        self.mirrors = Path(self.td.name).joinpath('mirrors')
+        git('init', '-q', '-b', 'master', str(self.remote))
+        self.commit({'a.txt': 'a1', 'docs/b.txt': 'b1'})
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def commit(self, files):
+        for name, content in files.items():
+            self.remote.joinpath(name).parent.mkdir(parents=True, exist_ok=True)
+            self.remote.joinpath(name).write_text(content)
+        git('add', '.', cwd=self.remote)
+        git('commit', '-q', '-m', 'commit', cwd=self.remote)
+
+    def uri(self):
+        return f'git+file://{self.remote}'
+
+    def test_mirror_is_updated(self):
+        with AnyPath(self.uri(), mirror_dir=str(self.mirrors)) as path:
+            self.assertEqual(path.joinpath('a.txt').read_text(), 'a1')
+        self.assertEqual(len(list(self.mirrors.glob('*.git'))), 1)
+
+        self.commit({'a.txt': 'a2'})
+        with AnyPath(self.uri(), mirror_dir=str(self.mirrors)) as path:
+            self.assertEqual(path.joinpath('a.txt').read_text(), 'a2')
+            self.assertTrue(path.joinpath('.git', 'objects', 'info', 'alternates').exists(), 'Objects are not shared')
+
+    def test_persisted_without_mirror(self):
+        persist_dir = Path(self.td.name).joinpath('persisted')
+        with AnyPath(self.uri(), str(persist_dir), mirror_dir=str(self.mirrors)):
+            pass
+        self.assertFalse(persist_dir.joinpath('.git', 'objects', 'info', 'alternates').exists())
+        shutil.rmtree(self.mirrors)
+        self.assertEqual(git_output('log', '--format=%s', cwd=persist_dir), 'commit')
+
+    def test_persist_again(self):
+        persist_dir = Path(self.td.name).joinpath('persisted')
+        with AnyPath(self.uri(), str(persist_dir)):
+            pass
+        git('rm', '-q', 'docs/b.txt', cwd=self.remote)
+        self.commit({'a.txt': 'a2'})
+        with AnyPath(self.uri(), str(persist_dir)) as path:
+            self.assertEqual(path.joinpath('a.txt').read_text(), 'a2')
+        self.assertEqual(git_output('status', '--porcelain', cwd=persist_dir), '')
+        self.assertFalse(persist_dir.joinpath('docs').exists())
+
+    def test_concurrent_mirror(self):
+        options = {'mirror_dir': str(self.mirrors)}
+        for _ in range(2):
+            batch = FetchBatch([(self.uri(), options)] * 4)
+            with batch as paths:
+                self.assertEqual(batch.errors, {})
+                self.assertEqual({p.joinpath('a.txt').read_text() for p in paths}, {'a1'})
+        self.assertEqual([p.name for p in self.mirrors.iterdir() if not p.name.endswith('.lock')],
+                         [GitPath('git+file://', str(self.remote), None, **options).mirror.name])
+
+    def test_concurrent_mirror_async(self):
+        async def fetch():
+            async with AnyPath(self.uri(), mirror_dir=str(self.mirrors)) as path:
+                return path.joinpath('a.txt').read_text()
+
+        async def main():
+            return await asyncio.gather(*[fetch() for _ in range(4)])
+
+        self.assertEqual(asyncio.run(main()), ['a1'] * 4)
+
+    def test_killed_mirror_clone(self):
+        def killed(args, *_):
+            # A clone which is killed midway leaves an incomplete repository behind
+            Path(args[-1]).joinpath('objects').mkdir(parents=True)
+            raise ProcessTimeout(args, -9, '')
+
+        with patch('anypath.runner.run', killed), self.assertRaises(ProcessTimeout):
+            AnyPath(self.uri(), mirror_dir=str(self.mirrors)).fetch()
+        self.assertEqual([p for p in self.mirrors.iterdir() if not p.name.endswith('.lock')], [])
+        with AnyPath(self.uri(), mirror_dir=str(self.mirrors)) as path:
+            self.assertEqual(path.joinpath('a.txt').read_text(), 'a1')
+
+    def test_shallow_sparse(self):
+        self.commit({'a.txt': 'a2'})
+        with AnyPath(self.uri(), mirror_dir=str(self.mirrors), depth=1, sparse=['docs']) as path:
+            self.assertEqual(path.joinpath('docs', 'b.txt').read_text(), 'b1')
+        mirror = next(self.mirrors.glob('*.git'))
+        self.assertTrue(mirror.joinpath('shallow').exists(), 'Mirror is not shallow')
+        # A request for the full history does not reuse the shallow mirror
+        with AnyPath(self.uri(), mirror_dir=str(self.mirrors)) as path:
+            self.assertEqual(git_output('rev-list', '--count', 'HEAD', cwd=path), '2')
+        self.assertEqual(len(list(self.mirrors.glob('*.git'))), 2)
+
+    def test_commands_without_mirror(self):
+        ap = AnyPath('git+https://host/repo.git', depth=1, single_branch=True, filter='blob:none')
+        ap.out_path = Path('out')
+        self.assertEqual(ap._commands(), [['git', 'clone', '-b', 'master', '--depth', '1', '--filter=blob:none',
+                                           '--single-branch', 'https://host/repo.git', 'out']])
@@ -0,0 +1,120 @@
+import asyncio
+import shutil
+import subprocess
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from anypath.anypath import AnyPath, path_provider
+from anypath.batch import FetchBatch
+from anypath.pathprovider.mercurial import HgPath
+from anypath.runner import ProcessTimeout
+
+
+def hg(*args, cwd=None):
+    subprocess.run(['hg', '--config', 'ui.username=anypath', *args],
+                   cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@unittest.skipIf(shutil.which('hg') is None, 'mercurial is not installed')
+class TestHgStore(unittest.TestCase):
+
+    def setUp(self):
+        path_provider.add(HgPath)
+        # Other tests replace the dependency check with a mock of their own
+        patcher = patch.object(HgPath, '_check_dependencies', return_value=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.td = TemporaryDirectory()
+        self.remote = Path(self.td.name).joinpath('remote')
+        self.stores = Path(self.td.name).joinpath('stores')
+        hg('init', str(self.remote))
+        self.commit({'a.txt': 'a1', 'docs/b.txt': 'b1'})
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def commit(self, files, branch=None):
+        if branch is not None:
+            hg('branch', '-f', branch, cwd=self.remote)
+        for name, content in files.items():
+            self.remote.joinpath(name).parent.mkdir(parents=True, exist_ok=True)
+            self.remote.joinpath(name).write_text(content)
+        hg('commit', '-A', '-m', 'commit', cwd=self.remote)
+
+    def uri(self):
+        return f'hg+file://{self.remote}'
+
+    def test_store_is_updated(self):
+        with AnyPath(self.uri(), store_dir=str(self.stores)) as path:
+            self.assertEqual(path.joinpath('a.txt').read_text(), 'a1')
+        self.assertEqual(len(list(self.stores.glob('*.hg'))), 1)
+
+        self.commit({'a.txt': 'a2'})
+        with AnyPath(self.uri(), store_dir=str(self.stores)) as path:
+            self.assertEqual(path.joinpath('a.txt').read_text(), 'a2')
+            self.assertTrue(path.joinpath('.hg', 'sharedpath').exists(), 'History is not shared')
+
+    def test_persisted_without_store(self):
+        self.commit({'a.txt': 'a2'})
+        persist_dir = Path(self.td.name).joinpath('persisted')
+        with AnyPath(self.uri(), str(persist_dir), store_dir=str(self.stores), rev='0', narrow=['docs']) as path:
+            self.assertEqual(sorted(p.name for p in path.iterdir()), ['.hg', 'docs'])
+        self.assertFalse(persist_dir.joinpath('.hg', 'sharedpath').exists())
+        shutil.rmtree(self.stores)
+        output = subprocess.run(['hg', '--config', 'extensions.narrow=', '-R', str(persist_dir), 'log', '-r', '.',
+                                 '-T', '{rev}'], check=True, stdout=subprocess.PIPE, text=True).stdout
+        self.assertEqual(output, '0')
+
+    def test_concurrent_store(self):
+        batch = FetchBatch([(self.uri(), {'store_dir': str(self.stores)})] * 4)
+        with batch as paths:
+            self.assertEqual(batch.errors, {})
+            self.assertEqual({p.joinpath('a.txt').read_text() for p in paths}, {'a1'})
+
+        async def fetch():
+            async with AnyPath(self.uri(), store_dir=str(self.stores)) as path:
+                return path.joinpath('a.txt').read_text()
+
+        async def main():
+            return await asyncio.gather(*[fetch() for _ in range(4)])
+
+        self.assertEqual(asyncio.run(main()), ['a1'] * 4)
+        self.assertEqual(len([p for p in self.stores.iterdir() if not p.name.endswith('.lock')]), 1)
+
+    def test_killed_store_clone(self):
+        def killed(args, *_):
+            # A clone which is killed midway leaves an incomplete repository behind
+            Path(args[-1]).joinpath('.hg').mkdir(parents=True)
+            raise ProcessTimeout(args, -9, '')
+
+        with patch('anypath.runner.run', killed), self.assertRaises(ProcessTimeout):
+            AnyPath(self.uri(), store_dir=str(self.stores)).fetch()
+        self.assertEqual([p for p in self.stores.iterdir() if not p.name.endswith('.lock')], [])
+        with AnyPath(self.uri(), store_dir=str(self.stores)) as path:
+            self.assertEqual(path.joinpath('a.txt').read_text(), 'a1')
+
+    def test_rev_and_branch(self):
+        self.commit({'a.txt': 'a2'})
+        self.commit({'a.txt': 'dev'}, branch='dev')
+        with AnyPath(self.uri(), store_dir=str(self.stores), branch='dev') as path:
+            self.assertEqual(path.joinpath('a.txt').read_text(), 'dev')
+        with AnyPath(self.uri(), store_dir=str(self.stores), rev='0') as path:
+            self.assertEqual(path.joinpath('a.txt').read_text(), 'a1')
+        with AnyPath(self.uri(), rev='1') as path:
+            self.assertEqual(path.joinpath('a.txt').read_text(), 'a2')
+
+    def test_narrow(self):
+        with AnyPath(self.uri(), store_dir=str(self.stores), narrow=['docs']) as path:
+            self.assertEqual(path.joinpath('docs', 'b.txt').read_text(), 'b1')
+            self.assertFalse(path.joinpath('a.txt').exists())
+        with AnyPath(self.uri(), store_dir=str(self.stores)) as path:
+            self.assertTrue(path.joinpath('a.txt').exists())
+        self.assertEqual(len(list(self.stores.glob('*.hg'))), 2)
+
+    def test_commands_without_store(self):
+        ap = AnyPath('hg+https://host/repo', branch='stable', narrow=['docs'])
+        ap.out_path = Path('out')
+        self.assertEqual(ap._commands(), [['hg', '--config', 'extensions.narrow=', 'clone', '-b', 'stable', '--narrow',
+                                           '--include', 'docs', '-u', 'stable', 'https://host/repo', 'out']])
@@ -0,0 +1,283 @@
+import hashlib
+import io
+import json
+import sys
+import tarfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from requests import HTTPError
+
+from anypath.anypath import BasePath
+from anypath.cache import FetchCache
+from anypath.integrity import ChecksumMismatch
+from anypath.pathprovider.http import HttpPath
+from anypath.scratch import OWNER
+
+BODY = bytes(range(256)) * 1000
+ETAG = '"v1"'
+LAST_MODIFIED = 'Wed, 01 Jan 2020 00:00:00 GMT'
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves BODY with validators, conditional requests and single byte ranges, /norange ignores ranges,
+    /nocontentrange and /wrongrange answer them with a missing or wrong Content-Range.
+    Other bodies can be served by their path via bodies.
+    """
+    protocol_version = 'HTTP/1.1'
+    requests = []
+    bodies = {}
+
+    def do_HEAD(self):
+        self.respond(body=False)
+
+    def do_GET(self):
+        self.respond(body=True)
+
+    def respond(self, body):
+        self.requests.append((self.command, dict(self.headers)))
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/error':
+            self.send_response(500)
+            self.send_header('Content-Length', '16')
+            self.end_headers()
+            if body:
+                self.wfile.write(b'<h1>500 oops</h1>'[:16])
+            return
+        data = self.bodies.get(self.path, BODY)
+        ranges = self.path != '/norange'
+        start, end, status = 0, len(data), 200
+        requested = self.headers.get('Range')
+        if ranges and requested and self.headers.get('If-Range', ETAG) == ETAG:
+            first, last = requested[len('bytes='):].split('-')
+            start, end, status = int(first), int(last) + 1 if last else len(data), 206
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '21')
+                self.end_headers()
+                if body:
+                    self.wfile.write(b'Range Not Satisfiable')
+                return
+        self.send_response(status)
+        self.send_header('ETag', ETAG)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Content-Length', str(end - start))
+        if ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206 and self.path != '/nocontentrange':
+            # /wrongrange claims to start one byte later than it does
+            first = start + 1 if self.path == '/wrongrange' else start
+            self.send_header('Content-Range', f'bytes {first}-{end - 1}/{len(data)}')
+        self.end_headers()
+        if body:
+            self.wfile.write(data[start:end])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QuietServer(ThreadingHTTPServer):
+    """Does not log clients which close a connection before they read the whole response, e.g. after an error"""
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class TestHttpRanges(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = QuietServer(('127.0.0.1', 0), RangeHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        HttpPath.shutdown()
+
+    def setUp(self):
+        RangeHandler.requests = []
+        self.td = TemporaryDirectory()
+        self.target = Path(self.td.name).joinpath('file.bin')
+        # Other tests replace the dependency check of HttpPath with a mock
+        patcher = patch.object(HttpPath, '_check_dependencies', BasePath._check_dependencies)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def fetch(self, path='/file', persist_dir=None, **options):
+        with HttpPath('http://', self.url[len('http://'):] + path, persist_dir, cache=False, **options) as path:
+            return path.read_bytes()
+
+    def test_byte_range(self):
+        self.assertEqual(self.fetch(byte_range=(10, 20)), BODY[10:20])
+        self.assertEqual(RangeHandler.requests[0][1]['Range'], 'bytes=10-19')
+        self.assertEqual(self.fetch(byte_range=(255990, None)), BODY[255990:])
+
+    def test_byte_range_unsupported(self):
+        self.assertEqual(self.fetch('/norange', byte_range=(1000, 1010)), BODY[1000:1010])
+
+    def test_byte_range_errors(self):
+        for options in [{}, {'spool': False}]:
+            with self.assertRaises(IOError):
+                fetcher = HttpPath('http://', self.url[len('http://'):] + '/file', None, cache=False,
+                                   byte_range=(len(BODY) + 10, None), **options)
+                with fetcher as path:
+                    path.read_bytes()
+        with self.assertRaisesRegex(IOError, 'Content-Range'):
+            self.fetch('/nocontentrange', byte_range=(10, 20))
+        self.target.parent.joinpath('.file.bin.part').write_bytes(BODY[:1000])
+        with self.assertRaisesRegex(IOError, 'Content-Range'):
+            self.fetch('/nocontentrange', persist_dir=str(self.target), resume=True)
+
+    def test_resume(self):
+        self.target.parent.joinpath('.file.bin.part').write_bytes(BODY[:1000])
+        self.target.parent.joinpath('.file.bin.part.json').write_text(json.dumps({'etag': ETAG}))
+        self.assertEqual(self.fetch(persist_dir=str(self.target), resume=True), BODY)
+        headers = RangeHandler.requests[0][1]
+        self.assertEqual((headers['Range'], headers['If-Range']), ('bytes=1000-', ETAG))
+        self.assertEqual(self.target.read_bytes(), BODY)
+        self.assertEqual(sorted(p.name for p in self.target.parent.iterdir()), ['file.bin'])
+
+    def test_resume_complete(self):
+        # E.g. the process crashed before the complete partial download was moved
+        self.target.parent.joinpath('.file.bin.part').write_bytes(BODY)
+        self.target.parent.joinpath('.file.bin.part.json').write_text(json.dumps({'etag': ETAG}))
+        self.assertEqual(self.fetch(persist_dir=str(self.target), resume=True), BODY)
+        self.assertEqual(len(RangeHandler.requests), 1)
+        self.assertEqual(sorted(p.name for p in self.target.parent.iterdir()), ['file.bin'])
+        # A partial download which is larger than the resource is fetched again
+        self.target.unlink()
+        self.target.parent.joinpath('.file.bin.part').write_bytes(BODY + b'garbage')
+        self.assertEqual(self.fetch(persist_dir=str(self.target), resume=True), BODY)
+        self.assertEqual(RangeHandler.requests[-1][1].get('Range'), None)
+        self.assertEqual(sorted(p.name for p in self.target.parent.iterdir()), ['file.bin'])
+
+    def test_resume_changed(self):
+        self.target.parent.joinpath('.file.bin.part').write_bytes(b'outdated')
+        self.target.parent.joinpath('.file.bin.part.json').write_text(json.dumps({'etag': '"v0"'}))
+        self.assertEqual(self.fetch(persist_dir=str(self.target), resume=True), BODY)
+
+    def test_resume_after_failure(self):
+        response_body = iter([BODY[:500], ConnectionError('Connection reset')])
+
+        def iter_content(response, chunk_size):
+            for chunk in response_body:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+
+        with patch('requests.models.Response.iter_content', iter_content):
+            with self.assertRaises(ConnectionError):
+                self.fetch(persist_dir=str(self.target), resume=True)
+        self.assertEqual(self.target.parent.joinpath('.file.bin.part').read_bytes(), BODY[:500])
+        self.assertEqual(self.fetch(persist_dir=str(self.target), resume=True), BODY)
+        self.assertEqual(RangeHandler.requests[-1][1]['Range'], 'bytes=500-')
+
+    def test_conditional(self):
+        self.assertEqual(self.fetch(persist_dir=str(self.target), conditional=True), BODY)
+        progress = MagicMock()
+        self.assertEqual(self.fetch(persist_dir=str(self.target), conditional=True, progress=progress), BODY)
+        self.assertEqual(RangeHandler.requests[-1][1]['If-None-Match'], ETAG)
+        progress.assert_not_called()
+        # Without the persisted copy the validators are not used
+        self.target.unlink()
+        self.assertEqual(self.fetch(persist_dir=str(self.target), conditional=True), BODY)
+        self.assertNotIn('If-None-Match', RangeHandler.requests[-1][1])
+
+    def test_error_status(self):
+        cache = FetchCache(Path(self.td.name).joinpath('cache'))
+        for persist_dir, options in [(None, {'cache': cache}), (str(self.target), {'conditional': True, 'cache': False}),
+                                     (None, {'spool': False, 'cache': False})]:
+            fetcher = HttpPath('http://', self.url[len('http://'):] + '/error', persist_dir, **options)
+            with self.assertRaises(HTTPError):
+                fetcher.fetch()
+            fetcher.close()
+        self.assertIsNone(cache.get(f'{self.url}/error', {}, HttpPath))
+        self.assertEqual([path.name for path in Path(self.td.name).iterdir()], ['cache'])
+
+    def test_segments(self):
+        with patch.object(HttpPath, 'min_segment_size', 1000):
+            self.assertEqual(self.fetch(segments=4), BODY)
+        ranges = sorted(headers['Range'] for method, headers in RangeHandler.requests if method == 'GET')
+        self.assertEqual(ranges, ['bytes=0-63999', 'bytes=128000-191999', 'bytes=192000-255999', 'bytes=64000-127999'])
+
+    def test_segments_content_range(self):
+        with patch.object(HttpPath, 'min_segment_size', 1000):
+            for path in ['/nocontentrange', '/wrongrange']:
+                with self.assertRaisesRegex(IOError, 'Content-Range|another range'):
+                    self.fetch(path, segments=4)
+
+    def test_segments_fallback(self):
+        self.assertEqual(self.fetch(segments=4), BODY)
+        with patch.object(HttpPath, 'min_segment_size', 1000):
+            self.assertEqual(self.fetch('/norange', segments=4), BODY)
+        self.assertEqual([method for method, _ in RangeHandler.requests], ['HEAD', 'GET', 'HEAD', 'GET'])
+
+    def test_extract(self):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+            info = tarfile.TarInfo('data/body.bin')
+            info.size = len(BODY)
+            tar.addfile(info, io.BytesIO(BODY))
+        RangeHandler.bodies['/data.tar.gz'] = buffer.getvalue()
+        fetcher = HttpPath('http://', self.url[len('http://'):] + '/data.tar.gz', None, cache=False, extract=True)
+        with fetcher as path:
+            self.assertEqual(path.joinpath('data', 'body.bin').read_bytes(), BODY)
+            self.assertEqual([p.name for p in Path(fetcher.td).iterdir() if not p.name.startswith(OWNER)], ['out'])
+        self.assertEqual(fetcher.written, len(buffer.getvalue()))
+
+    def test_checksum(self):
+        checksum = 'sha256:' + hashlib.sha256(BODY).hexdigest()
+        with patch('anypath.integrity.file_digest') as file_digest:
+            self.assertEqual(self.fetch(persist_dir=str(self.target), checksum=checksum), BODY)
+        file_digest.assert_not_called()
+        # The persisted copy already matches, it is not downloaded again
+        self.assertEqual(self.fetch(persist_dir=str(self.target), checksum=checksum), BODY)
+        self.assertEqual(len(RangeHandler.requests), 1)
+        with self.assertRaises(ChecksumMismatch):
+            self.fetch(checksum='sha256:' + hashlib.sha256(b'other').hexdigest())
+
+    def test_stream(self):
+        checksum = 'sha256:' + hashlib.sha256(BODY).hexdigest()
+        fetcher = HttpPath('http://', self.url[len('http://'):] + '/file', None, cache=False, spool=False,
+                           checksum=checksum, chunk_size=1000)
+        with fetcher as stream:
+            self.assertIsNone(fetcher.td)
+            chunks = list(stream.iter_bytes())
+        self.assertEqual(b''.join(chunks), BODY)
+        self.assertEqual(max(len(chunk) for chunk in chunks), 1000)
+        self.assertIsNone(fetcher.response)
+
+    def test_stream_range_and_mismatch(self):
+        path = self.url[len('http://'):] + '/norange'
+        with HttpPath('http://', path, None, cache=False, spool=False, byte_range=(1000, 1010)) as stream:
+            self.assertEqual(stream.read_bytes(), BODY[1000:1010])
+        with HttpPath('http://', path, None, cache=False, spool=False, checksum='sha256:00') as stream:
+            with self.assertRaises(ChecksumMismatch):
+                stream.read_bytes()
+
+    def test_options(self):
+        with self.assertRaises(ValueError):
+            HttpPath('http://', 'host/file', None, resume=True)
+        with self.assertRaises(ValueError):
+            HttpPath('http://', 'host/file', '/tmp/file', resume=True, byte_range=(0, 10))
+        with self.assertRaises(ValueError):
+            HttpPath('http://', 'host/file', None, extract=True, segments=4)
+        with self.assertRaises(ValueError):
+            HttpPath('http://', 'host/file', '/tmp/file', spool=False)
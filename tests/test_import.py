@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def imported_modules(code, path=()):
+    """Runs code in a fresh interpreter with -X importtime.
+    :return: The cumulative import time in us of every module imported by an import statement and the names of all
+    modules which were imported, also those imported with importlib which -X importtime does not report
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(ROOT), *path]))
+    code += '\nimport sys\nprint("\\n".join(sys.modules))'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times, set(result.stdout.splitlines())
+
+
+class TestImportTime(unittest.TestCase):
+
+    def setUp(self):
+        # Declares the entry points of setup.py like an installed distribution of anypath would
+        self.td = TemporaryDirectory()
+        dist_info = Path(self.td.name).joinpath('anypath-1.0.0.dist-info')
+        dist_info.mkdir()
+        dist_info.joinpath('METADATA').write_text('Name: anypath\nVersion: 1.0.0\n')
+        dist_info.joinpath('entry_points.txt').write_text(
+            '[anypath.providers]\n'
+            'http:// = anypath.pathprovider.http:HttpPath\n'
+            'sftp:// = anypath.pathprovider.sftp:SftpPath\n'
+            'git:// = anypath.pathprovider.git:GitPath\n')
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_import(self):
+        times, modules = imported_modules('import anypath.anypath')
+        self.assertIn('anypath.anypath', times)
+        for heavy in ['requests', 'paramiko', 'asyncio', 'anypath.pathprovider.http', 'anypath.pathprovider.sftp']:
+            self.assertNotIn(heavy, modules)
+
+    def test_resolve(self):
+        _, modules = imported_modules('from anypath.anypath import AnyPath; AnyPath("http://example.org")',
+                                   [self.td.name])
+        self.assertIn('anypath.pathprovider.http', modules)
+        # Only the resolved PathProvider is imported, its dependencies are imported once it fetches
+        for heavy in ['requests', 'paramiko', 'anypath.pathprovider.sftp', 'anypath.pathprovider.git']:
+            self.assertNotIn(heavy, modules)
@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from anypath import instrumentation
+from anypath.anypath import BasePath, pattern
+from anypath.instrumentation import Hook, Recorder
+from anypath.remote import RemotePath
+
+
+@pattern('fake://')
+class FakePath(BasePath):
+    """Writes its path as content, counts it as transferred if it starts with 'counted'"""
+
+    @BasePath.wrapped
+    def fetch(self):
+        if self.path == 'fail':
+            raise ConnectionError('Unreachable')
+        if self.path == 'remote':
+            # Like a lazy SftpPath, nothing is written to the temporary directory
+            self.out_path = RemotePath(None, '/remote')
+            return
+        self.out_path.write_text(self.path)
+        if self.path.startswith('counted'):
+            self._count(100, len(self.path))
+
+    @BasePath.awrapped
+    async def afetch(self):
+        self.out_path.write_text(self.path)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.recorder = Recorder()
+        instrumentation.add_hook(self.recorder)
+        self.addCleanup(instrumentation.remove_hook, self.recorder)
+
+    def test_record(self):
+        with FakePath('fake://', 'content', None, cache=False) as path:
+            self.assertEqual(path.read_text(), 'content')
+        record, = self.recorder.records
+        self.assertEqual(record.tags, {'provider': 'FakePath', 'scheme': 'fake://'})
+        self.assertEqual(set(record.phases), {'dependencies', 'temp', 'fetch', 'persist'})
+        self.assertGreaterEqual(record.duration, sum(record.phases.values()))
+        # The bytes written are measured on disk as FakePath does not count them
+        self.assertIsNone(record.transferred)
+        self.assertEqual(record.written, 7)
+
+    def test_counted_bytes(self):
+        with TemporaryDirectory() as td:
+            with FakePath('fake://', 'counted', td + '/persisted', cache=False):
+                pass
+        record, = self.recorder.records
+        self.assertEqual((record.transferred, record.written), (100, 7))
+
+    def test_remote_path(self):
+        with FakePath('fake://', 'remote', None, cache=False) as path:
+            self.assertIsInstance(path, RemotePath)
+        record, = self.recorder.records
+        self.assertIsNone(record.written)
+        self.assertIsNone(record.exception)
+
+    def test_error(self):
+        hook = MagicMock(spec=Hook)
+        instrumentation.add_hook(hook)
+        self.addCleanup(instrumentation.remove_hook, hook)
+        fetcher = FakePath('fake://', 'fail', None, cache=False)
+        with self.assertRaises(ConnectionError):
+            fetcher.fetch()
+        fetcher.close()
+        hook.start.assert_called_once()
+        hook.end.assert_not_called()
+        record, exception = hook.error.call_args[0]
+        self.assertIsInstance(exception, ConnectionError)
+        self.assertIs(record.exception, exception)
+        self.assertIn('fetch', record.phases)
+
+    def test_failing_hook(self):
+        hook = MagicMock(spec=Hook)
+        hook.start.side_effect = RuntimeError('Metrics system is down')
+        instrumentation.add_hook(hook)
+        self.addCleanup(instrumentation.remove_hook, hook)
+        with FakePath('fake://', 'content', None, cache=False) as path:
+            self.assertEqual(path.read_text(), 'content')
+        hook.end.assert_called_once()
+
+    def test_async(self):
+        async def fetch():
+            async with FakePath('fake://', 'content', None, cache=False) as path:
+                return path.read_text()
+
+        self.assertEqual(asyncio.run(fetch()), 'content')
+        record, = self.recorder.records
+        self.assertEqual(set(record.phases), {'dependencies', 'temp', 'fetch', 'persist'})
+
+
+class TestDisabled(unittest.TestCase):
+
+    def test_nothing_is_measured(self):
+        self.assertEqual(instrumentation.hooks, [])
+        with patch('anypath.instrumentation.perf_counter') as perf_counter:
+            fetcher = FakePath('fake://', 'counted', None, cache=False)
+            with fetcher as path:
+                self.assertEqual(path.read_text(), 'counted')
+        perf_counter.assert_not_called()
+        self.assertIsNone(fetcher.record)
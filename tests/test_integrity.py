@@ -0,0 +1,176 @@
+import hashlib
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from anypath.anypath import AnyPath, BasePath, path_provider, pattern
+from anypath.cache import FetchCache
+from anypath.integrity import ChecksumMismatch, Verifier, manifest
+from anypath.pathprovider.local import LocalPath
+from anypath.pathprovider.sftp import SftpPath
+
+
+def sha256(data):
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+@pattern('hashed://')
+class HashedPath(BasePath):
+    """Writes the last part of its path as content and hashes it while writing"""
+    fetches = 0
+
+    @BasePath.wrapped
+    def fetch(self):
+        HashedPath.fetches += 1
+        hasher = self._hasher()
+        content = self.path.rpartition('/')[2].encode()
+        with open(self.out_path, 'wb') as f:
+            f.write(content)
+            hasher.update(content)
+        self._hashed('', hasher)
+
+
+@pattern('tree://')
+class TreePath(BasePath):
+    """Writes a directory with a pinned file and a file whose content is the path"""
+    fetches = 0
+
+    @BasePath.wrapped
+    def fetch(self):
+        TreePath.fetches += 1
+        self.out_path.mkdir()
+        self.out_path.joinpath('pinned.txt').write_text('pinned')
+        self.out_path.joinpath('payload.txt').write_text(self.path)
+
+
+class TestVerifier(unittest.TestCase):
+
+    def setUp(self):
+        self.td = TemporaryDirectory()
+        self.root = Path(self.td.name)
+        self.root.joinpath('sub').mkdir()
+        self.root.joinpath('a.txt').write_bytes(b'a')
+        self.root.joinpath('sub', 'b.txt').write_bytes(b'b')
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_manifest(self):
+        checksums = manifest(self.root)
+        self.assertEqual(checksums, {'a.txt': sha256(b'a'), 'sub/b.txt': sha256(b'b')})
+        verifier = Verifier(checksums)
+        verifier.verify(self.root)
+        self.assertEqual(verifier.digests, checksums)
+
+    def test_mismatch(self):
+        with self.assertRaises(ChecksumMismatch) as context:
+            Verifier({'a.txt': sha256(b'b'), 'missing.txt': sha256(b'')}).verify(self.root)
+        self.assertIn('a.txt has', str(context.exception))
+        self.assertIn('missing.txt is missing', str(context.exception))
+
+    def test_single(self):
+        Verifier(sha256(b'b')).verify(self.root.joinpath('sub'))
+        with self.assertRaises(ChecksumMismatch):
+            Verifier(sha256(b'a')).verify(self.root)
+
+    def test_invalid(self):
+        for checksum in ['abc', 'nohash:abc']:
+            with self.assertRaises(ValueError):
+                Verifier(checksum)
+
+
+class TestChecksums(unittest.TestCase):
+
+    def setUp(self):
+        HashedPath.fetches = 0
+        self.td = TemporaryDirectory()
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_streamed(self):
+        with patch('anypath.integrity.file_digest') as file_digest:
+            with HashedPath('hashed://', 'content', None, cache=False, checksum=sha256(b'content')) as path:
+                self.assertEqual(path.read_text(), 'content')
+        file_digest.assert_not_called()
+
+    def test_mismatch(self):
+        fetcher = HashedPath('hashed://', 'content', None, cache=False, checksum=sha256(b'other'))
+        with self.assertRaises(ChecksumMismatch):
+            fetcher.fetch()
+        fetcher.close()
+
+    def test_local_manifest(self):
+        resources = Path(__file__).parent.joinpath('resources')
+        with LocalPath('', str(resources), None, checksum={'localfile.txt': sha256(b'Content')}) as path:
+            self.assertEqual(path.joinpath('localfile.txt').read_text(), 'Content')
+
+    def test_persisted_copy_matches(self):
+        persisted = Path(self.td.name).joinpath('file')
+        persisted.write_text('content')
+        fetcher = HashedPath('hashed://', 'content', str(persisted), cache=False, checksum=sha256(b'content'))
+        with fetcher as path:
+            self.assertEqual(path, persisted.resolve())
+        self.assertEqual(HashedPath.fetches, 0)
+        persisted.write_text('changed')
+        with HashedPath('hashed://', 'content', str(persisted), cache=False, checksum=sha256(b'content')):
+            pass
+        self.assertEqual(HashedPath.fetches, 1)
+        self.assertEqual(persisted.read_text(), 'content')
+
+    def test_cache_key(self):
+        path_provider.add(HashedPath)
+        cache = FetchCache(self.td.name)
+        checksum = sha256(b'content')
+        for mirror in ['hashed://mirror-a/', 'hashed://mirror-b/']:
+            with AnyPath(mirror + 'content', cache=cache, checksum=checksum) as path:
+                self.assertEqual(path.read_text(), 'content')
+        self.assertEqual(HashedPath.fetches, 1)
+        self.assertEqual(cache.stats['hits'], 1)
+
+    def test_manifest_cache_key(self):
+        # A manifest pins only some files, different resources with the same manifest must not share an entry
+        path_provider.add(TreePath)
+        TreePath.fetches = 0
+        cache = FetchCache(self.td.name)
+        checksums = {'pinned.txt': sha256(b'pinned')}
+        for repo in ['repo-a', 'repo-b', 'repo-a']:
+            with AnyPath(f'tree://{repo}', cache=cache, checksum=checksums) as path:
+                self.assertEqual(path.joinpath('payload.txt').read_text(), repo)
+        self.assertEqual(TreePath.fetches, 2)
+        self.assertEqual(cache.stats['hits'], 1)
+
+    def test_cached_copy_is_verified(self):
+        path_provider.add(HashedPath)
+        HashedPath.fetches = 0
+        cache = FetchCache(self.td.name)
+        checksum = sha256(b'content')
+        with AnyPath('hashed://content', cache=cache, checksum=checksum):
+            pass
+        for data in Path(self.td.name).glob('*/data'):
+            data.write_text('corrupted')
+        with AnyPath('hashed://content', cache=cache, checksum=checksum) as path:
+            self.assertEqual(path.read_text(), 'content')
+        self.assertEqual(HashedPath.fetches, 2)
+
+
+class TestSftpChecksums(unittest.TestCase):
+
+    def setUp(self):
+        self.paramiko = MagicMock()
+        self.paramiko.hostkeys.HostKeys().items.return_value = {'key': 'value'}
+        patcher = patch.object(SftpPath, '_check_dependencies', return_value=[self.paramiko])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_manifest(self):
+        client = self.paramiko.SFTPClient.from_transport()
+        client.listdir_attr.return_value = [MagicMock(filename='a.txt', st_mode=0o100644, st_size=7)]
+        client.open().__enter__().read.side_effect = [b'Content', b'']
+        checksums = {'data/a.txt': sha256(b'Content')}
+        with patch('anypath.integrity.file_digest') as file_digest:
+            fetcher = SftpPath('sftp://', 'user@host:/data', None, cache=False, channels=1, checksum=checksums)
+            with fetcher:
+                self.assertEqual(fetcher.digests, checksums)
+        file_digest.assert_not_called()
@@ -0,0 +1,67 @@
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from anypath import persistence
+from anypath.anypath import AnyPath, path_provider
+from anypath.pathprovider.local import LocalPath
+
+
+class TestPersist(unittest.TestCase):
+
+    def setUp(self):
+        self.td = TemporaryDirectory()
+        self.root = Path(self.td.name)
+        self.src = self.root.joinpath('src')
+        self.src.joinpath('sub').mkdir(parents=True)
+        self.src.joinpath('a.txt').write_text('a')
+        self.src.joinpath('sub', 'b.txt').write_text('b')
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_rename(self):
+        inode = self.src.joinpath('a.txt').stat().st_ino
+        persistence.persist(self.src, self.root.joinpath('dst'))
+        self.assertFalse(self.src.exists())
+        self.assertEqual(self.root.joinpath('dst', 'a.txt').stat().st_ino, inode)
+
+    def test_replace_existing_dir(self):
+        dst = self.root.joinpath('dst')
+        dst.mkdir()
+        dst.joinpath('old.txt').write_text('old')
+        persistence.persist(self.src, dst, ('hardlink', 'copy'))
+        self.assertEqual(dst.joinpath('sub', 'b.txt').read_text(), 'b')
+        # Files which are not in src anymore do not stay behind
+        self.assertFalse(dst.joinpath('old.txt').exists())
+        self.assertEqual(dst.joinpath('a.txt').stat().st_ino, self.src.joinpath('a.txt').stat().st_ino)
+        self.assertEqual(sorted(p.name for p in self.root.iterdir()), ['dst', 'src'])
+
+    def test_replace_failure(self):
+        dst = self.root.joinpath('dst')
+        dst.mkdir()
+        dst.joinpath('old.txt').write_text('old')
+        with self.assertRaises(ValueError):
+            persistence.persist(self.src, dst, ())
+        self.assertEqual([p.name for p in dst.iterdir()], ['old.txt'])
+        self.assertEqual(sorted(p.name for p in self.root.iterdir()), ['dst', 'src'])
+
+    def test_copy_strategies(self):
+        for strategy in persistence.COPY_STRATEGIES:
+            dst = self.root.joinpath(strategy)
+            persistence.persist(self.src, dst, (strategy, 'copy'))
+            self.assertEqual(dst.joinpath('sub', 'b.txt').read_text(), 'b')
+            self.assertNotEqual(dst.joinpath('a.txt').stat().st_ino, self.src.joinpath('a.txt').stat().st_ino)
+
+    def test_file_into_dir(self):
+        dst = self.root.joinpath('dst')
+        dst.mkdir()
+        persistence.persist(self.src.joinpath('a.txt'), dst)
+        self.assertEqual(dst.joinpath('a.txt').read_text(), 'a')
+
+    def test_local_source_is_not_moved(self):
+        path_provider.add(LocalPath)
+        with AnyPath(str(self.src), persist_dir=str(self.root.joinpath('dst'))) as path:
+            self.assertEqual(path.joinpath('a.txt').read_text(), 'a')
+        self.assertTrue(self.src.joinpath('a.txt').exists())
+        self.assertEqual(self.src.joinpath('a.txt').stat().st_nlink, 1)
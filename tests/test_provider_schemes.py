@@ -1,6 +1,11 @@
+import sys
 import unittest
+from importlib import import_module
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
-from anypath.anypath import AnyPath, path_provider
+from anypath.anypath import AnyPath, BasePath, UnknownProtocol, _Provider, path_provider, pattern
 from anypath.pathprovider.git import GitPath
 from anypath.pathprovider.http import HttpPath
 from anypath.pathprovider.local import LocalPath
@@ -80,3 +85,72 @@ class TestSftpSchemes(unittest.TestCase):
     def test_sftp_scheme(self):
         ap = AnyPath('sftp://root@test:/test')
         self.assertEqual(type(ap), SftpPath)
+
+
+@pattern('http://internal.')
+class InternalHttpPath(BasePath):
+    def fetch(self):
+        pass
+
+
+class TestResolution(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = _Provider()
+
+    def test_longest_match(self):
+        for providers in [(HttpPath, InternalHttpPath), (InternalHttpPath, HttpPath)]:
+            provider = _Provider()
+            provider.add(*providers)
+            self.assertEqual(provider.resolve('http://internal.example.org'), ('http://internal.', InternalHttpPath))
+            self.assertEqual(provider.resolve('http://example.org'), ('http://', HttpPath))
+
+    def test_unknown(self):
+        self.provider.add(HttpPath)
+        with self.assertRaises(UnknownProtocol):
+            self.provider.resolve('ftp://example.org')
+        with self.assertRaises(UnknownProtocol):
+            self.provider.resolve('')
+
+    def test_cache_is_cleared_on_add(self):
+        self.provider.add(HttpPath)
+        self.assertEqual(self.provider.resolve('http://internal.example.org')[1], HttpPath)
+        self.provider.add(InternalHttpPath)
+        self.assertEqual(self.provider.resolve('http://internal.example.org')[1], InternalHttpPath)
+
+    def test_resolutions_are_cached(self):
+        self.provider.add(HttpPath, LocalPath)
+        for path in ['http://a/1', 'http://a/2', 'http://a/3']:
+            self.provider.resolve(path)
+        self.assertEqual(self.provider._lookup.cache_info().hits, 2)
+
+
+class TestLazyRegistration(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = _Provider()
+
+    def test_imported_on_first_resolve(self):
+        self.provider.add_lazy('hg+https://', 'anypath.pathprovider.mercurial:HgPath')
+        self.assertEqual(self.provider.providers, set())
+        with patch('anypath.anypath.import_module', wraps=import_module) as imported:
+            self.assertEqual(self.provider.resolve('hg+https://host/repo'), ('hg+https://', HgPath))
+            self.assertEqual(self.provider.resolve('hg+https://host/other'), ('hg+https://', HgPath))
+        imported.assert_called_once_with('anypath.pathprovider.mercurial')
+        self.assertEqual(self.provider.providers, {HgPath})
+
+    def test_added_provider_is_kept(self):
+        self.provider.add(InternalHttpPath)
+        self.provider.add_lazy('http://internal.', 'anypath.pathprovider.http:HttpPath')
+        self.assertEqual(self.provider.resolve('http://internal.example.org')[1], InternalHttpPath)
+
+    def test_discover(self):
+        with TemporaryDirectory() as td:
+            dist_info = Path(td).joinpath('plugin-1.0.dist-info')
+            dist_info.mkdir()
+            dist_info.joinpath('METADATA').write_text('Name: plugin\nVersion: 1.0\n')
+            dist_info.joinpath('entry_points.txt').write_text(
+                '[anypath.providers]\nsftp:// = anypath.pathprovider.sftp:SftpPath\n')
+            with patch.object(sys, 'path', [td] + sys.path):
+                self.assertEqual(self.provider.resolve('sftp://user@host:path'), ('sftp://', SftpPath))
+        self.assertTrue(self.provider.discovered)
@@ -0,0 +1,102 @@
+import os
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from anypath.anypath import AnyPath, path_provider
+from anypath.pathprovider.sftp import SftpPath
+from anypath.remote import RemoteFileSystem, RemotePath
+
+
+class LocalFileSystem(RemoteFileSystem):
+    """Serves a local directory as remote filesystem and records the transferred byte ranges"""
+
+    def __init__(self, root, cache_dir, block_size):
+        super().__init__(cache_dir, block_size)
+        self.root = root
+        self.reads = []
+
+    def _stat(self, path):
+        return os.stat(self.root + path)
+
+    def _listdir(self, path):
+        return [(entry.name, entry.stat()) for entry in os.scandir(self.root + path)]
+
+    def _read(self, path, offset, size):
+        self.reads.append((path, offset))
+        with open(self.root + path, 'rb') as f:
+            f.seek(offset)
+            return f.read(size)
+
+
+class TestRemotePath(unittest.TestCase):
+
+    def setUp(self):
+        self.td = TemporaryDirectory()
+        root = Path(self.td.name).joinpath('remote')
+        root.joinpath('sub').mkdir(parents=True)
+        root.joinpath('a.txt').write_text('Content')
+        root.joinpath('sub', 'b.bin').write_bytes(bytes(range(256)) * 4)
+        self.fs = LocalFileSystem(str(root), Path(self.td.name).joinpath('cache'), block_size=100)
+        self.path = RemotePath(self.fs, '/')
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_metadata(self):
+        self.assertTrue(self.path.joinpath('sub').is_dir())
+        self.assertTrue((self.path / 'a.txt').is_file())
+        self.assertFalse(self.path.joinpath('missing').exists())
+        self.assertEqual(sorted(p.name for p in self.path.iterdir()), ['a.txt', 'sub'])
+        self.assertEqual([str(p) for p in self.path.glob('*/*.bin')], ['/sub/b.bin'])
+        self.assertEqual([str(p) for p in self.path.rglob('*.txt')], ['/a.txt'])
+        self.assertEqual(self.fs.reads, [], 'Metadata access must not transfer file contents')
+
+    def test_range_read(self):
+        with self.path.joinpath('sub', 'b.bin').open('rb') as f:
+            f.seek(650)
+            self.assertEqual(f.read(4), bytes(range(138, 142)))
+        # The read-ahead of one buffer (block_size bytes) spans two blocks, nothing before them is transferred
+        self.assertEqual(self.fs.reads, [('/sub/b.bin', 600), ('/sub/b.bin', 700)])
+
+    def test_block_cache(self):
+        self.assertEqual(self.path.joinpath('sub', 'b.bin').read_bytes(), bytes(range(256)) * 4)
+        self.assertEqual(self.path.joinpath('a.txt').read_text(), 'Content')
+        self.path.joinpath('sub', 'b.bin').read_bytes()
+        self.assertEqual(len(self.fs.reads), 12)
+        self.assertEqual(self.fs.blocks['cached'], 11)
+
+    def test_write_modes(self):
+        with self.assertRaises(ValueError):
+            self.path.joinpath('a.txt').open('w')
+
+
+class TestLazySftp(unittest.TestCase):
+
+    def setUp(self):
+        path_provider.add(SftpPath)
+        self.paramiko = MagicMock()
+        self.paramiko.hostkeys.HostKeys().items.return_value = {'key': 'value'}
+        patcher = patch.object(SftpPath, '_check_dependencies', return_value=[self.paramiko])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_nothing_is_transferred(self):
+        client = self.paramiko.SFTPClient.from_transport()
+        client.normalize.return_value = '/home/user/data'
+        fetcher = AnyPath('sftp://user@host:data', lazy=True)
+        with fetcher as path:
+            self.assertIsInstance(path, RemotePath)
+            self.assertEqual(str(path), '/home/user/data')
+        client.listdir_attr.assert_not_called()
+        client.open.assert_not_called()
+        client.close.assert_called()
+
+    def test_persist_dir(self):
+        with self.assertRaises(ValueError):
+            AnyPath('sftp://user@host:data', lazy=True, persist_dir='/tmp/data')
+
+    def test_checksum(self):
+        with self.assertRaises(ValueError):
+            AnyPath('sftp://user@host:data', lazy=True, checksum='sha256:00')
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+
+from anypath import runner
+from anypath.instrumentation import FetchRecord
+from anypath.runner import ProcessError, ProcessTimeout
+
+
+def python(code):
+    return [sys.executable, '-c', code]
+
+
+class TestRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(runner.set_limit, runner.DEFAULT_LIMIT)
+
+    def test_output(self):
+        lines = []
+        runner.run(python('import sys; print("out"); print("err", file=sys.stderr)'), on_output=lines.append)
+        self.assertEqual(sorted(lines), ['err', 'out'])
+
+    def test_exit_code(self):
+        with self.assertRaises(ProcessError) as context:
+            runner.run(python('import sys; print("fatal: repository not found", file=sys.stderr); sys.exit(128)'))
+        self.assertEqual(context.exception.returncode, 128)
+        self.assertEqual(context.exception.output, 'fatal: repository not found')
+
+    def test_large_output(self):
+        # More than a pipe buffer holds, it must not block the process
+        runner.run(python('import sys; sys.stderr.write("x" * 10 ** 6 + "\\n")'), timeout=10)
+
+    def test_timeout_kills_children(self):
+        with TemporaryDirectory() as td:
+            pid_file = os.path.join(td, 'child.pid')
+            code = ('import subprocess, sys, time; '
+                    f'child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"]); '
+                    f'open({pid_file!r}, "w").write(str(child.pid)); time.sleep(30)')
+            start = time.perf_counter()
+            with self.assertRaises(ProcessTimeout):
+                runner.run(python(code), timeout=1)
+            self.assertLess(time.perf_counter() - start, 10)
+            with open(pid_file) as f:
+                child = int(f.read())
+        for _ in range(50):
+            try:
+                os.kill(child, 0)
+            except ProcessLookupError:
+                break
+            time.sleep(0.1)
+        else:
+            self.fail('The child process was not killed')
+
+    def test_limit(self):
+        runner.set_limit(2)
+        record = FetchRecord('GitPath', 'git://', 'git://host/repo')
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: runner.run(python('import time; time.sleep(0.3)'), record=record), range(4)))
+        self.assertGreaterEqual(time.perf_counter() - start, 0.6)
+        self.assertGreater(record.phases['queue'], 0.3)
+
+    def test_async(self):
+        lines = []
+        asyncio.run(runner.arun(python('print("out")'), on_output=lines.append))
+        self.assertEqual(lines, ['out'])
+        with self.assertRaises(ProcessError):
+            asyncio.run(runner.arun(python('import sys; sys.exit(1)')))
+        with self.assertRaises(ProcessTimeout):
+            asyncio.run(runner.arun(python('import time; time.sleep(30)'), timeout=0.5))
@@ -0,0 +1,112 @@
+import hashlib
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from anypath.anypath import BasePath, pattern, path_provider
+from anypath.dependencies import NotInstalledError
+from anypath.integrity import manifest
+from anypath.pathprovider.local import LocalPath
+from anypath.scheduler import FetchScheduler
+
+
+@pattern('shared://')
+class SharedPath(BasePath):
+    lock = threading.Lock()
+    fetches = 0
+
+    def __init__(self, protocol, path, persist_dir, fail=False, missing=False, **options):
+        super().__init__(protocol, path, persist_dir, **options)
+        self.fail = fail
+        self.missing = missing
+
+    @BasePath.wrapped
+    def fetch(self):
+        with SharedPath.lock:
+            SharedPath.fetches += 1
+        # Long enough for the other callers to arrive while the fetch is running
+        time.sleep(0.05)
+        if self.fail:
+            raise IOError('Fetch failed')
+        if self.missing:
+            raise NotInstalledError('Python module missing is not installed.')
+        self.out_path.write_text(self.path)
+
+
+def read_upper(path):
+    return path.read_text().upper()
+
+
+class TestFetchScheduler(unittest.TestCase):
+
+    def setUp(self):
+        path_provider.add(SharedPath, LocalPath)
+        SharedPath.fetches = 0
+        self.scheduler = FetchScheduler(processes=2)
+        self.addCleanup(self.scheduler.shutdown)
+
+    def fetch_concurrently(self, uris, **options):
+        leases = [self.scheduler.open(uri, cache=False, **options) for uri in uris]
+        with ThreadPoolExecutor(max_workers=len(uris)) as executor:
+            return leases, list(executor.map(lambda lease: lease.fetch(), leases))
+
+    def test_coalesced(self):
+        leases, paths = self.fetch_concurrently(['shared://a'] * 10)
+        self.assertEqual(SharedPath.fetches, 1)
+        self.assertEqual(len(set(paths)), 1)
+        self.assertEqual(self.scheduler.stats, {'fetches': 1, 'coalesced': 9})
+        for lease in leases[:-1]:
+            lease.close()
+        # The files are kept until the last lease is released
+        self.assertEqual(paths[0].read_text(), 'a')
+        leases[-1].close()
+        self.assertFalse(paths[0].exists())
+        self.assertEqual(self.scheduler.shared, {})
+        with self.scheduler.open('shared://a', cache=False) as path:
+            self.assertEqual(path.read_text(), 'a')
+        self.assertEqual(SharedPath.fetches, 2)
+
+    def test_distinct(self):
+        leases, paths = self.fetch_concurrently([f'shared://{i}' for i in range(5)] + ['SHARED://0'])
+        self.assertEqual(SharedPath.fetches, 5)
+        self.assertEqual(paths[0], paths[-1])
+        for lease in leases:
+            lease.close()
+
+    def test_failure(self):
+        with self.assertRaises(IOError):
+            self.fetch_concurrently(['shared://a'] * 3, fail=True)
+        self.assertEqual(SharedPath.fetches, 1)
+        self.assertEqual(self.scheduler.shared, {})
+        with self.assertRaises(IOError):
+            with self.scheduler.open('shared://a', cache=False, fail=True):
+                pass
+        self.assertEqual(SharedPath.fetches, 2)
+
+    def test_missing_dependency(self):
+        for _ in range(2):
+            lease = self.scheduler.open('shared://a', cache=False, missing=True)
+            with self.assertRaises(NotInstalledError):
+                lease.fetch()
+            self.assertIsNone(lease.shared)
+            self.assertEqual(self.scheduler.shared, {})
+        self.assertEqual(self.scheduler.stats['fetches'], 2)
+
+    def test_process(self):
+        lease = self.scheduler.open('shared://abc', cache=False, process=read_upper)
+        with lease:
+            self.assertEqual(lease.result, 'ABC')
+
+    def test_checksums_in_process_pool(self):
+        with TemporaryDirectory() as td:
+            for i in range(3):
+                Path(td, f'{i}.txt').write_text(str(i))
+            checksums = manifest(td)
+            lease = self.scheduler.open(td + '/', checksum=checksums)
+            with lease:
+                self.assertEqual(lease.shared.fetcher.digests, checksums)
+            self.assertIsNotNone(self.scheduler.executor)
+            self.assertEqual(checksums['0.txt'], 'sha256:' + hashlib.sha256(b'0').hexdigest())
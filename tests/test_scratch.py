@@ -0,0 +1,118 @@
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from anypath.anypath import AnyPath, BasePath, pattern, path_provider
+from anypath.scratch import OWNER, ScratchSpace, ScratchSpaceFull, _host_marker, _marker
+
+
+@pattern('sized://')
+class SizedPath(BasePath):
+    """Writes as many bytes as the path says"""
+
+    @BasePath.wrapped
+    def fetch(self):
+        self.out_path.write_bytes(b'x' * int(self.path))
+
+
+def owned(path: Path, marker: str = None):
+    """Creates a directory with an owner marker like the ones ScratchSpace.create writes"""
+    path.joinpath('out').mkdir(parents=True)
+    path.joinpath(marker or _marker()).touch()
+    return path
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+
+class TestScratchSpace(unittest.TestCase):
+
+    def setUp(self):
+        path_provider.add(SizedPath)
+        self.td = TemporaryDirectory()
+        self.addCleanup(self.td.cleanup)
+        self.root = Path(self.td.name)
+
+    def test_background_deletion(self):
+        scratch = ScratchSpace(self.root)
+        fetcher = AnyPath('sized://1000', scratch=scratch)
+        path = fetcher.fetch()
+        self.assertEqual(path.parent.parent, self.root)
+        self.assertTrue(path.parent.name.startswith(f'anypath-{os.getpid()}-'))
+        self.assertEqual(fetcher.disk_usage, 1000)
+        fetcher.close()
+        self.assertFalse(path.parent.exists())
+        self.assertEqual(fetcher.disk_usage, 0)
+        scratch.flush()
+        self.assertEqual(list(self.root.iterdir()), [])
+
+    def test_quota(self):
+        scratch = ScratchSpace(self.root, quota=1000)
+        first = AnyPath('sized://1000', scratch=scratch)
+        first.fetch()
+        self.assertEqual(scratch.used(), 1000)
+        with self.assertRaises(ScratchSpaceFull):
+            AnyPath('sized://1', scratch=scratch).fetch()
+        first.close()
+        scratch.flush()
+        self.assertEqual(scratch.used(), 0)
+        with AnyPath('sized://1', scratch=scratch) as path:
+            self.assertEqual(path.parent.parent, self.root)
+
+    def test_fallback(self):
+        small, large = self.root.joinpath('small'), self.root.joinpath('large')
+        scratch = ScratchSpace(small, quota=10, fallback=ScratchSpace(large))
+        with AnyPath('sized://10', scratch=scratch) as first, AnyPath('sized://100', scratch=scratch) as second:
+            self.assertEqual(first.parent.parent, small)
+            self.assertEqual(second.parent.parent, large)
+        scratch.flush()
+        scratch.fallback.flush()
+        self.assertEqual(list(small.iterdir()) + list(large.iterdir()), [])
+
+    def test_persist_dir(self):
+        persist_dir = self.root.joinpath('persisted')
+        with AnyPath('sized://10', persist_dir=str(persist_dir), scratch=ScratchSpace(self.root.joinpath('scratch'))):
+            pass
+        self.assertEqual(persist_dir.stat().st_size, 10)
+        self.assertEqual([path.name for path in self.root.iterdir()], ['persisted', 'scratch'])
+
+    def test_sweep(self):
+        pid = dead_pid()
+        owned(self.root.joinpath(f'anypath-{pid}-abc'))
+        owned(self.root.joinpath(f'.anypath-trash-{pid}-abc'))
+        # Of an earlier boot, the PID may be in use again
+        owned(self.root.joinpath(f'anypath-{os.getpid()}-boot'), _host_marker() + 'earlier')
+        kept = [owned(self.root.joinpath(f'anypath-{os.getpid()}-abc')),
+                owned(self.root.joinpath(f'anypath-{pid}-host'), f'{OWNER}otherhost-boot'),
+                self.root.joinpath('anypath-abc'),
+                # Only named like a temporary directory, e.g. by the user
+                self.root.joinpath(f'anypath-{pid}-release')]
+        kept[-2].mkdir()
+        kept[-1].mkdir()
+        kept[-1].joinpath('important.txt').write_text('important')
+        scratch = ScratchSpace(self.root)
+        scratch.flush()
+        self.assertEqual(sorted(self.root.iterdir()), sorted(kept))
+
+    def test_sweep_next_to_persist_dir(self):
+        pid = dead_pid()
+        owned(self.root.joinpath(f'anypath-{pid}-abc'))
+        self.root.joinpath(f'anypath-{pid}-notes').mkdir()
+        scratch = ScratchSpace(self.root.joinpath('scratch'))
+        for size in [10, 20]:
+            with AnyPath(f'sized://{size}', persist_dir=str(self.root.joinpath('persisted')), scratch=scratch):
+                pass
+        scratch.flush()
+        self.assertEqual(sorted(path.name for path in self.root.iterdir()),
+                         [f'anypath-{pid}-notes', 'persisted', 'scratch'])
+        self.assertEqual(scratch.roots, {self.root.resolve()})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import os
+import unittest
+from pathlib import Path
+from stat import S_IFDIR, S_IFREG
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from anypath.anypath import AnyPath, path_provider
+from anypath.pathprovider.local import LocalPath
+from anypath.pathprovider.sftp import SftpPath
+from anypath.sync import MANIFEST, Manifest, atomic_write
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.td = TemporaryDirectory()
+        self.root = Path(self.td.name)
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_changed(self):
+        manifest = Manifest(self.root)
+        self.assertTrue(manifest.changed('a', 1, 10))
+        self.root.joinpath('a').write_text('a')
+        manifest.update('a', 1, 10)
+        manifest.save()
+
+        manifest = Manifest(self.root)
+        self.assertFalse(manifest.changed('a', 1, 10))
+        self.assertTrue(manifest.changed('a', 1, 11))
+        self.root.joinpath('a').unlink()
+        self.assertTrue(manifest.changed('a', 1, 10), 'Deleted local files must be transferred again')
+
+    def test_atomic_write(self):
+        target = self.root.joinpath('file')
+        target.write_text('old')
+        with self.assertRaises(IOError):
+            with atomic_write(target, 'w') as f:
+                f.write('new')
+                raise IOError('Transfer failed')
+        self.assertEqual(target.read_text(), 'old')
+        self.assertEqual([path.name for path in self.root.iterdir()], ['file'])
+
+
+class TestSftpSync(unittest.TestCase):
+
+    def setUp(self):
+        path_provider.add(SftpPath)
+        self.td = TemporaryDirectory()
+        self.persist_dir = Path(self.td.name).joinpath('persist')
+        self.paramiko = MagicMock()
+        self.paramiko.hostkeys.HostKeys().items.return_value = {'key': 'value'}
+        self.client = self.paramiko.SFTPClient.from_transport()
+        self.client.listdir_attr.side_effect = self.listdir_attr
+        self.client.open().__enter__().read.side_effect = lambda size: next(self.chunks)
+        self.client.open.reset_mock()
+        self.tree = {'/data': [('sub', S_IFDIR, 0, 0), ('a.txt', S_IFREG, 1, 100)],
+                     '/data/sub': [('b.txt', S_IFREG, 1, 100)]}
+        patcher = patch.object(SftpPath, '_check_dependencies', return_value=[self.paramiko])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def listdir_attr(self, path):
+        return [MagicMock(filename=name, st_mode=mode, st_size=size, st_mtime=mtime)
+                for name, mode, size, mtime in self.tree[path]]
+
+    def fetch(self, files, **options):
+        self.chunks = iter([b'x', b''] * files)
+        with AnyPath('sftp://user@host:/data', persist_dir=str(self.persist_dir), sync=True, channels=1,
+                     **options) as path:
+            self.assertEqual(path, self.persist_dir.resolve())
+        return [call[0][0] for call in self.client.open.call_args_list]
+
+    def test_only_changed_files_are_transferred(self):
+        self.assertEqual(sorted(self.fetch(2)), ['/data/a.txt', '/data/sub/b.txt'])
+        self.assertTrue(self.persist_dir.joinpath(MANIFEST).exists())
+        self.assertEqual(self.persist_dir.joinpath('data', 'sub', 'b.txt').read_text(), 'x')
+
+        self.client.open.reset_mock()
+        self.tree['/data'][1] = ('a.txt', S_IFREG, 1, 200)
+        self.assertEqual(self.fetch(1), ['/data/a.txt'])
+
+    def test_delete(self):
+        self.fetch(2)
+        self.tree['/data/sub'] = []
+        self.fetch(0)
+        self.assertTrue(self.persist_dir.joinpath('data', 'sub', 'b.txt').exists())
+        self.fetch(0, delete=True)
+        self.assertFalse(self.persist_dir.joinpath('data', 'sub', 'b.txt').exists())
+        self.assertEqual(list(Manifest(self.persist_dir).entries), ['data/a.txt'])
+
+    def test_requires_persist_dir(self):
+        with self.assertRaises(ValueError):
+            AnyPath('sftp://user@host:/data', sync=True)
+
+
+class TestLocalSync(unittest.TestCase):
+
+    def setUp(self):
+        path_provider.add(LocalPath)
+        self.td = TemporaryDirectory()
+        self.addCleanup(self.td.cleanup)
+        self.source = Path(self.td.name).joinpath('source')
+        self.persist_dir = Path(self.td.name).joinpath('persist')
+        self.source.joinpath('sub').mkdir(parents=True)
+        self.source.joinpath('a.txt').write_text('a')
+        self.source.joinpath('sub', 'b.txt').write_text('b')
+        os.symlink('a.txt', self.source.joinpath('link'))
+
+    def sync(self, **options):
+        fetcher = AnyPath(f'file://{self.source}', persist_dir=str(self.persist_dir), sync=True, **options)
+        with fetcher as path:
+            self.assertEqual(path, self.persist_dir.resolve())
+        return fetcher.stats['files']
+
+    def test_only_changed_files_are_copied(self):
+        self.assertEqual(self.sync(), 3)
+        self.assertEqual(self.persist_dir.joinpath('sub', 'b.txt').read_text(), 'b')
+        self.assertEqual(os.readlink(self.persist_dir.joinpath('link')), 'a.txt')
+        self.assertEqual(self.sync(), 0)
+
+        self.source.joinpath('sub', 'b.txt').write_text('changed')
+        self.assertEqual(self.sync(), 1)
+        self.assertEqual(self.persist_dir.joinpath('sub', 'b.txt').read_text(), 'changed')
+        self.assertEqual([path.name for path in self.persist_dir.joinpath('sub').iterdir()], ['b.txt'])
+
+    def test_ctime(self):
+        self.sync(ctime=True)
+        # Replaced with the same size and modification time, only the inode change time tells
+        stat = self.source.joinpath('a.txt').stat()
+        self.source.joinpath('a.txt').write_text('x')
+        os.utime(self.source.joinpath('a.txt'), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(self.sync(ctime=True), 1)
+        self.assertEqual(self.persist_dir.joinpath('a.txt').read_text(), 'x')
+
+    def test_delete(self):
+        self.sync()
+        self.source.joinpath('sub', 'b.txt').unlink()
+        self.sync(delete=True)
+        self.assertFalse(self.persist_dir.joinpath('sub', 'b.txt').exists())
+        self.assertTrue(self.source.joinpath('a.txt').exists())
+
+    def test_requires_persist_dir(self):
+        with self.assertRaises(ValueError):
+            AnyPath(f'file://{self.source}', sync=True)